@@ -20,7 +20,11 @@ def _build_error_payload(message: str, *, data: Any = None) -> dict[str, Any]:
 
 async def http_exception_handler(request: Request, exc: StarletteHTTPException) -> JSONResponse:
     payload = _build_error_payload(str(exc.detail), data={"status_code": exc.status_code})
-    return JSONResponse(status_code=exc.status_code, content=jsonable_encoder(payload))
+    return JSONResponse(
+        status_code=exc.status_code,
+        content=jsonable_encoder(payload),
+        headers=getattr(exc, "headers", None),
+    )
 
 
 async def validation_exception_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
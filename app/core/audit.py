@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import JSON, BigInteger, Index, String, insert
+from sqlalchemy.dialects.mysql import DATETIME
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.config import settings
+from app.core.database import AsyncSessionFactory, Base
+
+logger = logging.getLogger(__name__)
+
+
+class SpopEvent(Base):
+    """Log kejadian append-only untuk SPOP, permohonan SPOP, dan LSPOP (tidak pernah di-UPDATE/DELETE)."""
+
+    __tablename__ = "spop_event"
+    __table_args__ = (Index("ix_spop_event_nop_occurred", "nop", "occurred_at", "id"),)
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    nop: Mapped[str] = mapped_column(String(18), nullable=False)
+    entity: Mapped[str] = mapped_column(String(20), nullable=False)
+    entity_id: Mapped[Optional[str]] = mapped_column(String(64))
+    action: Mapped[str] = mapped_column(String(20), nullable=False)
+    actor_id: Mapped[Optional[str]] = mapped_column(String(64))
+    changes: Mapped[Optional[dict]] = mapped_column(JSON)
+    occurred_at: Mapped[datetime] = mapped_column(DATETIME(fsp=6), nullable=False)
+
+
+def nop_digits(nop: Optional[str]) -> str:
+    return "".join(ch for ch in (nop or "") if ch.isdigit())
+
+
+class AuditBuffer:
+    """Antrian kejadian di memori yang ditulis ke `spop_event` per batch.
+
+    `record()` tidak menyentuh database sehingga aman dipanggil di jalur
+    request; task latar menulis setiap `flush_interval` detik atau begitu
+    `batch_size` kejadian terkumpul. Kejadian yang belum ditulis hilang bila
+    proses mati mendadak; `stop()` menulis sisa antrian saat shutdown normal.
+
+    Antrian dibatasi `max_pending`: saat penuh kejadian baru dibuang dan
+    dihitung di `dropped`. Batch yang gagal `max_attempts` kali berturut-turut
+    ditulis baris per baris; baris yang tetap ditolak database dibuang, kecuali
+    kegagalannya di tingkat koneksi (batch disimpan untuk percobaan berikutnya).
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        flush_interval: float,
+        *,
+        max_pending: int = 10000,
+        max_attempts: int = 3,
+        session_factory: async_sessionmaker = AsyncSessionFactory,
+    ) -> None:
+        self._batch_size = max(batch_size, 1)
+        self._flush_interval = flush_interval
+        self._max_pending = max(max_pending, self._batch_size)
+        self._max_attempts = max(max_attempts, 1)
+        self._session_factory = session_factory
+        self._pending: List[Dict[str, Any]] = []
+        self._failures = 0
+        self.dropped = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def record(
+        self,
+        nop: Optional[str],
+        entity: str,
+        action: str,
+        *,
+        entity_id: Optional[str] = None,
+        actor_id: Optional[str] = None,
+        changes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        digits = nop_digits(nop)
+        if not digits:
+            return
+        if len(self._pending) >= self._max_pending:
+            if self.dropped % self._max_pending == 0:
+                logger.error("Antrian audit penuh (%s); %s kejadian dibuang", self._max_pending, self.dropped + 1)
+            self.dropped += 1
+            return
+        self._pending.append(
+            {
+                "nop": digits[:18],
+                "entity": entity,
+                "entity_id": entity_id,
+                "action": action,
+                "actor_id": actor_id,
+                "changes": jsonable_encoder(changes) if changes else None,
+                "occurred_at": datetime.now(),
+            }
+        )
+        if len(self._pending) >= self._batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            written = 0
+            while self._pending:
+                batch = self._pending[: self._batch_size]
+                try:
+                    if self._failures >= self._max_attempts:
+                        inserted = await self._insert_rows(batch)
+                    else:
+                        inserted = await self._insert_batch(batch)
+                except Exception:
+                    self._failures += 1
+                    logger.exception(
+                        "Gagal menulis %s kejadian audit (percobaan %s); dicoba lagi nanti", len(batch), self._failures
+                    )
+                    break
+                self._failures = 0
+                del self._pending[: len(batch)]
+                written += inserted
+            return written
+
+    async def _insert_batch(self, batch: List[Dict[str, Any]]) -> int:
+        async with self._session_factory() as session:
+            await session.execute(insert(SpopEvent), batch)
+            await session.commit()
+        return len(batch)
+
+    async def _insert_rows(self, batch: List[Dict[str, Any]]) -> int:
+        """Tulis per baris dalam savepoint; baris yang ditolak dibuang, galat koneksi dilempar ulang."""
+
+        rejected = 0
+        async with self._session_factory() as session:
+            for row in batch:
+                try:
+                    async with session.begin_nested():
+                        await session.execute(insert(SpopEvent), [row])
+                except (OperationalError, InterfaceError):
+                    raise
+                except Exception:
+                    logger.exception("Kejadian audit %s/%s NOP %s dibuang", row["entity"], row["action"], row["nop"])
+                    rejected += 1
+            await session.commit()
+        self.dropped += rejected
+        return len(batch) - rejected
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+audit_buffer = AuditBuffer(
+    batch_size=settings.audit_batch_size,
+    flush_interval=settings.audit_flush_interval_seconds,
+    max_pending=settings.audit_max_pending,
+    max_attempts=settings.audit_max_attempts,
+)
+
+__all__ = ["AuditBuffer", "SpopEvent", "audit_buffer", "nop_digits"]
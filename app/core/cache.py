@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class _Flight:
+    __slots__ = ("future", "stale")
+
+    def __init__(self, future: asyncio.Future) -> None:
+        self.future = future
+        self.stale = False
+
+
+class TTLCache(Generic[K, V]):
+    """Cache LRU ber-TTL di memori proses dengan penggabungan miss (single-flight).
+
+    `get_or_load()` yang miss untuk kunci yang sama secara bersamaan hanya
+    menjalankan satu `loader`; pemanggil lain menunggu hasilnya. Exception dari
+    loader diteruskan ke semua penunggu dan tidak disimpan. `invalidate()`
+    membuang entri dan menandai muatan yang sedang berjalan supaya hasilnya
+    tidak disimpan (data bisa sudah berubah sebelum muatan selesai).
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float) -> None:
+        self._maxsize = max(maxsize, 1)
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self._inflight: Dict[K, _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: K):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key: K, value: V) -> None:
+        self._entries[key] = (time.monotonic() + self._ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_or_load(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        while True:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            flight = self._inflight.get(key)
+            if flight is None:
+                self.misses += 1
+                return await self._lead(key, loader)
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(flight.future)
+            except asyncio.CancelledError:
+                # Pemuat pertama dibatalkan (bukan kita): coba lagi, mungkin jadi pemuat baru.
+                if flight.future.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+
+    async def _lead(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        flight = _Flight(asyncio.get_running_loop().create_future())
+        self._inflight[key] = flight
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            flight.future.cancel()
+            raise
+        except BaseException as exc:
+            flight.future.set_exception(exc)
+            flight.future.exception()  # ditandai sudah dibaca walau tidak ada penunggu
+            raise
+        finally:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        if not flight.stale:
+            self._store(key, value)
+        flight.future.set_result(value)
+        return value
+
+    def invalidate(self, key: K) -> None:
+        self._entries.pop(key, None)
+        flight = self._inflight.pop(key, None)
+        if flight is not None:
+            flight.stale = True
+
+    def clear(self) -> None:
+        self._entries.clear()
+        for flight in self._inflight.values():
+            flight.stale = True
+        self._inflight.clear()
+
+
+__all__ = ["TTLCache"]
@@ -58,6 +58,31 @@ class Settings(BaseSettings):
     # PBB configuration
     pbb_njoptkp: int = Field(default=0, alias="PBB_NJOPTKP")
     pbb_tarif_id: int | None = Field(default=None, alias="PBB_TARIF_ID")
+    assessment_chunk_size: int = Field(default=1000, alias="ASSESSMENT_CHUNK_SIZE")
+    assessment_workers: int = Field(default=1, alias="ASSESSMENT_WORKERS")
+
+    # Upload berkas
+    upload_max_bytes: int = Field(default=10 * 1024 * 1024, alias="UPLOAD_MAX_BYTES")
+    upload_photo_max_bytes: int = Field(default=20 * 1024 * 1024, alias="UPLOAD_PHOTO_MAX_BYTES")
+    image_workers: int = Field(default=2, alias="IMAGE_WORKERS")
+
+    # In-process caches
+    region_cache_ttl_seconds: int = Field(default=300, alias="REGION_CACHE_TTL_SECONDS")
+    form_sequence_block_size: int = Field(default=20, alias="FORM_SEQUENCE_BLOCK_SIZE")
+    search_index_ttl_seconds: int = Field(default=900, alias="SEARCH_INDEX_TTL_SECONDS")
+    search_index_max_candidates: int = Field(default=2000, alias="SEARCH_INDEX_MAX_CANDIDATES")
+    esppt_cache_size: int = Field(default=10000, alias="ESPPT_CACHE_SIZE")
+    esppt_cache_ttl_seconds: float = Field(default=60.0, alias="ESPPT_CACHE_TTL_SECONDS")
+
+    # Log kejadian (riwayat SPOP)
+    audit_batch_size: int = Field(default=200, alias="AUDIT_BATCH_SIZE")
+    audit_flush_interval_seconds: float = Field(default=1.0, alias="AUDIT_FLUSH_INTERVAL_SECONDS")
+    audit_max_pending: int = Field(default=10000, alias="AUDIT_MAX_PENDING")
+    audit_max_attempts: int = Field(default=3, alias="AUDIT_MAX_ATTEMPTS")
+
+    # Idempotency-Key untuk endpoint POST pembuat data
+    idempotency_ttl_seconds: int = Field(default=24 * 3600, alias="IDEMPOTENCY_TTL_SECONDS")
+    idempotency_wait_seconds: float = Field(default=30.0, alias="IDEMPOTENCY_WAIT_SECONDS")
 
     cors_origins: List[str] = Field(default_factory=lambda: ["*"], alias="CORS_ORIGINS")
     cors_allow_credentials: bool = Field(default=True, alias="CORS_ALLOW_CREDENTIALS")
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
 from app.core.config import settings
@@ -12,13 +12,20 @@ class Base(DeclarativeBase):
     """Declarative base for all SQLAlchemy models."""
 
 
-engine = create_async_engine(
-    settings.sqlalchemy_database_uri,
-    echo=False,
-    pool_pre_ping=True,
-    pool_recycle=1800,
-    connect_args={"init_command": f"SET time_zone = '{settings.mysql_time_zone}'"},
-)
+def create_engine(**kwargs) -> AsyncEngine:
+    """Engine dengan opsi koneksi standar aplikasi (dipakai juga oleh worker proses terpisah)."""
+
+    return create_async_engine(
+        settings.sqlalchemy_database_uri,
+        echo=False,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        connect_args={"init_command": f"SET time_zone = '{settings.mysql_time_zone}'"},
+        **kwargs,
+    )
+
+
+engine = create_engine()
 
 AsyncSessionFactory = async_sessionmaker(
     engine,
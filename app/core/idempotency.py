@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import DateTime, Integer, LargeBinary, String, delete, select, update
+from sqlalchemy.dialects.mysql import MEDIUMBLOB
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Mapped, mapped_column
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.database import AsyncSessionFactory, Base
+
+logger = logging.getLogger(__name__)
+
+HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+MIN_ANONYMOUS_KEY_LENGTH = 32
+MAX_STORED_BODY = 1024 * 1024
+PENDING_LEASE_SECONDS = 120
+LEASE_RENEW_SECONDS = 30
+POLL_INTERVAL_SECONDS = 0.2
+PURGE_INTERVAL_SECONDS = 60
+PURGE_BATCH = 500
+
+STATE_PENDING = "pending"
+STATE_DONE = "done"
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_key"
+
+    key_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    state: Mapped[str] = mapped_column(String(10), nullable=False)
+    request_hash: Mapped[Optional[str]] = mapped_column(String(64))
+    status_code: Mapped[Optional[int]] = mapped_column(Integer)
+    content_type: Mapped[Optional[str]] = mapped_column(String(100))
+    body: Mapped[Optional[bytes]] = mapped_column(LargeBinary().with_variant(MEDIUMBLOB(), "mysql"))
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+def _header(scope: Scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value
+    return None
+
+
+def _key_hash(scope: Scope, key: bytes) -> str:
+    # Ruang kunci per nilai header Authorization + endpoint. Semua pemanggil tanpa token berbagi satu
+    # ruang kunci; untuk mereka kunci wajib panjang dan respons hanya diputar ulang bila body sama.
+    digest = hashlib.sha256()
+    for part in (_header(scope, b"authorization") or b"", scope["method"].encode(), scope["path"].encode(), key):
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+async def _send_json_error(send: Send, status_code: int, detail: str) -> None:
+    body = json.dumps({"success": False, "message": detail, "data": {"status_code": status_code}}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class _BodyFingerprint:
+    """SHA-256 body permintaan, dihitung sambil body dibaca (tanpa menampung isinya).
+
+    Boundary multipart dibuang dari hash karena klien membuat boundary baru
+    setiap kali mengirim ulang form yang sama.
+    """
+
+    def __init__(self, scope: Scope) -> None:
+        media_type, _, params = (_header(scope, b"content-type") or b"").partition(b";")
+        media_type = media_type.strip().lower()
+        self._digest = hashlib.sha256(media_type + b"\0")
+        self._marker = b""
+        if media_type == b"multipart/form-data":
+            for param in params.split(b";"):
+                name, _, value = param.strip().partition(b"=")
+                if name.lower() == b"boundary" and value.strip(b'"'):
+                    self._marker = b"--" + value.strip(b'"')
+        self._tail = b""
+        self._hexdigest: Optional[str] = None
+        self.complete = False
+
+    def _update(self, message: Message) -> None:
+        chunk = message.get("body", b"")
+        if self._marker:
+            data = (self._tail + chunk).replace(self._marker, b"")
+            keep = len(self._marker) - 1
+            self._digest.update(data[:-keep])
+            self._tail = data[-keep:]
+        else:
+            self._digest.update(chunk)
+        if not message.get("more_body", False):
+            self.complete = True
+
+    def wrap(self, receive: Receive) -> Receive:
+        async def wrapped() -> Message:
+            message = await receive()
+            if message["type"] == "http.request" and not self.complete:
+                self._update(message)
+            return message
+
+        return wrapped
+
+    async def drain(self, receive: Receive) -> None:
+        """Baca sisa body yang tidak dibaca handler; berhenti bila klien terputus."""
+
+        while not self.complete:
+            message = await receive()
+            if message["type"] != "http.request":
+                return
+            self._update(message)
+
+    def hexdigest(self) -> str:
+        if self._hexdigest is None:
+            self._digest.update(self._tail)
+            self._hexdigest = self._digest.hexdigest()
+        return self._hexdigest
+
+
+class IdempotencyMiddleware:
+    """Dukungan header `Idempotency-Key` untuk endpoint POST pembuat data.
+
+    Permintaan pertama mengklaim kunci (baris `pending`, diperpanjang selama
+    handler berjalan), handler dijalankan, lalu respons (< 500) disimpan
+    terkompresi bersama hash body sampai `IDEMPOTENCY_TTL_SECONDS`.
+    Pengulangan dengan kunci dan body yang sama mendapat respons tersimpan tanpa
+    menjalankan handler; kunci yang sama dengan body berbeda ditolak 422.
+    Duplikat yang datang selagi permintaan pertama masih berjalan menunggu
+    hasilnya (maks. `IDEMPOTENCY_WAIT_SECONDS`, lalu 409). Respons 5xx atau
+    error tidak disimpan sehingga klien boleh mencoba lagi. Tanpa header
+    Authorization kunci minimal `MIN_ANONYMOUS_KEY_LENGTH` karakter.
+    """
+
+    def __init__(self, app: ASGIApp, paths: Iterable[str]) -> None:
+        self.app = app
+        self.paths = {path.rstrip("/") for path in paths}
+        self._inflight: Dict[str, asyncio.Event] = {}
+        self._last_purge = 0.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"].rstrip("/") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        raw_key = _header(scope, HEADER)
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        raw_key = raw_key.strip()
+        if not raw_key or len(raw_key) > MAX_KEY_LENGTH:
+            await _send_json_error(send, 400, "Idempotency-Key tidak valid")
+            return
+        if _header(scope, b"authorization") is None and len(raw_key) < MIN_ANONYMOUS_KEY_LENGTH:
+            await _send_json_error(
+                send, 400, f"Idempotency-Key tanpa token minimal {MIN_ANONYMOUS_KEY_LENGTH} karakter acak"
+            )
+            return
+
+        key_hash = _key_hash(scope, raw_key)
+        fingerprint = _BodyFingerprint(scope)
+        deadline = time.monotonic() + settings.idempotency_wait_seconds
+        while True:
+            if await self._claim(key_hash):
+                await self._run_and_store(key_hash, fingerprint, scope, receive, send)
+                return
+            record = await self._load(key_hash)
+            if record is None:
+                continue
+            if record.state == STATE_DONE:
+                await fingerprint.drain(receive)
+                if record.request_hash is not None and record.request_hash != fingerprint.hexdigest():
+                    await _send_json_error(
+                        send, 422, "Idempotency-Key sudah dipakai untuk isi permintaan yang berbeda"
+                    )
+                else:
+                    await self._replay(record, send)
+                return
+            if time.monotonic() >= deadline:
+                await _send_json_error(send, 409, "Permintaan dengan Idempotency-Key yang sama masih diproses")
+                return
+            await self._wait(key_hash)
+
+    async def _claim(self, key_hash: str) -> bool:
+        now = datetime.now()
+        async with AsyncSessionFactory() as session:
+            # Klaim `pending` yang kedaluwarsa (proses sebelumnya mati) atau respons yang lewat TTL boleh diambil alih.
+            await session.execute(
+                delete(IdempotencyRecord).where(
+                    IdempotencyRecord.key_hash == key_hash, IdempotencyRecord.expires_at < now
+                )
+            )
+            session.add(
+                IdempotencyRecord(
+                    key_hash=key_hash,
+                    state=STATE_PENDING,
+                    expires_at=now + timedelta(seconds=PENDING_LEASE_SECONDS),
+                )
+            )
+            try:
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                return False
+        self._inflight[key_hash] = asyncio.Event()
+        return True
+
+    async def _load(self, key_hash: str) -> Optional[IdempotencyRecord]:
+        async with AsyncSessionFactory() as session:
+            return (
+                await session.execute(select(IdempotencyRecord).where(IdempotencyRecord.key_hash == key_hash))
+            ).scalar_one_or_none()
+
+    async def _wait(self, key_hash: str) -> None:
+        event = self._inflight.get(key_hash)
+        if event is not None:
+            # Pemilik kunci ada di proses ini: tunggu langsung tanpa polling.
+            try:
+                await asyncio.wait_for(event.wait(), timeout=settings.idempotency_wait_seconds)
+            except asyncio.TimeoutError:
+                pass
+            return
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    async def _run_and_store(
+        self, key_hash: str, fingerprint: _BodyFingerprint, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        status_code = 500
+        content_type: Optional[str] = None
+        chunks: List[bytes] = []
+        size = 0
+
+        async def capture(message: Message) -> None:
+            nonlocal status_code, content_type, size
+            if message["type"] == "http.response.start":
+                # Sisa body harus dibaca sebelum respons dikirim; sesudahnya server hanya memberi disconnect.
+                await fingerprint.drain(receive)
+                status_code = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        content_type = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                size += len(body)
+                if size <= MAX_STORED_BODY:
+                    chunks.append(body)
+            await send(message)
+
+        stored = False
+        renewal = asyncio.create_task(self._keep_leased(key_hash))
+        try:
+            await self.app(scope, fingerprint.wrap(receive), capture)
+            if status_code < 500 and size <= MAX_STORED_BODY and fingerprint.complete:
+                stored = await self._store(
+                    key_hash, fingerprint.hexdigest(), status_code, content_type, b"".join(chunks)
+                )
+        finally:
+            renewal.cancel()
+            try:
+                await renewal
+            except asyncio.CancelledError:
+                pass
+            if not stored:
+                await self._release(key_hash)
+            event = self._inflight.pop(key_hash, None)
+            if event is not None:
+                event.set()
+            await self._maybe_purge()
+
+    async def _keep_leased(self, key_hash: str) -> None:
+        while True:
+            await asyncio.sleep(LEASE_RENEW_SECONDS)
+            await self._renew(key_hash)
+
+    async def _renew(self, key_hash: str) -> None:
+        try:
+            async with AsyncSessionFactory() as session:
+                await session.execute(
+                    update(IdempotencyRecord)
+                    .where(IdempotencyRecord.key_hash == key_hash, IdempotencyRecord.state == STATE_PENDING)
+                    .values(expires_at=datetime.now() + timedelta(seconds=PENDING_LEASE_SECONDS))
+                )
+                await session.commit()
+        except Exception:
+            logger.exception("Gagal memperpanjang klaim idempotency")
+
+    async def _store(
+        self, key_hash: str, request_hash: str, status_code: int, content_type: Optional[str], body: bytes
+    ) -> bool:
+        try:
+            async with AsyncSessionFactory() as session:
+                record = await session.get(IdempotencyRecord, key_hash)
+                if record is None:
+                    return False
+                record.state = STATE_DONE
+                record.request_hash = request_hash
+                record.status_code = status_code
+                record.content_type = content_type
+                record.body = zlib.compress(body)
+                record.expires_at = datetime.now() + timedelta(seconds=settings.idempotency_ttl_seconds)
+                await session.commit()
+            return True
+        except Exception:
+            logger.exception("Gagal menyimpan respons idempotency")
+            return False
+
+    async def _release(self, key_hash: str) -> None:
+        try:
+            async with AsyncSessionFactory() as session:
+                await session.execute(
+                    delete(IdempotencyRecord).where(
+                        IdempotencyRecord.key_hash == key_hash, IdempotencyRecord.state == STATE_PENDING
+                    )
+                )
+                await session.commit()
+        except Exception:
+            logger.exception("Gagal melepas klaim idempotency")
+
+    async def _replay(self, record: IdempotencyRecord, send: Send) -> None:
+        body = zlib.decompress(record.body or b"")
+        headers: List[Tuple[bytes, bytes]] = [
+            (b"content-length", str(len(body)).encode()),
+            (b"idempotent-replayed", b"true"),
+        ]
+        if record.content_type:
+            headers.append((b"content-type", record.content_type.encode("latin-1")))
+        await send({"type": "http.response.start", "status": record.status_code or 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _maybe_purge(self) -> None:
+        if time.monotonic() - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = time.monotonic()
+        try:
+            async with AsyncSessionFactory() as session:
+                await session.execute(
+                    delete(IdempotencyRecord)
+                    .where(IdempotencyRecord.expires_at < datetime.now())
+                    .execution_options(synchronize_session=False)
+                    .with_dialect_options(mysql_limit=PURGE_BATCH)
+                )
+                await session.commit()
+        except Exception:
+            logger.exception("Gagal membersihkan kunci idempotency kedaluwarsa")
+
+
+__all__ = ["IdempotencyMiddleware", "IdempotencyRecord"]
@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from typing import Any
+
+from fastapi import Response, status
+from pydantic import TypeAdapter
+
+
+def json_response(adapter: TypeAdapter, value: Any, status_code: int = status.HTTP_200_OK) -> Response:
+    """Serialisasi langsung lewat TypeAdapter yang sudah dikompilasi.
+
+    FastAPI memvalidasi ulang nilai yang dikembalikan terhadap `response_model`;
+    untuk data dari database yang dibangun dengan `model_construct` langkah itu
+    dilewati. JSON yang dihasilkan sama (mode JSON pydantic, tanpa spasi).
+    """
+
+    return Response(content=adapter.dump_json(value), status_code=status_code, media_type="application/json")
+
+
+__all__ = ["json_response"]
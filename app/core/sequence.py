@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import BigInteger, String, func, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.config import settings
+from app.core.database import AsyncSessionFactory, Base
+
+SeedFn = Callable[[AsyncSession], Awaitable[int]]
+
+
+class FormSequence(Base):
+    __tablename__ = "form_sequence"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    last_value: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class SequenceAllocator:
+    """Nomor urut berbasis tabel `form_sequence` dengan blok yang dipesan per worker.
+
+    Setiap worker memesan `block_size` nomor sekaligus lewat satu UPDATE atomik
+    (sesi terpisah, langsung commit), lalu membagikannya dari memori. Nomor sisa
+    blok hilang saat proses berhenti; urutan tetap unik, hanya bisa berlubang.
+    """
+
+    def __init__(self, block_size: int) -> None:
+        self._block_size = max(block_size, 1)
+        # slot -> (nama urutan, nomor berikutnya, akhir blok)
+        self._blocks: Dict[str, Tuple[str, int, int]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def next_value(self, name: str, seed: Optional[SeedFn] = None, *, slot: Optional[str] = None) -> int:
+        """Nomor berikutnya untuk `name`.
+
+        `slot` menampung blok di memori (default: `name`). Urutan yang bergilir
+        (mis. per hari) memakai satu slot sehingga blok lama langsung dibuang dan
+        memori tidak bertambah setiap hari.
+        """
+
+        slot = slot or name
+        lock = self._locks.setdefault(slot, asyncio.Lock())
+        async with lock:
+            owner, current, end = self._blocks.get(slot, (name, 1, 0))
+            if owner != name or current > end:
+                current, end = await self._reserve(name, self._block_size, seed)
+            self._blocks[slot] = (name, current + 1, end)
+            return current
+
+    async def _reserve(self, name: str, count: int, seed: Optional[SeedFn]) -> Tuple[int, int]:
+        stmt = (
+            update(FormSequence)
+            .where(FormSequence.name == name)
+            .values(last_value=func.last_insert_id(FormSequence.last_value + count))
+        )
+        async with AsyncSessionFactory() as session:
+            result = await session.execute(stmt)
+            if result.rowcount == 0:
+                start = await seed(session) if seed else 0
+                await session.execute(
+                    mysql_insert(FormSequence).values(name=name, last_value=start).prefix_with("IGNORE")
+                )
+                result = await session.execute(stmt)
+            end = (await session.execute(select(func.last_insert_id()))).scalar_one()
+            await session.commit()
+        return int(end) - count + 1, int(end)
+
+
+form_sequence = SequenceAllocator(block_size=settings.form_sequence_block_size)
+
+
+async def next_dated_number(name: str) -> str:
+    """Nomor formulir `YYYY.MM.DD.NNNNNN`; urutan dimulai ulang setiap hari."""
+
+    today = datetime.now().strftime("%Y.%m.%d")
+    value = await form_sequence.next_value(f"{name}:{today}", slot=name)
+    return f"{today}.{value:06d}"
+
+
+__all__ = ["FormSequence", "SequenceAllocator", "form_sequence", "next_dated_number"]
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import logging
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
@@ -7,14 +9,33 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from app.api.router import api_router
 from app.api import errors as api_errors
+from app.core.audit import audit_buffer
 from app.core.config import settings
 from app.core.database import Base, engine
+from app.core.idempotency import IdempotencyMiddleware
+from app.modules.spop.images import shutdown_executor
+from app.modules.spop.maintenance import pending_migrations
+from app.modules.spop.search_index import spop_search_index
 
 # Import models so that SQLAlchemy registers them with the shared metadata.
 from app.modules.users import models as users_models  # noqa: F401
 from app.modules.spop import models as spop_models  # noqa: F401
+from app.core import sequence as sequence_models  # noqa: F401
+from app.core import audit as audit_models  # noqa: F401
+from app.core import idempotency as idempotency_models  # noqa: F401
+from app.modules.sppt import assessment as assessment_models  # noqa: F401
+from app.modules.sppt import summary as summary_models  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="SIMPBB API", version="0.1.0")
 
+# Didaftarkan sebelum CORS supaya respons yang diputar ulang tetap melewati CORSMiddleware.
+app.add_middleware(
+    IdempotencyMiddleware,
+    paths=["/api/spop/requests", "/api/lspop", "/api/sppt/op-registration"],
+)
+
 if settings.cors_origins:
     allow_methods = settings.cors_allow_methods or ["*"]
     allow_headers = settings.cors_allow_headers or ["*"]
@@ -51,6 +72,21 @@ async def startup_event() -> None:
     # Ensure database tables declared in SQLAlchemy metadata exist.
     async with engine.begin() as connection:
         await connection.run_sync(Base.metadata.create_all)
+        pending = await pending_migrations(connection)
+    if pending:
+        logger.warning(
+            "Migrasi SPOP belum dijalankan (%s); jalankan `python -m app.modules.spop.maintenance migrate`",
+            ", ".join(pending),
+        )
+    audit_buffer.start()
+    spop_search_index.schedule_refresh()
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    await audit_buffer.stop()
+    await spop_search_index.stop()
+    shutdown_executor()
 
 
 @app.get("/health", tags=["health"])
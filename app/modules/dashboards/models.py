@@ -24,6 +24,7 @@ class Sppt(Base):
     luas_bumi_sppt: Mapped[Optional[Decimal]] = mapped_column("LUAS_BUMI_SPPT", Numeric(18, 0))
     luas_bng_sppt: Mapped[Optional[Decimal]] = mapped_column("LUAS_BNG_SPPT", Numeric(18, 0))
     pbb_terhutang_sppt: Mapped[Optional[Decimal]] = mapped_column("PBB_TERHUTANG_SPPT", Numeric(18, 2))
+    pbb_yg_harus_dibayar_sppt: Mapped[Optional[Decimal]] = mapped_column("PBB_YG_HARUS_DIBAYAR_SPPT", Numeric(18, 2))
     status_pembayaran_sppt: Mapped[Optional[str]] = mapped_column("STATUS_PEMBAYARAN_SPPT", String(1))
 
 
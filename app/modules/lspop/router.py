@@ -1,16 +1,19 @@
 from __future__ import annotations
 
 from datetime import datetime
-from decimal import Decimal, ROUND_HALF_UP
 from typing import Dict, List, Optional
 from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from pydantic import TypeAdapter
 from sqlalchemy import func, select, text
-from sqlalchemy.exc import MissingGreenlet, OperationalError
+from sqlalchemy.exc import MissingGreenlet
 
+from app.core.audit import audit_buffer
 from app.core.config import settings
 from app.core.deps import CurrentUserDep, SessionDep
+from app.core.responses import json_response
+from app.core.sequence import next_dated_number
 from app.modules.lspop import schemas
 from app.modules.lspop.models import (
     LampiranSpop,
@@ -32,9 +35,14 @@ from app.modules.lspop.models import (
     RefLetakTangkiMinyak,
 )
 from app.modules.spop.models import RefKelasBangunanNjop, RefKelasBumiNjop, SpopRegistration
+from app.modules.sppt import summary as sppt_summary
+from app.modules.sppt import valuation
+from app.modules.sppt.cache import invalidate_esppt
 
 router = APIRouter(prefix="/lspop", tags=["lspop"])
 
+LAMPIRAN_LIST_ADAPTER = TypeAdapter(schemas.LampiranListResponse)
+
 
 def _to_record(
     row: LampiranSpop,
@@ -51,9 +59,9 @@ def _to_record(
     def info(field: str, value: Optional[int]) -> Optional[schemas.StatusInfo]:
         if value is None:
             return None
-        return schemas.StatusInfo(id=value, nama=lookups.get(field, {}).get(value, ""))
+        return schemas.StatusInfo.model_construct(id=value, nama=lookups.get(field, {}).get(value, ""))
 
-    return schemas.LampiranRecord(
+    return schemas.LampiranRecord.model_construct(
         id=row.id,
         submitted_at=row.submitted_at,
         data_spop=spop_data,
@@ -243,12 +251,6 @@ def _normalize_nop_digits(raw_nop: Optional[str]) -> str:
     return digits
 
 
-def _normalize_label(text: str) -> str:
-    # Buang digit dan whitespace, lowercase, untuk mencocokkan "1 Kabupaten Badung" == "Kabupaten Badung"
-    clean = "".join(ch for ch in (text or "") if not ch.isdigit())
-    return clean.strip().lower()
-
-
 async def _njop_value(session: SessionDep, model, class_id: Optional[int]) -> int:
     if class_id is None:
         return 0
@@ -258,82 +260,6 @@ async def _njop_value(session: SessionDep, model, class_id: Optional[int]) -> in
     return _safe_int(getattr(row, "njop", 0))
 
 
-async def _pick_pbb_tarif(session: SessionDep, spop_row: SpopRegistration) -> tuple[int, Decimal]:
-    """
-    Pilih tarif PBB dari tabel pbb_p2:
-    1) Jika PBB_TARIF_ID di env, wajib ada baris itu.
-    2) Jika tidak, pakai nama kabupaten (kabupaten_kota.nama_kabupaten) yang dicocokkan dengan pbb_p2.daerah (tanpa angka, case-insensitive).
-    Kolom yang dipakai: pbb_persen (angka desimal, misal 0.2).
-    """
-    # 1. Env override
-    if settings.pbb_tarif_id is not None:
-        result = await session.execute(
-            text("SELECT id, pbb_persen FROM pbb_p2 WHERE id = :id LIMIT 1"),
-            {"id": settings.pbb_tarif_id},
-        )
-        row = result.first()
-        if row is None:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Tarif PBB_TARIF_ID tidak ditemukan di pbb_p2",
-            )
-        return _safe_int(row[0]), Decimal(row[1] or 0)
-
-    # 2. Berdasarkan nama kabupaten
-    kab_id = _safe_int(spop_row.kabupaten_op)
-    if kab_id <= 0:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="kabupaten_op tidak valid untuk menentukan tarif PBB",
-        )
-
-    # Ambil nama kabupaten lalu cocokan dengan pbb_p2.daerah (normalisasi nama buang angka)
-    try:
-        kab_row = await session.execute(
-            text("SELECT nama_kabupaten FROM kabupaten_kota WHERE id_kabupaten = :id LIMIT 1"),
-            {"id": kab_id},
-        )
-        kab_name_row = kab_row.first()
-        kab_name = _normalize_label(kab_name_row[0]) if kab_name_row and kab_name_row[0] else ""
-    except OperationalError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Kolom/struktur kabupaten_kota tidak sesuai: {exc}",
-        ) from exc
-
-    if not kab_name:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Nama kabupaten tidak ditemukan untuk menentukan tarif PBB",
-        )
-
-    try:
-        pbb_rows = await session.execute(text("SELECT id, daerah, pbb_persen FROM pbb_p2"))
-    except OperationalError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Kolom/struktur pbb_p2 tidak sesuai: {exc}",
-        ) from exc
-
-    match_id: Optional[int] = None
-    match_rate = Decimal(0)
-    for r in pbb_rows:
-        daerah_norm = _normalize_label(r.daerah)
-        if daerah_norm == kab_name:
-            match_id = _safe_int(r.id)
-            match_rate = Decimal(r.pbb_persen or 0)
-            break
-
-    if match_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Tarif PBB untuk kabupaten_op tidak ditemukan di pbb_p2 (cocokkan nama daerah)",
-        )
-
-    return match_id, match_rate
-
-
-# Create SPPT automatically only when related SPOP is approved.
 async def _create_sppt_for_lspop(
     session: SessionDep,
     lspop: LampiranSpop,
@@ -360,15 +286,9 @@ async def _create_sppt_for_lspop(
 
     bumi_njop = _safe_int(spop_row.luas_tanah) * bumi_rate
     bangunan_njop = _safe_int(lspop.luas_bangunan_m2) * bangunan_rate
-    total_njop = bumi_njop + bangunan_njop
 
     njoptkp = _safe_int(settings.pbb_njoptkp)
-    tarif_id, tarif_decimal = await _pick_pbb_tarif(session, spop_row)
-
-    dasar_pengenaan = Decimal(total_njop) - Decimal(njoptkp)
-    if dasar_pengenaan < 0:
-        dasar_pengenaan = Decimal(0)
-    pbb_terhutang = int((dasar_pengenaan * tarif_decimal).quantize(Decimal("1."), rounding=ROUND_HALF_UP))
+    tarif_id, _ = await valuation.pick_pbb_tarif(session, spop_row.kabupaten_op)
 
     now = datetime.utcnow()
 
@@ -377,9 +297,9 @@ async def _create_sppt_for_lspop(
         text(
             """
             INSERT INTO sppt (
-                id, spop_id, lspop_id, nop, bumi_njop, bangunan_njop, njoptkp, pbb_persen, create_at
+                id, spop_id, lspop_id, nop, bumi_njop, bangunan_njop, njoptkp, pbb_persen, THN_PAJAK_SPPT, create_at
             ) VALUES (
-                :id, :spop_id, :lspop_id, :nop, :bumi_njop, :bangunan_njop, :njoptkp, :pbb_persen, :create_at
+                :id, :spop_id, :lspop_id, :nop, :bumi_njop, :bangunan_njop, :njoptkp, :pbb_persen, :tahun, :create_at
             )
             """
         ),
@@ -392,10 +312,13 @@ async def _create_sppt_for_lspop(
             "bangunan_njop": bangunan_njop,
             "njoptkp": njoptkp,
             "pbb_persen": tarif_id,
+            "tahun": f"{now.year:04d}",
             "create_at": now,
         },
     )
+    await sppt_summary.refresh(session, [nop_digits])
     await session.commit()
+    invalidate_esppt(nop_digits)
 
     return schemas.SpptAutoRecord(
         id=sppt_id,
@@ -424,10 +347,11 @@ async def create_lspop(
             value = value.strip()
         setattr(entity, key, value)
     entity.spop_id = spop_row.id
-    entity.no_formulir = datetime.now().strftime("%Y.%m.%d.%H.%M")
+    entity.no_formulir = await next_dated_number("lampiran_spop")
 
     session.add(entity)
     await session.commit()
+    audit_buffer.record(entity.nop, "lspop", "create", entity_id=entity.id, actor_id=current_user.id, changes=data)
     await session.refresh(entity)
 
     sppt_record: Optional[schemas.SpptAutoRecord] = await _create_sppt_for_lspop(session, entity, spop_row)
@@ -452,7 +376,7 @@ async def list_lspop(
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
     nop: Optional[str] = Query(None, max_length=50),
-) -> schemas.LampiranListResponse:
+) -> Response:
     stmt = select(LampiranSpop).order_by(LampiranSpop.submitted_at.desc())
     count_stmt = select(func.count()).select_from(LampiranSpop)
 
@@ -478,7 +402,10 @@ async def list_lspop(
         has_next=page < pages if pages else False,
         has_prev=page > 1,
     )
-    return schemas.LampiranListResponse(message="Daftar lampiran SPOP berhasil diambil", data=data, meta=meta)
+    response = schemas.LampiranListResponse.model_construct(
+        success=True, message="Daftar lampiran SPOP berhasil diambil", data=data, meta=meta
+    )
+    return json_response(LAMPIRAN_LIST_ADAPTER, response)
 
 
 @router.get("/{lampiran_id}", response_model=schemas.LampiranResponse)
@@ -512,12 +439,15 @@ async def update_lspop(
 
     payload = await _load_payload(request, schemas.LampiranUpdatePayload)
     updates = payload.model_dump(exclude_unset=True, exclude_none=True)
+    previous_nop = entity.nop
     for key, value in updates.items():
         if isinstance(value, str):
             value = value.strip()
         setattr(entity, key, value)
 
+    await sppt_summary.refresh(session, [previous_nop, entity.nop])
     await session.commit()
+    audit_buffer.record(entity.nop, "lspop", "update", entity_id=entity.id, actor_id=current_user.id, changes=updates)
     await session.refresh(entity)
     lookups = await _build_lookups(session, [entity])
     spop_map = await _build_spop_map(session, [entity])
@@ -536,8 +466,11 @@ async def delete_lspop(
     if entity is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lampiran tidak ditemukan")
 
+    nop = entity.nop
     await session.delete(entity)
+    await sppt_summary.refresh(session, [nop])
     await session.commit()
+    audit_buffer.record(nop, "lspop", "delete", entity_id=lampiran_id, actor_id=current_user.id)
     return schemas.LampiranDeleteResponse(message="Lampiran SPOP berhasil dihapus")
 
 
@@ -575,7 +508,11 @@ async def update_lspop_staff(
                 applied_changes = True
 
     if applied_changes:
+        await sppt_summary.refresh(session, [entity.nop])
         await session.commit()
+        audit_buffer.record(
+            entity.nop, "lspop", "staff_update", entity_id=entity.id, actor_id=current_user.id, changes=updates
+        )
         await session.refresh(entity)
     lookups = await _build_lookups(session, [entity])
     spop_map = await _build_spop_map(session, [entity])
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.modules.spop.models import (
+    RefDati2,
+    RefKabupaten,
+    RefKecamatan,
+    RefKecamatanBaru,
+    RefKelurahan,
+    RefKelurahanBaru,
+    RefPropinsi,
+    RefProvinsi,
+)
+
+
+class RegionEntry(NamedTuple):
+    id: int
+    kode_raw: str
+    kode_pad: str
+    nama: str
+    id_provinsi: Optional[int] = None
+    id_kabupaten: Optional[int] = None
+    id_kecamatan: Optional[int] = None
+
+    def as_code(self) -> Dict[str, object]:
+        return {"id": self.id, "kode_raw": self.kode_raw, "kode_pad": self.kode_pad, "nama": self.nama}
+
+
+LEVELS = ("provinsi", "kabupaten", "kecamatan", "kelurahan")
+
+
+def _code_key(*parts: Optional[str]) -> Tuple[str, ...]:
+    # MySQL membandingkan CHAR/VARCHAR tanpa spasi di ujung, samakan perilakunya.
+    return tuple((part or "").rstrip() for part in parts)
+
+
+class RegionCache:
+    """Indeks wilayah (provinsi s/d kelurahan) yang dimuat sekali per proses.
+
+    Memuat tabel wilayah berbasis id (`provinsi`, `kabupaten_kota`, `kecamatan`,
+    `kelurahan_desa`) beserta tabel referensi lama berbasis kode (`ref_*`).
+    Endpoint `/refs` memanggil `invalidate()` setelah menulis sehingga pemanggilan
+    berikutnya memuat ulang data; TTL membatasi data basi di worker lain.
+    """
+
+    def __init__(self, ttl_seconds: int) -> None:
+        self._ttl = ttl_seconds
+        self._lock = asyncio.Lock()
+        self._generation = 0
+        self._loaded_generation = -1
+        self._loaded_at = 0.0
+        self._by_id: Dict[str, Dict[int, RegionEntry]] = {level: {} for level in LEVELS}
+        self._legacy_names: Dict[Tuple[str, ...], str] = {}
+
+    def _is_fresh(self) -> bool:
+        if self._loaded_generation != self._generation:
+            return False
+        return self._ttl <= 0 or (time.monotonic() - self._loaded_at) < self._ttl
+
+    def invalidate(self) -> None:
+        self._generation += 1
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if self._is_fresh():
+                return
+            generation = self._generation
+            by_id, legacy = await self._load(session)
+            self._by_id = by_id
+            self._legacy_names = legacy
+            self._loaded_generation = generation
+            self._loaded_at = time.monotonic()
+
+    async def _load(
+        self, session: AsyncSession
+    ) -> Tuple[Dict[str, Dict[int, RegionEntry]], Dict[Tuple[str, ...], str]]:
+        by_id: Dict[str, Dict[int, RegionEntry]] = {level: {} for level in LEVELS}
+
+        rows = await session.execute(
+            select(RefProvinsi.id_provinsi, RefProvinsi.kode_provinsi, RefProvinsi.nama_provinsi)
+        )
+        for row in rows:
+            by_id["provinsi"][row.id_provinsi] = RegionEntry(
+                id=row.id_provinsi,
+                kode_raw=str(row.kode_provinsi),
+                kode_pad=f"{row.kode_provinsi:02d}",
+                nama=row.nama_provinsi,
+            )
+
+        rows = await session.execute(
+            select(
+                RefKabupaten.id_kabupaten,
+                RefKabupaten.id_provinsi,
+                RefKabupaten.kode_kabupaten,
+                RefKabupaten.nama_kabupaten,
+            )
+        )
+        for row in rows:
+            by_id["kabupaten"][row.id_kabupaten] = RegionEntry(
+                id=row.id_kabupaten,
+                kode_raw=str(row.kode_kabupaten),
+                kode_pad=f"{row.kode_kabupaten:02d}",
+                nama=row.nama_kabupaten,
+                id_provinsi=row.id_provinsi,
+            )
+
+        rows = await session.execute(
+            select(
+                RefKecamatanBaru.id_kecamatan,
+                RefKecamatanBaru.id_provinsi,
+                RefKecamatanBaru.id_kabupaten,
+                RefKecamatanBaru.kode_kecamatan,
+                RefKecamatanBaru.nama_kecamatan,
+            )
+        )
+        for row in rows:
+            by_id["kecamatan"][row.id_kecamatan] = RegionEntry(
+                id=row.id_kecamatan,
+                kode_raw=str(row.kode_kecamatan),
+                kode_pad=f"{row.kode_kecamatan:03d}",
+                nama=row.nama_kecamatan,
+                id_provinsi=row.id_provinsi,
+                id_kabupaten=row.id_kabupaten,
+            )
+
+        rows = await session.execute(
+            select(
+                RefKelurahanBaru.id_kelurahan,
+                RefKelurahanBaru.id_provinsi,
+                RefKelurahanBaru.id_kabupaten,
+                RefKelurahanBaru.id_kecamatan,
+                RefKelurahanBaru.kode_kelurahan,
+                RefKelurahanBaru.nama_kelurahan,
+            )
+        )
+        for row in rows:
+            by_id["kelurahan"][row.id_kelurahan] = RegionEntry(
+                id=row.id_kelurahan,
+                kode_raw=str(row.kode_kelurahan),
+                kode_pad=f"{row.kode_kelurahan:03d}",
+                nama=row.nama_kelurahan,
+                id_provinsi=row.id_provinsi,
+                id_kabupaten=row.id_kabupaten,
+                id_kecamatan=row.id_kecamatan,
+            )
+
+        legacy: Dict[Tuple[str, ...], str] = {}
+        rows = await session.execute(select(RefPropinsi.kd_propinsi, RefPropinsi.nm_propinsi))
+        for row in rows:
+            legacy[_code_key(row.kd_propinsi)] = row.nm_propinsi
+        rows = await session.execute(select(RefDati2.kd_propinsi, RefDati2.kd_dati2, RefDati2.nm_dati2))
+        for row in rows:
+            legacy[_code_key(row.kd_propinsi, row.kd_dati2)] = row.nm_dati2
+        rows = await session.execute(
+            select(RefKecamatan.kd_propinsi, RefKecamatan.kd_dati2, RefKecamatan.kd_kecamatan, RefKecamatan.nm_kecamatan)
+        )
+        for row in rows:
+            legacy[_code_key(row.kd_propinsi, row.kd_dati2, row.kd_kecamatan)] = row.nm_kecamatan
+        rows = await session.execute(
+            select(
+                RefKelurahan.kd_propinsi,
+                RefKelurahan.kd_dati2,
+                RefKelurahan.kd_kecamatan,
+                RefKelurahan.kd_kelurahan,
+                RefKelurahan.nm_kelurahan,
+            )
+        )
+        for row in rows:
+            legacy[_code_key(row.kd_propinsi, row.kd_dati2, row.kd_kecamatan, row.kd_kelurahan)] = row.nm_kelurahan
+
+        return by_id, legacy
+
+    def get(self, level: str, region_id: Optional[int]) -> Optional[RegionEntry]:
+        if region_id is None:
+            return None
+        return self._by_id[level].get(region_id)
+
+    def code(self, level: str, region_id: Optional[int]) -> Dict[str, object]:
+        """Bentuk dict `{id, kode_raw, kode_pad, nama}` yang dipakai builder SPOP."""
+
+        entry = self.get(level, region_id)
+        if entry is None:
+            return {"id": region_id, "kode_raw": "", "kode_pad": "", "nama": ""}
+        return entry.as_code()
+
+    def legacy_names(
+        self,
+        kd_propinsi: Optional[str],
+        kd_dati2: Optional[str],
+        kd_kecamatan: Optional[str],
+        kd_kelurahan: Optional[str],
+    ) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]:
+        """Nama wilayah dari tabel `ref_*` untuk kode NOP (setara join SUBSTR lama)."""
+
+        prop = (kd_propinsi or "")[:2]
+        dati2 = (kd_dati2 or "")[:2]
+        kec = (kd_kecamatan or "")[:3]
+        kel = (kd_kelurahan or "")[:3]
+        return (
+            self._legacy_names.get(_code_key(prop)),
+            self._legacy_names.get(_code_key(prop, dati2)),
+            self._legacy_names.get(_code_key(prop, dati2, kec)),
+            self._legacy_names.get(_code_key(prop, dati2, kec, kel)),
+        )
+
+
+region_cache = RegionCache(ttl_seconds=settings.region_cache_ttl_seconds)
+
+__all__ = ["LEVELS", "RegionCache", "RegionEntry", "region_cache"]
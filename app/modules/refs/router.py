@@ -5,6 +5,7 @@ from sqlalchemy import select, func
 
 from app.core.deps import SessionDep, CurrentUserDep
 from app.modules.refs import schemas
+from app.modules.refs.cache import region_cache
 from app.modules.spop.models import (
     RefProvinsi,
     RefKabupaten,
@@ -46,6 +47,7 @@ async def create_provinsi(
     record = RefProvinsi(kode_provinsi=payload.kode_provinsi, nama_provinsi=payload.nama_provinsi)
     session.add(record)
     await session.commit()
+    region_cache.invalidate()
     await session.refresh(record)
     data = schemas.ProvinsiOut.model_validate(record)
     return schemas.ProvinsiDetailResponse(message="Provinsi berhasil dibuat", data=data)
@@ -67,6 +69,7 @@ async def update_provinsi(
     for key, value in updates.items():
         setattr(record, key, value)
     await session.commit()
+    region_cache.invalidate()
     await session.refresh(record)
     data = schemas.ProvinsiOut.model_validate(record)
     return schemas.ProvinsiDetailResponse(message="Provinsi berhasil diperbarui", data=data)
@@ -77,6 +80,7 @@ async def delete_provinsi(prov_id: int, session: SessionDep, current_user: Curre
     record = await _get_or_404(session, RefProvinsi, prov_id, "Provinsi tidak ditemukan")
     await session.delete(record)
     await session.commit()
+    region_cache.invalidate()
     return schemas.BaseResponse(message="Provinsi berhasil dihapus")
 
 
@@ -108,6 +112,7 @@ async def create_kabupaten(
     )
     session.add(record)
     await session.commit()
+    region_cache.invalidate()
     await session.refresh(record)
     data = schemas.KabupatenOut.model_validate(record)
     return schemas.KabupatenDetailResponse(message="Kabupaten/kota berhasil dibuat", data=data)
@@ -131,6 +136,7 @@ async def update_kabupaten(
     for key, value in updates.items():
         setattr(record, key, value)
     await session.commit()
+    region_cache.invalidate()
     await session.refresh(record)
     data = schemas.KabupatenOut.model_validate(record)
     return schemas.KabupatenDetailResponse(message="Kabupaten/kota berhasil diperbarui", data=data)
@@ -143,6 +149,7 @@ async def delete_kabupaten(
     record = await _get_or_404(session, RefKabupaten, kab_id, "Kabupaten/kota tidak ditemukan")
     await session.delete(record)
     await session.commit()
+    region_cache.invalidate()
     return schemas.BaseResponse(message="Kabupaten/kota berhasil dihapus")
 
 
@@ -175,6 +182,7 @@ async def create_kecamatan(
     )
     session.add(record)
     await session.commit()
+    region_cache.invalidate()
     await session.refresh(record)
     data = schemas.KecamatanOut.model_validate(record)
     return schemas.KecamatanDetailResponse(message="Kecamatan berhasil dibuat", data=data)
@@ -198,6 +206,7 @@ async def update_kecamatan(
     for key, value in updates.items():
         setattr(record, key, value)
     await session.commit()
+    region_cache.invalidate()
     await session.refresh(record)
     data = schemas.KecamatanOut.model_validate(record)
     return schemas.KecamatanDetailResponse(message="Kecamatan berhasil diperbarui", data=data)
@@ -210,6 +219,7 @@ async def delete_kecamatan(
     record = await _get_or_404(session, RefKecamatanBaru, kec_id, "Kecamatan tidak ditemukan")
     await session.delete(record)
     await session.commit()
+    region_cache.invalidate()
     return schemas.BaseResponse(message="Kecamatan berhasil dihapus")
 
 
@@ -243,6 +253,7 @@ async def create_kelurahan(
     )
     session.add(record)
     await session.commit()
+    region_cache.invalidate()
     await session.refresh(record)
     data = schemas.KelurahanOut.model_validate(record)
     return schemas.KelurahanDetailResponse(message="Kelurahan/desa berhasil dibuat", data=data)
@@ -266,6 +277,7 @@ async def update_kelurahan(
     for key, value in updates.items():
         setattr(record, key, value)
     await session.commit()
+    region_cache.invalidate()
     await session.refresh(record)
     data = schemas.KelurahanOut.model_validate(record)
     return schemas.KelurahanDetailResponse(message="Kelurahan/desa berhasil diperbarui", data=data)
@@ -278,6 +290,7 @@ async def delete_kelurahan(
     record = await _get_or_404(session, RefKelurahanBaru, kel_id, "Kelurahan/desa tidak ditemukan")
     await session.delete(record)
     await session.commit()
+    region_cache.invalidate()
     return schemas.BaseResponse(message="Kelurahan/desa berhasil dihapus")
 
 
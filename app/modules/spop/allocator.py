@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+from typing import Iterable, List, NamedTuple, Optional, Set
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.modules.spop.models import NopCounter, Spop, SpopRegistration
+
+MAX_NO_URUT = 9999
+BITMAP_BYTES = (MAX_NO_URUT + 8) // 8
+
+
+class BlokKey(NamedTuple):
+    kd_propinsi: str
+    kd_dati2: str
+    kd_kecamatan: str
+    kd_kelurahan: str
+    kd_blok: str
+
+    def nop_prefix(self) -> str:
+        # Format kolom spop_registration.nop: PP.DD.KKK.LLL.BBB.UUUU.J
+        return ".".join(self) + "."
+
+
+def _as_int(value: Optional[object]) -> Optional[int]:
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_bitmap(data: Optional[bytes]) -> int:
+    return int.from_bytes(data or b"", "little")
+
+
+def _from_bitmap(used: int) -> bytes:
+    return used.to_bytes(BITMAP_BYTES, "little")
+
+
+def _lowest_free(used: int, start: int = 1) -> int:
+    """Bit kosong terendah >= start; bit 0 tidak dipakai (no urut mulai dari 1)."""
+
+    probe = used | ((1 << start) - 1)
+    return ((~probe) & (probe + 1)).bit_length() - 1
+
+
+def _counter_filter(key: BlokKey):
+    return and_(
+        NopCounter.kd_propinsi == key.kd_propinsi,
+        NopCounter.kd_dati2 == key.kd_dati2,
+        NopCounter.kd_kecamatan == key.kd_kecamatan,
+        NopCounter.kd_kelurahan == key.kd_kelurahan,
+        NopCounter.kd_blok == key.kd_blok,
+    )
+
+
+async def _seed_counter(session: AsyncSession, key: BlokKey) -> None:
+    """Bangun bitmap awal dari SPOP & permohonan yang sudah ada di blok ini.
+
+    Hanya dijalankan sekali per blok (saat baris counter belum ada) dan memakai
+    prefix primary key `spop` serta index `spop_registration.nop`.
+    """
+
+    used = 0
+    rows = await session.execute(
+        select(Spop.no_urut).where(
+            Spop.kd_propinsi == key.kd_propinsi,
+            Spop.kd_dati2 == key.kd_dati2,
+            Spop.kd_kecamatan == key.kd_kecamatan,
+            Spop.kd_kelurahan == key.kd_kelurahan,
+            Spop.kd_blok == key.kd_blok,
+        )
+    )
+    for row in rows:
+        number = _as_int(row.no_urut)
+        if number and 0 < number <= MAX_NO_URUT:
+            used |= 1 << number
+
+    rows = await session.execute(
+        select(SpopRegistration.no_urut_op).where(
+            SpopRegistration.nop.like(f"{key.nop_prefix()}%")
+        )
+    )
+    for row in rows:
+        number = _as_int(row.no_urut_op)
+        if number and 0 < number <= MAX_NO_URUT:
+            used |= 1 << number
+
+    stmt = mysql_insert(NopCounter).values(
+        **key._asdict(),
+        last_no_urut=max(used.bit_length() - 1, 0),
+        used_bitmap=_from_bitmap(used),
+    )
+    # Worker lain bisa saja membuat baris yang sama lebih dulu; cukup abaikan.
+    await session.execute(stmt.prefix_with("IGNORE"))
+
+
+async def _lock_counter(session: AsyncSession, key: BlokKey) -> NopCounter:
+    """Kunci baris counter blok (FOR UPDATE) sampai transaksi pemanggil selesai."""
+
+    stmt = (
+        select(NopCounter)
+        .where(_counter_filter(key))
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    counter = (await session.execute(stmt)).scalar_one_or_none()
+    if counter is None:
+        await _seed_counter(session, key)
+        counter = (await session.execute(stmt)).scalar_one()
+    return counter
+
+
+def _take(counter: NopCounter, count: int, reuse_gaps: bool) -> List[int]:
+    used = _to_bitmap(counter.used_bitmap)
+    start = 1 if reuse_gaps else counter.last_no_urut + 1
+    numbers: List[int] = []
+    while len(numbers) < count:
+        number = _lowest_free(used, start)
+        if number > MAX_NO_URUT:
+            if reuse_gaps or start == 1:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="No urut pada blok ini sudah habis")
+            # Ruang di atas nomor terakhir habis, lanjut mengisi celah.
+            start = 1
+            continue
+        used |= 1 << number
+        numbers.append(number)
+        start = number + 1
+    counter.used_bitmap = _from_bitmap(used)
+    counter.last_no_urut = max(counter.last_no_urut, *numbers)
+    return numbers
+
+
+async def allocate_no_urut(session: AsyncSession, key: BlokKey, reuse_gaps: bool = True) -> str:
+    """Ambil satu no urut bebas pada blok; nomor yang sudah dilepas dipakai ulang lebih dulu."""
+
+    counter = await _lock_counter(session, key)
+    return f"{_take(counter, 1, reuse_gaps)[0]:04d}"
+
+
+async def reserve_no_urut_block(session: AsyncSession, key: BlokKey, count: int) -> List[str]:
+    """Pesan `count` no urut sekaligus (untuk impor massal), berurutan setelah nomor terakhir."""
+
+    if count <= 0:
+        return []
+    counter = await _lock_counter(session, key)
+    return [f"{number:04d}" for number in _take(counter, count, reuse_gaps=False)]
+
+
+async def claim_no_urut(session: AsyncSession, key: BlokKey, no_urut: str) -> bool:
+    """Tandai no urut yang diisi manual sebagai terpakai agar tidak dibagikan lagi.
+
+    True bila bit baru ditandai oleh panggilan ini (bisa dibatalkan lewat `release_reserved`).
+    """
+
+    number = _as_int(no_urut)
+    if not number or number > MAX_NO_URUT:
+        return False
+    counter = await _lock_counter(session, key)
+    used = _to_bitmap(counter.used_bitmap)
+    if used >> number & 1:
+        return False
+    counter.used_bitmap = _from_bitmap(used | (1 << number))
+    counter.last_no_urut = max(counter.last_no_urut, number)
+    return True
+
+
+async def _numbers_in_use(session: AsyncSession, key: BlokKey, numbers: Iterable[int]) -> Set[int]:
+    padded = sorted({f"{number:04d}" for number in numbers})
+    if not padded:
+        return set()
+    rows = await session.execute(
+        select(Spop.no_urut).where(
+            Spop.kd_propinsi == key.kd_propinsi,
+            Spop.kd_dati2 == key.kd_dati2,
+            Spop.kd_kecamatan == key.kd_kecamatan,
+            Spop.kd_kelurahan == key.kd_kelurahan,
+            Spop.kd_blok == key.kd_blok,
+            Spop.no_urut.in_(padded),
+        )
+    )
+    in_use = {_as_int(value) for value in rows.scalars()}
+    rows = await session.execute(
+        select(SpopRegistration.no_urut_op).where(
+            or_(*(SpopRegistration.nop.like(f"{key.nop_prefix()}{value}.%") for value in padded))
+        )
+    )
+    in_use.update(_as_int(value) for value in rows.scalars())
+    return {number for number in in_use if number}
+
+
+async def release_no_urut(session: AsyncSession, key: BlokKey, no_urut: str) -> None:
+    """Lepas no urut setelah data dihapus, kecuali masih dipakai SPOP/permohonan lain."""
+
+    number = _as_int(no_urut)
+    if not number or number > MAX_NO_URUT:
+        return
+    counter = await _lock_counter(session, key)
+    if await _numbers_in_use(session, key, [number]):
+        return
+    used = _to_bitmap(counter.used_bitmap)
+    counter.used_bitmap = _from_bitmap(used & ~(1 << number))
+
+
+async def release_reserved(session: AsyncSession, key: BlokKey, no_urut: Iterable[str]) -> None:
+    """Batalkan no urut yang dipesan transaksi ini tetapi barisnya gagal disimpan.
+
+    No urut yang ternyata dipakai SPOP/permohonan lain tetap ditandai. Bila
+    nomor teratas ikut dibatalkan, penanda nomor terakhir turun ke bit terpakai
+    tertinggi supaya pemesanan berikutnya tidak melompat.
+    """
+
+    numbers = {number for number in map(_as_int, no_urut) if number and number <= MAX_NO_URUT}
+    if not numbers:
+        return
+    counter = await _lock_counter(session, key)
+    numbers -= await _numbers_in_use(session, key, numbers)
+    if not numbers:
+        return
+    used = _to_bitmap(counter.used_bitmap)
+    for number in numbers:
+        used &= ~(1 << number)
+    counter.used_bitmap = _from_bitmap(used)
+    if counter.last_no_urut in numbers:
+        counter.last_no_urut = max(used.bit_length() - 1, 0)
+
+
+__all__ = [
+    "BlokKey",
+    "MAX_NO_URUT",
+    "allocate_no_urut",
+    "claim_no_urut",
+    "release_no_urut",
+    "release_reserved",
+    "reserve_no_urut_block",
+]
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import HTTPException, Request, status
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.modules.spop.storage import confine_upload
+
+CHUNK_SIZE = 256 * 1024
+
+_SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileRangeResponse(Response):
+    """Kirim sebagian/seluruh berkas; pakai ekstensi ASGI zerocopy (sendfile) bila server mendukung."""
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        start: int,
+        end: int,
+        status_code: int,
+        headers: dict,
+        media_type: Optional[str],
+        send_body: bool = True,
+    ) -> None:
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.send_body = send_body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1
+        if not self.send_body or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopy" in scope.get("extensions", {}):
+            handle = await anyio.to_thread.run_sync(open, self.path, "rb")
+            try:
+                await send(
+                    {
+                        "type": "http.response.zerocopy",
+                        "file": handle,
+                        "offset": self.start,
+                        "count": count,
+                        "more_body": False,
+                    }
+                )
+            finally:
+                await anyio.to_thread.run_sync(handle.close)
+            return
+
+        async with await anyio.open_file(self.path, "rb") as handle:
+            await handle.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await handle.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def resolve_upload(relative: Optional[str]) -> Path:
+    """Path absolut di bawah UPLOAD_BASE; tolak path kosong atau yang keluar dari direktori upload."""
+
+    target = confine_upload(relative)
+    if target is None or not target.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Berkas tidak ditemukan")
+    return target
+
+
+def _etag_and_cache(path: Path, stat: os.stat_result) -> Tuple[str, str]:
+    if _SHA256_NAME.match(path.stem):
+        # Nama berkas content-addressed = hash isinya, jadi tidak pernah berubah.
+        return f'"{path.stem}"', "private, max-age=31536000, immutable"
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"', "private, max-age=3600"
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Satu rentang `bytes=a-b`; multi-range diabaikan (dikirim utuh)."""
+
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="Rentang tidak valid",
+                headers={"Content-Range": f"bytes */{size}"},
+            )
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Rentang tidak valid",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    candidates = [item.strip() for item in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def build_file_response(request: Request, path: Path, download_name: Optional[str] = None) -> Response:
+    stat = path.stat()
+    size = stat.st_size
+    etag, cache_control = _etag_and_cache(path, stat)
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(download_name or path.name)}",
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={k: headers[k] for k in ("ETag", "Cache-Control")})
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and size > 0 and (if_range is None or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, size)
+
+    send_body = request.method != "HEAD"
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return FileRangeResponse(
+            path, start=0, end=size - 1, status_code=status.HTTP_200_OK, headers=headers, media_type=media_type, send_body=send_body
+        )
+
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return FileRangeResponse(
+        path,
+        start=start,
+        end=end,
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers,
+        media_type=media_type,
+        send_body=send_body,
+    )
+
+
+__all__ = ["FileRangeResponse", "build_file_response", "resolve_upload"]
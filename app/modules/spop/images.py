@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.modules.spop.storage import confine_upload
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = ("file_foto_objek", "foto_objek_pajak")
+IMAGE_SUFFIXES = frozenset({".jpg", ".jpeg", ".png", ".webp", ".heic", ".bmp", ".tif", ".tiff"})
+
+# variant -> (sisi terpanjang, kualitas JPEG)
+VARIANTS: Dict[str, tuple[int, int]] = {
+    "review": (1600, 82),
+    "thumb": (320, 75),
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def variant_path(relative: Optional[str], variant: str) -> Optional[str]:
+    """Path relatif rendition (`<nama>.<variant>.jpg`) di sebelah berkas asli, tanpa akses disk.
+
+    Path absolut atau yang mengandung `..` tidak punya rendition.
+    """
+
+    if not relative or variant not in VARIANTS:
+        return None
+    original = Path(relative.strip())
+    if original.is_absolute() or ".." in original.parts:
+        return None
+    if original.suffix.lower() not in IMAGE_SUFFIXES:
+        return None
+    return str(original.with_name(f"{original.stem}.{variant}.jpg"))
+
+
+def _rendition_target(source: Path, variant: str) -> Path:
+    return source.with_name(f"{source.stem}.{variant}.jpg")
+
+
+def existing_variant(relative: Optional[str], variant: str) -> Optional[str]:
+    """Seperti `variant_path`, tapi hanya bila renditionnya sudah ada (akses disk, jangan di event loop)."""
+
+    candidate = variant_path(relative, variant)
+    if candidate:
+        target = confine_upload(candidate)
+        if target is not None and target.is_file():
+            return candidate
+    return None
+
+
+def _render_variants(relative: str, variants: Dict[str, tuple[int, int]]) -> None:
+    """Dijalankan di proses worker: buat rendition JPEG yang belum ada."""
+
+    source = confine_upload(relative)
+    if source is None or not source.is_file():
+        return
+    pending = {
+        name: (str(_rendition_target(source, name)), size, quality)
+        for name, (size, quality) in variants.items()
+        if not _rendition_target(source, name).exists()
+    }
+    if not pending:
+        return
+
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        # Proses dari rendition terbesar ke terkecil supaya resize berikutnya lebih murah.
+        for name, (target, size, quality) in sorted(pending.items(), key=lambda item: -item[1][1]):
+            image = image.copy() if max(image.size) <= size else image.resize(
+                _fit(image.size, size), Image.Resampling.LANCZOS
+            )
+            tmp_target = f"{target}.{os.getpid()}.tmp"
+            image.save(tmp_target, "JPEG", quality=quality, optimize=True, progressive=True)
+            os.replace(tmp_target, target)
+
+
+def _fit(size: tuple[int, int], longest: int) -> tuple[int, int]:
+    width, height = size
+    scale = longest / max(width, height)
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.image_workers)
+    return _executor
+
+
+async def build_renditions(relative: Optional[str]) -> None:
+    """Buat rendition review & thumbnail untuk satu foto di process pool; kegagalan hanya dicatat.
+
+    Path dari record di-resolve di worker dan harus tetap di bawah UPLOAD_BASE.
+    """
+
+    if not variant_path(relative, "thumb"):
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_get_executor(), _render_variants, relative.strip(), dict(VARIANTS))
+    except ImportError:
+        logger.warning("Pillow tidak terpasang; rendition foto dilewati")
+    except Exception:
+        logger.exception("Gagal membuat rendition untuk %s", relative)
+
+
+def remove_renditions(relative: Optional[str]) -> None:
+    source = confine_upload(relative) if variant_path(relative, "thumb") else None
+    if source is None:
+        return
+    for name in VARIANTS:
+        _rendition_target(source, name).unlink(missing_ok=True)
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+__all__ = [
+    "IMAGE_FIELDS",
+    "VARIANTS",
+    "build_renditions",
+    "existing_variant",
+    "remove_renditions",
+    "shutdown_executor",
+    "variant_path",
+]
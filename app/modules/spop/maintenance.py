@@ -0,0 +1,259 @@
+"""Migrasi kunci join ternormalisasi SPOP, index unik NOP, dan pemeriksaan EXPLAIN.
+
+Jalankan manual::
+
+    python -m app.modules.spop.maintenance migrate
+    python -m app.modules.spop.maintenance explain
+
+`migrate` sengaja tidak dijalankan saat startup: ALTER pada `spop` dan
+`dat_subjek_pajak` menyalin/mengunci tabel besar, jadi dijalankan sekali per
+rilis sebelum aplikasi dinyalakan. Startup hanya mencatat peringatan bila masih
+ada yang belum terpasang. `migrate` aman diulang dan diserialkan dengan
+`GET_LOCK`, sehingga beberapa proses yang menjalankannya bersamaan tidak
+bertabrakan. Kolom dibuat sebagai STORED generated column sehingga MySQL
+sendiri yang mengisi (backfill) baris lama saat ALTER dan menjaganya tetap
+sinkron pada setiap INSERT/UPDATE.
+
+Index unik `spop_registration.nop` menggantikan index biasa
+`ix_spop_registration_nop`; bila masih ada NOP ganda, migrasi ini dilewati
+(dicatat di log) sampai datanya dibereskan.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+from typing import Dict, List, NamedTuple
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import mysql
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql.elements import TextClause
+
+from app.core.database import engine
+from app.modules.spop.models import DatSubjekPajak, Spop
+
+
+logger = logging.getLogger(__name__)
+
+REGISTRATION_NOP_INDEX = "ux_spop_registration_nop"
+LEGACY_REGISTRATION_NOP_INDEX = "ix_spop_registration_nop"
+
+MIGRATION_LOCK = "simpbb_spop_maintenance"
+MIGRATION_LOCK_TIMEOUT_SECONDS = 600
+# Duplicate column name / duplicate key name / can't DROP (sudah dikerjakan proses lain).
+TOLERATED_DDL_ERRORS = frozenset({1060, 1061, 1091})
+
+
+class JoinKey(NamedTuple):
+    table: str
+    column: str
+    column_type: str
+    expression: str
+    index: str
+
+
+JOIN_KEYS = (
+    JoinKey("spop", "SUBJEK_PAJAK_KEY", "VARCHAR(30)", "TRIM(COALESCE(`SUBJEK_PAJAK_ID`, ''))", "ix_spop_SUBJEK_PAJAK_KEY"),
+    JoinKey(
+        "dat_subjek_pajak",
+        "SUBJEK_PAJAK_KEY",
+        "VARCHAR(90)",
+        "TRIM(COALESCE(`SUBJEK_PAJAK_ID`, ''))",
+        "ix_dat_subjek_pajak_SUBJEK_PAJAK_KEY",
+    ),
+)
+
+
+async def _column_exists(connection: AsyncConnection, table: str, column: str) -> bool:
+    stmt = text(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column"
+    )
+    return bool(await connection.scalar(stmt, {"table": table, "column": column}))
+
+
+async def _index_exists(connection: AsyncConnection, table: str, index: str) -> bool:
+    stmt = text(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND INDEX_NAME = :index"
+    )
+    return bool(await connection.scalar(stmt, {"table": table, "index": index}))
+
+
+async def _execute_ddl(connection: AsyncConnection, sql: str) -> bool:
+    """Jalankan DDL; False bila perubahan ternyata sudah ada (error 1060/1061/1091)."""
+
+    try:
+        await connection.execute(text(sql))
+    except DBAPIError as exc:
+        code = exc.orig.args[0] if exc.orig is not None and exc.orig.args else None
+        if code not in TOLERATED_DDL_ERRORS:
+            raise
+        logger.info("DDL dilewati (%s): %s", code, sql)
+        return False
+    return True
+
+
+async def pending_migrations(connection: AsyncConnection) -> List[str]:
+    """Kolom/index yang belum terpasang; hanya membaca information_schema."""
+
+    pending: List[str] = []
+    for key in JOIN_KEYS:
+        if not await _column_exists(connection, key.table, key.column):
+            pending.append(f"{key.table}.{key.column}")
+        elif not await _index_exists(connection, key.table, key.index):
+            pending.append(f"{key.table}.{key.index}")
+    if not await _index_exists(connection, "spop_registration", REGISTRATION_NOP_INDEX):
+        pending.append(f"spop_registration.{REGISTRATION_NOP_INDEX}")
+    return pending
+
+
+async def ensure_join_keys(connection: AsyncConnection) -> List[str]:
+    """Tambahkan kolom kunci + index yang belum ada; kembalikan daftar perubahan."""
+
+    applied: List[str] = []
+    for key in JOIN_KEYS:
+        if not await _column_exists(connection, key.table, key.column):
+            if await _execute_ddl(
+                connection,
+                f"ALTER TABLE `{key.table}` "
+                f"ADD COLUMN `{key.column}` {key.column_type} GENERATED ALWAYS AS ({key.expression}) STORED, "
+                f"ADD INDEX `{key.index}` (`{key.column}`)",
+            ):
+                applied.append(f"{key.table}.{key.column}")
+        elif not await _index_exists(connection, key.table, key.index):
+            if await _execute_ddl(connection, f"CREATE INDEX `{key.index}` ON `{key.table}` (`{key.column}`)"):
+                applied.append(f"{key.table}.{key.index}")
+    return applied
+
+
+async def ensure_unique_keys(connection: AsyncConnection) -> List[str]:
+    """Pasang index unik `spop_registration.nop` (PK komposit `spop` sudah unik)."""
+
+    applied: List[str] = []
+    if await _index_exists(connection, "spop_registration", REGISTRATION_NOP_INDEX):
+        return applied
+    duplicates = await connection.scalar(
+        text(
+            "SELECT COUNT(*) FROM (SELECT nop FROM spop_registration WHERE nop IS NOT NULL "
+            "GROUP BY nop HAVING COUNT(*) > 1) dup"
+        )
+    )
+    if duplicates:
+        logger.warning("Index unik %s dilewati: %s NOP ganda di spop_registration", REGISTRATION_NOP_INDEX, duplicates)
+        return applied
+    if await _index_exists(connection, "spop_registration", LEGACY_REGISTRATION_NOP_INDEX):
+        sql = (
+            f"ALTER TABLE `spop_registration` DROP INDEX `{LEGACY_REGISTRATION_NOP_INDEX}`, "
+            f"ADD UNIQUE INDEX `{REGISTRATION_NOP_INDEX}` (`nop`)"
+        )
+    else:
+        sql = f"CREATE UNIQUE INDEX `{REGISTRATION_NOP_INDEX}` ON `spop_registration` (`nop`)"
+    if await _execute_ddl(connection, sql):
+        applied.append(f"spop_registration.{REGISTRATION_NOP_INDEX}")
+    return applied
+
+
+async def migrate(connection: AsyncConnection) -> List[str]:
+    """`ensure_join_keys` + `ensure_unique_keys` di bawah `GET_LOCK` (satu proses pada satu waktu)."""
+
+    locked = await connection.scalar(
+        text("SELECT GET_LOCK(:name, :timeout)"),
+        {"name": MIGRATION_LOCK, "timeout": MIGRATION_LOCK_TIMEOUT_SECONDS},
+    )
+    if locked != 1:
+        raise RuntimeError(f"Lock {MIGRATION_LOCK} tidak didapat; migrasi lain masih berjalan")
+    try:
+        applied = await ensure_join_keys(connection)
+        applied += await ensure_unique_keys(connection)
+    finally:
+        await connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK})
+    return applied
+
+
+def _explain_targets() -> Dict[str, object]:
+    legacy_join = text(
+        "SELECT s.KD_PROPINSI, d.NM_WP FROM spop s "
+        "LEFT JOIN dat_subjek_pajak d "
+        "ON TRIM(COALESCE(d.SUBJEK_PAJAK_ID, '')) = TRIM(COALESCE(s.SUBJEK_PAJAK_ID, '')) LIMIT 20"
+    )
+    legacy_lookup = text(
+        "SELECT SUBJEK_PAJAK_ID FROM dat_subjek_pajak WHERE TRIM(COALESCE(SUBJEK_PAJAK_ID, '')) = 'X'"
+    )
+    join_stmt = (
+        select(Spop.kd_propinsi, DatSubjekPajak.nm_wp)
+        .outerjoin(DatSubjekPajak, DatSubjekPajak.subjek_pajak_key == Spop.subjek_pajak_key)
+        .limit(20)
+    )
+    lookup_stmt = select(DatSubjekPajak.subjek_pajak_id).where(DatSubjekPajak.subjek_pajak_key == "X")
+    return {
+        "before:legacy_join": legacy_join,
+        "after:legacy_join": join_stmt,
+        "before:subjek_lookup": legacy_lookup,
+        "after:subjek_lookup": lookup_stmt,
+    }
+
+
+async def explain_report(connection: AsyncConnection) -> List[Dict[str, object]]:
+    """EXPLAIN query lama (TRIM) vs baru (kolom kunci).
+
+    `full_scan` bernilai True bila `dat_subjek_pajak` dibaca dengan type=ALL;
+    setelah migrasi, semua entri `after:*` seharusnya False.
+    """
+
+    report: List[Dict[str, object]] = []
+    for name, stmt in _explain_targets().items():
+        if isinstance(stmt, TextClause):
+            sql = str(stmt)
+        else:
+            sql = str(stmt.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True}))
+        rows = (await connection.execute(text(f"EXPLAIN {sql}"))).mappings().all()
+        plan = [
+            {"table": row.get("table"), "type": row.get("type"), "key": row.get("key"), "rows": row.get("rows")}
+            for row in rows
+        ]
+        full_scan = any(
+            step["type"] == "ALL" and str(step["table"]) in ("d", "dat_subjek_pajak") for step in plan
+        )
+        report.append({"query": name, "full_scan": full_scan, "plan": plan})
+    return report
+
+
+async def _main(command: str) -> int:
+    try:
+        return await _run(command)
+    finally:
+        await engine.dispose()
+
+
+async def _run(command: str) -> int:
+    async with engine.begin() as connection:
+        if command == "migrate":
+            applied = await migrate(connection)
+            print("Tidak ada perubahan" if not applied else "Ditambahkan: " + ", ".join(applied))
+            return 0
+        if command == "explain":
+            failed = False
+            for entry in await explain_report(connection):
+                print(f"{entry['query']}: full_scan={entry['full_scan']} plan={entry['plan']}")
+                failed = failed or (entry["query"].startswith("after:") and entry["full_scan"])
+            return 1 if failed else 0
+    print("Perintah: migrate | explain")
+    return 2
+
+
+__all__ = [
+    "JOIN_KEYS",
+    "ensure_join_keys",
+    "ensure_unique_keys",
+    "explain_report",
+    "migrate",
+    "pending_migrations",
+]
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "")))
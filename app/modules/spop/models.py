@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import date, datetime
 from typing import Optional
 
-from sqlalchemy import BigInteger, Date, DateTime, Integer, String
+from sqlalchemy import BigInteger, Computed, Date, DateTime, Index, Integer, LargeBinary, String
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.core.database import Base
@@ -22,6 +22,13 @@ class Spop(Base):
     no_urut: Mapped[str] = mapped_column("NO_URUT", String(12), primary_key=True)
     kd_jns_op: Mapped[str] = mapped_column("KD_JNS_OP", String(1), primary_key=True)
     subjek_pajak_id: Mapped[str] = mapped_column("SUBJEK_PAJAK_ID", String(30), nullable=False)
+    # Kunci join ternormalisasi (lihat app/modules/spop/maintenance.py).
+    subjek_pajak_key: Mapped[Optional[str]] = mapped_column(
+        "SUBJEK_PAJAK_KEY",
+        String(30),
+        Computed("TRIM(COALESCE(`SUBJEK_PAJAK_ID`, ''))", persisted=True),
+        index=True,
+    )
     no_formulir_spop: Mapped[Optional[str]] = mapped_column("NO_FORMULIR_SPOP", String(11))
     jns_transaksi_op: Mapped[str] = mapped_column("JNS_TRANSAKSI_OP", String(1), nullable=False)
     kd_propinsi_bersama: Mapped[Optional[str]] = mapped_column("KD_PROPINSI_BERSAMA", String(2))
@@ -139,6 +146,12 @@ class DatSubjekPajak(Base):
     __tablename__ = "dat_subjek_pajak"
 
     subjek_pajak_id: Mapped[str] = mapped_column("SUBJEK_PAJAK_ID", String(90), primary_key=True)
+    subjek_pajak_key: Mapped[Optional[str]] = mapped_column(
+        "SUBJEK_PAJAK_KEY",
+        String(90),
+        Computed("TRIM(COALESCE(`SUBJEK_PAJAK_ID`, ''))", persisted=True),
+        index=True,
+    )
     nm_wp: Mapped[Optional[str]] = mapped_column("NM_WP", String(90))
     jalan_wp: Mapped[Optional[str]] = mapped_column("JALAN_WP", String(90))
     blok_kav_no_wp: Mapped[Optional[str]] = mapped_column("BLOK_KAV_NO_WP", String(45))
@@ -155,7 +168,22 @@ class DatSubjekPajak(Base):
 
 class SpopRegistration(Base):
     __tablename__ = "spop_registration"
-  
+    __table_args__ = (
+        Index("ix_spop_registration_submitted", "submitted_at", "id"),
+        Index("ix_spop_registration_user_submitted", "user_id", "submitted_at", "id"),
+        Index("ix_spop_registration_status_submitted", "status_akhir", "submitted_at", "id"),
+        Index("ux_spop_registration_nop", "nop", unique=True),
+        Index(
+            "ix_spop_registration_wilayah_submitted",
+            "provinsi_op",
+            "kabupaten_op",
+            "kecamatan_op",
+            "kelurahan_op",
+            "submitted_at",
+            "id",
+        ),
+    )
+
     id: Mapped[str] = mapped_column(String(32), primary_key=True)
 
     # Bagian Paling Awal
@@ -223,10 +251,43 @@ class SpopRegistration(Base):
     submitted_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
 
 
+
+class NopCounter(Base):
+    """Penghitung no urut per blok NOP (dipakai allocator)."""
+
+    __tablename__ = "nop_counter"
+
+    kd_propinsi: Mapped[str] = mapped_column(String(2), primary_key=True)
+    kd_dati2: Mapped[str] = mapped_column(String(2), primary_key=True)
+    kd_kecamatan: Mapped[str] = mapped_column(String(3), primary_key=True)
+    kd_kelurahan: Mapped[str] = mapped_column(String(3), primary_key=True)
+    kd_blok: Mapped[str] = mapped_column(String(3), primary_key=True)
+    last_no_urut: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    used_bitmap: Mapped[bytes] = mapped_column(LargeBinary(1250), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, server_default=func.now(), onupdate=func.now()
+    )
+
+
+
+class UploadBlob(Base):
+    """Berkas unggahan tersimpan sekali per isi (SHA-256) dengan hitungan referensi."""
+
+    __tablename__ = "upload_blob"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    path: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+
 __all__ = [
     "Spop",
     "DatSubjekPajak",
     "SpopRegistration",
+    "NopCounter",
+    "UploadBlob",
     "RefProvinsi",
     "RefKabupaten",
     "RefKecamatanBaru",
@@ -1,29 +1,45 @@
 from __future__ import annotations
 
-from secrets import randbelow
-from datetime import datetime
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from uuid import uuid4
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, List, Literal, Optional, Tuple
 from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException, Query, Request, status, UploadFile
-from sqlalchemy import and_, func, select
+from fastapi import APIRouter, BackgroundTasks, File, HTTPException, Query, Request, Response, status, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import BigInteger, and_, cast, func, insert, or_, select, tuple_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import aliased
+from starlette.concurrency import run_in_threadpool
 
+from app.core.audit import SpopEvent, audit_buffer
+from app.core.database import AsyncSessionFactory
 from app.core.deps import CurrentUserDep, SessionDep
+from app.core.responses import json_response
+from app.core.sequence import form_sequence, next_dated_number
+from app.modules.refs.cache import region_cache
 from app.modules.spop import schemas
+from app.modules.spop.allocator import (
+    BlokKey,
+    allocate_no_urut,
+    claim_no_urut,
+    release_no_urut,
+    release_reserved,
+    reserve_no_urut_block,
+)
+from app.modules.spop.downloads import build_file_response, resolve_upload
+from app.modules.spop.images import IMAGE_FIELDS, build_renditions, existing_variant, variant_path
+from app.modules.spop.search_index import is_nop_query, nop_digits, normalize_text, spop_key, spop_search_index
+from app.modules.spop.storage import purge_unreferenced, release_paths, retain_paths
+from app.modules.spop.uploads import UPLOAD_ROOT, save_upload
 from app.modules.spop.models import (
     DatSubjekPajak,
-    RefDati2,
-    RefKecamatan,
-    RefKelurahan,
-    RefPropinsi,
-    RefProvinsi,
-    RefKabupaten,
-    RefKecamatanBaru,
-    RefKelurahanBaru,
     RefStatusSubjek,
     RefPekerjaanSubjek,
     RefJenisTanah,
@@ -32,9 +48,16 @@ from app.modules.spop.models import (
     Spop,
     SpopRegistration,
 )
+from app.modules.sppt import summary as sppt_summary
+from app.modules.sppt.cache import invalidate_esppt
+from app.modules.users.models import User
 
 router = APIRouter(prefix="/spop", tags=["spop"])
 
+REQUEST_LIST_ADAPTER = TypeAdapter(schemas.RequestListResponse)
+
+
+DUPLICATE_KEY_ERROR = 1062
 
 NOP_SEGMENTS = (
     ("kd_propinsi", 2),
@@ -97,8 +120,15 @@ def _compose_registration_nop(payload: schemas.RequestCreatePayload, kd_jns_op:
     return normalized
 
 
-def _pad(value: int, length: int) -> str:
-    return f"{value:0{length}d}"
+def _is_duplicate_key(exc: IntegrityError) -> bool:
+    """True untuk pelanggaran PRIMARY/UNIQUE KEY MySQL (ER_DUP_ENTRY 1062)."""
+
+    args = getattr(exc.orig, "args", ())
+    return bool(args) and args[0] == DUPLICATE_KEY_ERROR
+
+
+def _blok_key(keys: Dict[str, str]) -> BlokKey:
+    return BlokKey(keys["kd_propinsi"], keys["kd_dati2"], keys["kd_kecamatan"], keys["kd_kelurahan"], keys["kd_blok"])
 
 
 def _format_nop_fields(
@@ -122,152 +152,18 @@ def _format_nop_fields(
     return ".".join(parts)
 
 
-UPLOAD_BASE = Path(__file__).resolve().parent.parent.parent / "storage" / "uploads"
-UPLOAD_ROOT = UPLOAD_BASE / "spop"
-UPLOAD_ROOT.mkdir(parents=True, exist_ok=True)
-
-
-def _save_upload(file: UploadFile, module_dir: Path = UPLOAD_ROOT) -> str:
-    filename = file.filename or "file"
-    suffix = Path(filename).suffix
-    date_prefix = datetime.now().strftime("%Y%m%d")
-    unique_name = f"{date_prefix}-{uuid4().hex}{suffix}"
-    target_dir = module_dir
-    target_dir.mkdir(parents=True, exist_ok=True)
-    target_path = target_dir / unique_name
-    with target_path.open("wb") as f:
-        f.write(file.file.read())
-    return str(target_path.relative_to(UPLOAD_BASE))
-
-
-async def _generate_no_urut(session: SessionDep) -> str:
-    stmt = select(func.max(SpopRegistration.no_urut_op))
-    result = await session.execute(stmt)
-    current = result.scalar_one_or_none()
-    try:
-        current_int = int(current) if current is not None else 0
-    except ValueError:
-        current_int = 0
-    next_val = current_int + 1
-    return str(next_val)
-
-
-async def _generate_kode_khusus(session: SessionDep) -> str:
-    stmt = select(func.max(SpopRegistration.kode_khusus))
-    result = await session.execute(stmt)
-    current = result.scalar_one_or_none()
-    try:
-        current_int = int(current) if current is not None else 0
-    except ValueError:
-        current_int = 0
-    next_val = current_int + 1
-    return str(next_val)
-
-
 async def _build_code_maps(
     session: SessionDep,
     regs: Iterable[SpopRegistration],
 ) -> Dict[str, Dict[str, Dict[str, str]]]:
-    prov_ids = {reg.provinsi_op for reg in regs if reg.provinsi_op is not None}
-    kab_ids = {reg.kabupaten_op for reg in regs if reg.kabupaten_op is not None}
-    kec_ids = {reg.kecamatan_op for reg in regs if reg.kecamatan_op is not None}
-    kel_ids = {reg.kelurahan_op for reg in regs if reg.kelurahan_op is not None}
-
-    prov_map: Dict[int, Dict[str, str]] = {}
-    if prov_ids:
-        rows = await session.execute(
-            select(RefProvinsi.id_provinsi, RefProvinsi.kode_provinsi, RefProvinsi.nama_provinsi).where(
-                RefProvinsi.id_provinsi.in_(prov_ids)
-            )
-        )
-        prov_map = {
-            row.id_provinsi: {
-                "kode_raw": str(row.kode_provinsi),
-                "kode_pad": _pad(row.kode_provinsi, 2),
-                "nama": row.nama_provinsi,
-            }
-            for row in rows
-        }
-
-    kab_map: Dict[int, Dict[str, str]] = {}
-    if kab_ids:
-        rows = await session.execute(
-            select(RefKabupaten.id_kabupaten, RefKabupaten.kode_kabupaten, RefKabupaten.nama_kabupaten).where(
-                RefKabupaten.id_kabupaten.in_(kab_ids)
-            )
-        )
-        kab_map = {
-            row.id_kabupaten: {
-                "kode_raw": str(row.kode_kabupaten),
-                "kode_pad": _pad(row.kode_kabupaten, 2),
-                "nama": row.nama_kabupaten,
-            }
-            for row in rows
-        }
-
-    kec_map: Dict[int, Dict[str, str]] = {}
-    if kec_ids:
-        rows = await session.execute(
-            select(RefKecamatanBaru.id_kecamatan, RefKecamatanBaru.kode_kecamatan, RefKecamatanBaru.nama_kecamatan).where(
-                RefKecamatanBaru.id_kecamatan.in_(kec_ids)
-            )
-        )
-        kec_map = {
-            row.id_kecamatan: {
-                "kode_raw": str(row.kode_kecamatan),
-                "kode_pad": _pad(row.kode_kecamatan, 3),
-                "nama": row.nama_kecamatan,
-            }
-            for row in rows
-        }
-
-    kel_map: Dict[int, Dict[str, str]] = {}
-    if kel_ids:
-        rows = await session.execute(
-            select(RefKelurahanBaru.id_kelurahan, RefKelurahanBaru.kode_kelurahan, RefKelurahanBaru.nama_kelurahan).where(
-                RefKelurahanBaru.id_kelurahan.in_(kel_ids)
-            )
-        )
-        kel_map = {
-            row.id_kelurahan: {
-                "kode_raw": str(row.kode_kelurahan),
-                "kode_pad": _pad(row.kode_kelurahan, 3),
-                "nama": row.nama_kelurahan,
-            }
-            for row in rows
-        }
-
+    await region_cache.ensure_loaded(session)
     code_map: Dict[str, Dict[str, Dict[str, str]]] = {}
     for reg in regs:
-        pid = reg.provinsi_op
-        kid = reg.kabupaten_op
-        kecid = reg.kecamatan_op
-        kelid = reg.kelurahan_op
         code_map[reg.id] = {
-            "provinsi": {
-                "id": pid,
-                "kode_raw": prov_map.get(pid, {}).get("kode_raw", ""),
-                "kode_pad": prov_map.get(pid, {}).get("kode_pad", ""),
-                "nama": prov_map.get(pid, {}).get("nama", ""),
-            },
-            "kabupaten": {
-                "id": kid,
-                "kode_raw": kab_map.get(kid, {}).get("kode_raw", ""),
-                "kode_pad": kab_map.get(kid, {}).get("kode_pad", ""),
-                "nama": kab_map.get(kid, {}).get("nama", ""),
-            },
-            "kecamatan": {
-                "id": kecid,
-                "kode_raw": kec_map.get(kecid, {}).get("kode_raw", ""),
-                "kode_pad": kec_map.get(kecid, {}).get("kode_pad", ""),
-                "nama": kec_map.get(kecid, {}).get("nama", ""),
-            },
-            "kelurahan": {
-                "id": kelid,
-                "kode_raw": kel_map.get(kelid, {}).get("kode_raw", ""),
-                "kode_pad": kel_map.get(kelid, {}).get("kode_pad", ""),
-                "nama": kel_map.get(kelid, {}).get("nama", ""),
-            },
+            "provinsi": region_cache.code("provinsi", reg.provinsi_op),
+            "kabupaten": region_cache.code("kabupaten", reg.kabupaten_op),
+            "kecamatan": region_cache.code("kecamatan", reg.kecamatan_op),
+            "kelurahan": region_cache.code("kelurahan", reg.kelurahan_op),
         }
     return code_map
 
@@ -276,90 +172,14 @@ async def _build_subject_maps(
     session: SessionDep,
     regs: Iterable[SpopRegistration],
 ) -> Dict[str, Dict[str, Dict[str, str]]]:
-    prov_ids = {reg.provinsi_subjek for reg in regs if reg.provinsi_subjek is not None}
-    kab_ids = {reg.kabupaten_subjek for reg in regs if reg.kabupaten_subjek is not None}
-    kec_ids = {reg.kecamatan_subjek for reg in regs if reg.kecamatan_subjek is not None}
-    kel_ids = {reg.kelurahan_subjek for reg in regs if reg.kelurahan_subjek is not None}
-
-    prov_map: Dict[int, Dict[str, str]] = {}
-    if prov_ids:
-        rows = await session.execute(
-            select(RefProvinsi.id_provinsi, RefProvinsi.kode_provinsi, RefProvinsi.nama_provinsi).where(
-                RefProvinsi.id_provinsi.in_(prov_ids)
-            )
-        )
-        prov_map = {
-            row.id_provinsi: {
-                "id": row.id_provinsi,
-                "kode_raw": str(row.kode_provinsi),
-                "kode_pad": _pad(row.kode_provinsi, 2),
-                "nama": row.nama_provinsi,
-            }
-            for row in rows
-        }
-
-    kab_map: Dict[int, Dict[str, str]] = {}
-    if kab_ids:
-        rows = await session.execute(
-            select(RefKabupaten.id_kabupaten, RefKabupaten.kode_kabupaten, RefKabupaten.nama_kabupaten).where(
-                RefKabupaten.id_kabupaten.in_(kab_ids)
-            )
-        )
-        kab_map = {
-            row.id_kabupaten: {
-                "id": row.id_kabupaten,
-                "kode_raw": str(row.kode_kabupaten),
-                "kode_pad": _pad(row.kode_kabupaten, 2),
-                "nama": row.nama_kabupaten,
-            }
-            for row in rows
-        }
-
-    kec_map: Dict[int, Dict[str, str]] = {}
-    if kec_ids:
-        rows = await session.execute(
-            select(RefKecamatanBaru.id_kecamatan, RefKecamatanBaru.kode_kecamatan, RefKecamatanBaru.nama_kecamatan).where(
-                RefKecamatanBaru.id_kecamatan.in_(kec_ids)
-            )
-        )
-        kec_map = {
-            row.id_kecamatan: {
-                "id": row.id_kecamatan,
-                "kode_raw": str(row.kode_kecamatan),
-                "kode_pad": _pad(row.kode_kecamatan, 3),
-                "nama": row.nama_kecamatan,
-            }
-            for row in rows
-        }
-
-    kel_map: Dict[int, Dict[str, str]] = {}
-    if kel_ids:
-        rows = await session.execute(
-            select(RefKelurahanBaru.id_kelurahan, RefKelurahanBaru.kode_kelurahan, RefKelurahanBaru.nama_kelurahan).where(
-                RefKelurahanBaru.id_kelurahan.in_(kel_ids)
-            )
-        )
-        kel_map = {
-            row.id_kelurahan: {
-                "id": row.id_kelurahan,
-                "kode_raw": str(row.kode_kelurahan),
-                "kode_pad": _pad(row.kode_kelurahan, 3),
-                "nama": row.nama_kelurahan,
-            }
-            for row in rows
-        }
-
+    await region_cache.ensure_loaded(session)
     code_map: Dict[str, Dict[str, Dict[str, str]]] = {}
     for reg in regs:
-        pid = reg.provinsi_subjek
-        kid = reg.kabupaten_subjek
-        kecid = reg.kecamatan_subjek
-        kelid = reg.kelurahan_subjek
         code_map[reg.id] = {
-            "provinsi": prov_map.get(pid, {"id": pid, "kode_raw": "", "kode_pad": "", "nama": ""}),
-            "kabupaten": kab_map.get(kid, {"id": kid, "kode_raw": "", "kode_pad": "", "nama": ""}),
-            "kecamatan": kec_map.get(kecid, {"id": kecid, "kode_raw": "", "kode_pad": "", "nama": ""}),
-            "kelurahan": kel_map.get(kelid, {"id": kelid, "kode_raw": "", "kode_pad": "", "nama": ""}),
+            "provinsi": region_cache.code("provinsi", reg.provinsi_subjek),
+            "kabupaten": region_cache.code("kabupaten", reg.kabupaten_subjek),
+            "kecamatan": region_cache.code("kecamatan", reg.kecamatan_subjek),
+            "kelurahan": region_cache.code("kelurahan", reg.kelurahan_subjek),
         }
     return code_map
 
@@ -445,6 +265,69 @@ async def _build_njop_maps(
     return result
 
 
+def _encode_request_cursor(submitted_at: datetime, request_id: str) -> str:
+    raw = f"{submitted_at.isoformat()}|{request_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_request_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        submitted_raw, request_id = raw.split("|", 1)
+        return datetime.fromisoformat(submitted_raw), request_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor tidak valid")
+
+
+def _registration_page_stmt():
+    """Select permohonan beserta label referensi non-wilayah; wilayah dari `region_cache`."""
+
+    kelas_bangunan = aliased(RefKelasBangunanNjop)
+    kelas_bumi = aliased(RefKelasBumiNjop)
+
+    return (
+        select(
+            SpopRegistration,
+            RefStatusSubjek.nama.label("status_subjek_nama"),
+            RefPekerjaanSubjek.nama.label("pekerjaan_subjek_nama"),
+            RefJenisTanah.nama.label("jenis_tanah_nama"),
+            kelas_bangunan,
+            kelas_bumi,
+        )
+        .outerjoin(RefStatusSubjek, RefStatusSubjek.id == SpopRegistration.status_subjek)
+        .outerjoin(RefPekerjaanSubjek, RefPekerjaanSubjek.id == SpopRegistration.pekerjaan_subjek)
+        .outerjoin(RefJenisTanah, RefJenisTanah.id == SpopRegistration.jenis_tanah)
+        .outerjoin(kelas_bangunan, kelas_bangunan.id == SpopRegistration.kelas_bangunan_njop)
+        .outerjoin(kelas_bumi, kelas_bumi.id == SpopRegistration.kelas_bumi_njop)
+    )
+
+
+def _joined_row_to_record(row) -> schemas.RequestRecord:
+    """Butuh `region_cache.ensure_loaded()` sebelumnya."""
+
+    registration: SpopRegistration = row[0]
+    codes = {
+        "provinsi": region_cache.code("provinsi", registration.provinsi_op),
+        "kabupaten": region_cache.code("kabupaten", registration.kabupaten_op),
+        "kecamatan": region_cache.code("kecamatan", registration.kecamatan_op),
+        "kelurahan": region_cache.code("kelurahan", registration.kelurahan_op),
+    }
+    subject_codes = {
+        "provinsi": region_cache.code("provinsi", registration.provinsi_subjek),
+        "kabupaten": region_cache.code("kabupaten", registration.kabupaten_subjek),
+        "kecamatan": region_cache.code("kecamatan", registration.kecamatan_subjek),
+        "kelurahan": region_cache.code("kelurahan", registration.kelurahan_subjek),
+    }
+    status_codes = {
+        "status_subjek": {"nama": row.status_subjek_nama or ""},
+        "pekerjaan_subjek": {"nama": row.pekerjaan_subjek_nama or ""},
+        "jenis_tanah": {"nama": row.jenis_tanah_nama or ""},
+    }
+    njop_codes = {"kelas_bangunan": row[-2], "kelas_bumi": row[-1]}
+    return _registration_to_record(registration, codes, subject_codes, status_codes, njop_codes)
+
+
 def _keys_from_components(
     kd_propinsi: str,
     kd_dati2: str,
@@ -476,37 +359,38 @@ def _keys_from_components(
 
 
 async def _resolve_region_codes(session: SessionDep, payload: schemas.RequestCreatePayload) -> Dict[str, str]:
-    prov = await session.get(RefProvinsi, payload.provinsi_op)
+    await region_cache.ensure_loaded(session)
+    return _region_codes_from_cache(payload)
+
+
+def _region_codes_from_cache(payload: schemas.RequestCreatePayload) -> Dict[str, str]:
+    prov = region_cache.get("provinsi", payload.provinsi_op)
     if prov is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Provinsi tidak ditemukan")
 
-    kab = await session.get(RefKabupaten, payload.kabupaten_op)
-    if kab is None or kab.id_provinsi != prov.id_provinsi:
+    kab = region_cache.get("kabupaten", payload.kabupaten_op)
+    if kab is None or kab.id_provinsi != prov.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Kabupaten tidak sesuai provinsi")
 
-    kec = await session.get(RefKecamatanBaru, payload.kecamatan_op)
-    if kec is None or kec.id_provinsi != prov.id_provinsi or kec.id_kabupaten != kab.id_kabupaten:
+    kec = region_cache.get("kecamatan", payload.kecamatan_op)
+    if kec is None or kec.id_provinsi != prov.id or kec.id_kabupaten != kab.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Kecamatan tidak sesuai kabupaten/provinsi")
 
-    kel = await session.get(RefKelurahanBaru, payload.kelurahan_op)
-    if kel is None or kel.id_provinsi != prov.id_provinsi or kel.id_kabupaten != kab.id_kabupaten or kel.id_kecamatan != kec.id_kecamatan:
+    kel = region_cache.get("kelurahan", payload.kelurahan_op)
+    if kel is None or kel.id_provinsi != prov.id or kel.id_kabupaten != kab.id or kel.id_kecamatan != kec.id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Kelurahan tidak sesuai kecamatan/kabupaten/provinsi",
         )
 
     return {
-        "kd_propinsi": f"{prov.kode_provinsi:02d}",
-        "kd_dati2": f"{kab.kode_kabupaten:02d}",
-        "kd_kecamatan": f"{kec.kode_kecamatan:03d}",
-        "kd_kelurahan": f"{kel.kode_kelurahan:03d}",
+        "kd_propinsi": prov.kode_pad,
+        "kd_dati2": kab.kode_pad,
+        "kd_kecamatan": kec.kode_pad,
+        "kd_kelurahan": kel.kode_pad,
     }
 
 
-def _trim(expr):
-    return func.trim(func.coalesce(expr, ""))
-
-
 def _status_label(code: Optional[str]) -> Optional[str]:
     mapping = {
         "1": "pendaftaran",
@@ -518,19 +402,19 @@ def _status_label(code: Optional[str]) -> Optional[str]:
     return mapping.get(code.strip(), code.strip())
 
 
-async def _generate_no_formulir(session: SessionDep, retries: int = 5) -> str:
-    for _ in range(retries):
-        candidate = f"{randbelow(10**11):011d}"
-        stmt = select(Spop.no_formulir_spop).where(Spop.no_formulir_spop == candidate).limit(1)
-        result = await session.execute(stmt)
-        if result.scalar_one_or_none() is None:
-            return candidate
-    raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Gagal membuat nomor formulir SPOP")
+async def _max_no_formulir_spop(session) -> int:
+    stmt = select(func.max(cast(Spop.no_formulir_spop, BigInteger)))
+    return int((await session.execute(stmt)).scalar_one_or_none() or 0)
+
+
+async def _generate_no_formulir() -> str:
+    value = await form_sequence.next_value("spop", seed=_max_no_formulir_spop)
+    return f"{value:011d}"
 
 
 async def _ensure_subjek_exists(session: SessionDep, subjek_pajak_id: str) -> None:
     stmt = select(DatSubjekPajak.subjek_pajak_id).where(
-        _trim(DatSubjekPajak.subjek_pajak_id) == subjek_pajak_id.strip()
+        DatSubjekPajak.subjek_pajak_key == subjek_pajak_id.strip()
     )
     result = await session.execute(stmt)
     if result.scalar_one_or_none() is None:
@@ -544,43 +428,43 @@ def _registration_to_record(
     status_codes: Optional[Dict[str, Dict[str, str]]] = None,
     njop_codes: Optional[Dict[str, Dict[str, Optional[object]]]] = None,
 ) -> schemas.RequestRecord:
-    prov_info = schemas.RegionInfo(
+    prov_info = schemas.RegionInfo.model_construct(
         id=registration.provinsi_op,
         kode=codes.get("provinsi", {}).get("kode_pad", ""),
         nama=codes.get("provinsi", {}).get("nama", ""),
     )
-    kab_info = schemas.RegionInfo(
+    kab_info = schemas.RegionInfo.model_construct(
         id=registration.kabupaten_op,
         kode=codes.get("kabupaten", {}).get("kode_pad", ""),
         nama=codes.get("kabupaten", {}).get("nama", ""),
     )
-    kec_info = schemas.RegionInfo(
+    kec_info = schemas.RegionInfo.model_construct(
         id=registration.kecamatan_op,
         kode=codes.get("kecamatan", {}).get("kode_pad", ""),
         nama=codes.get("kecamatan", {}).get("nama", ""),
     )
-    kel_info = schemas.RegionInfo(
+    kel_info = schemas.RegionInfo.model_construct(
         id=registration.kelurahan_op,
         kode=codes.get("kelurahan", {}).get("kode_pad", ""),
         nama=codes.get("kelurahan", {}).get("nama", ""),
     )
 
-    sub_prov = schemas.RegionInfo(
+    sub_prov = schemas.RegionInfo.model_construct(
         id=registration.provinsi_subjek,
         kode=(subject_codes or {}).get("provinsi", {}).get("kode_pad", str(registration.provinsi_subjek or "")),
         nama=(subject_codes or {}).get("provinsi", {}).get("nama", ""),
     )
-    sub_kab = schemas.RegionInfo(
+    sub_kab = schemas.RegionInfo.model_construct(
         id=registration.kabupaten_subjek,
         kode=(subject_codes or {}).get("kabupaten", {}).get("kode_pad", str(registration.kabupaten_subjek or "")),
         nama=(subject_codes or {}).get("kabupaten", {}).get("nama", ""),
     )
-    sub_kec = schemas.RegionInfo(
+    sub_kec = schemas.RegionInfo.model_construct(
         id=registration.kecamatan_subjek,
         kode=(subject_codes or {}).get("kecamatan", {}).get("kode_pad", str(registration.kecamatan_subjek or "")),
         nama=(subject_codes or {}).get("kecamatan", {}).get("nama", ""),
     )
-    sub_kel = schemas.RegionInfo(
+    sub_kel = schemas.RegionInfo.model_construct(
         id=registration.kelurahan_subjek,
         kode=(subject_codes or {}).get("kelurahan", {}).get("kode_pad", str(registration.kelurahan_subjek or "")),
         nama=(subject_codes or {}).get("kelurahan", {}).get("nama", ""),
@@ -598,7 +482,7 @@ def _registration_to_record(
         registration.no_urut_op,
         str(registration.kode_khusus or ""),
     )
-    return schemas.RequestRecord(
+    return schemas.RequestRecord.model_construct(
         id=registration.id,
         submitted_at=registration.submitted_at,
         nop=formatted_nop,
@@ -616,11 +500,11 @@ def _registration_to_record(
         kode_khusus=registration.kode_khusus,
         nama_lengkap=registration.nama_lengkap,
         nik=registration.nik,
-        status_subjek=schemas.StatusInfo(
+        status_subjek=schemas.StatusInfo.model_construct(
             id=registration.status_subjek,
             nama=(status_codes or {}).get("status_subjek", {}).get("nama", ""),
         ),
-        pekerjaan_subjek=schemas.StatusInfo(
+        pekerjaan_subjek=schemas.StatusInfo.model_construct(
             id=registration.pekerjaan_subjek,
             nama=(status_codes or {}).get("pekerjaan_subjek", {}).get("nama", ""),
         ),
@@ -635,7 +519,7 @@ def _registration_to_record(
         rt_subjek=registration.rt_subjek,
         rw_subjek=registration.rw_subjek,
         kode_pos_subjek=registration.kode_pos_subjek,
-        jenis_tanah=schemas.StatusInfo(
+        jenis_tanah=schemas.StatusInfo.model_construct(
             id=registration.jenis_tanah,
             nama=(status_codes or {}).get("jenis_tanah", {}).get("nama", ""),
         ),
@@ -646,10 +530,14 @@ def _registration_to_record(
         file_sertifikat=registration.file_sertifikat,
         file_sppt_tetangga=registration.file_sppt_tetangga,
         file_foto_objek=registration.file_foto_objek,
+        file_foto_objek_review=variant_path(registration.file_foto_objek, "review"),
+        file_foto_objek_thumb=variant_path(registration.file_foto_objek, "thumb"),
         file_surat_kuasa=registration.file_surat_kuasa,
         file_pendukung=registration.file_pendukung,
         tanggal_pelaksanaan=registration.tanggal_pelaksanaan,
         foto_objek_pajak=registration.foto_objek_pajak,
+        foto_objek_pajak_review=variant_path(registration.foto_objek_pajak, "review"),
+        foto_objek_pajak_thumb=variant_path(registration.foto_objek_pajak, "thumb"),
         nama_petugas=registration.nama_petugas,
         nip=registration.nip,
         status=registration.status,
@@ -657,6 +545,21 @@ def _registration_to_record(
     )
 
 
+REGISTRATION_FILE_FIELDS = (
+    "file_ktp",
+    "file_sertifikat",
+    "file_sppt_tetangga",
+    "file_foto_objek",
+    "file_surat_kuasa",
+    "file_pendukung",
+    "foto_objek_pajak",
+)
+
+
+def _registration_files(registration: SpopRegistration) -> List[Optional[str]]:
+    return [getattr(registration, field) for field in REGISTRATION_FILE_FIELDS]
+
+
 async def _load_payload(request: Request, model_cls):
     try:
         data = await request.json()
@@ -670,6 +573,7 @@ async def _load_payload(request: Request, model_cls):
 
 async def _load_payload_with_files(
     request: Request,
+    session: SessionDep,
     model_cls,
     file_fields: List[str],
     module_dir: Path = UPLOAD_ROOT,
@@ -683,7 +587,7 @@ async def _load_payload_with_files(
         val = form.get(key)
         if isinstance(val, UploadFile) and key in file_fields:
             if val.filename:
-                data[key] = _save_upload(val, module_dir)
+                data[key] = (await save_upload(session, val, key, module_dir)).path
         else:
             data[key] = val
     for key in ("_method", "_put", "_patch"):
@@ -694,6 +598,7 @@ async def _load_payload_with_files(
 @router.post("/requests", response_model=schemas.RequestResponse, status_code=status.HTTP_201_CREATED)
 async def create_registration_request(
     request: Request,
+    background_tasks: BackgroundTasks,
     session: SessionDep,
     current_user: CurrentUserDep,
 ) -> schemas.RequestResponse:
@@ -705,20 +610,22 @@ async def create_registration_request(
         "file_surat_kuasa",
         "file_pendukung",
     ]
-    payload = await _load_payload_with_files(request, schemas.RequestCreatePayload, file_fields, UPLOAD_ROOT)
+    payload = await _load_payload_with_files(request, session, schemas.RequestCreatePayload, file_fields, UPLOAD_ROOT)
     codes = await _resolve_region_codes(session, payload)
     blok = _normalize_code(payload.blok_op, 3)
     if not blok:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Blok tidak valid")
 
-    no_urut = _normalize_code(payload.no_urut_op, 4)
-    if not no_urut:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="No Urut tidak valid")
-
-    if payload.kode_khusus is not None:
-        kode_khusus = str(payload.kode_khusus)
+    blok_key = BlokKey(codes["kd_propinsi"], codes["kd_dati2"], codes["kd_kecamatan"], codes["kd_kelurahan"], blok)
+    if payload.no_urut_op and payload.no_urut_op.strip():
+        no_urut = _normalize_code(payload.no_urut_op, 4)
+        if not no_urut:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="No Urut tidak valid")
+        await claim_no_urut(session, blok_key, no_urut)
     else:
-        kode_khusus = await _generate_kode_khusus(session)
+        no_urut = await allocate_no_urut(session, blok_key)
+
+    kode_khusus = str(payload.kode_khusus) if payload.kode_khusus is not None else "0"
 
     code_struct = {
         "provinsi": {"id": payload.provinsi_op, "kode_raw": codes["kd_propinsi"], "kode_pad": codes["kd_propinsi"], "nama": ""},
@@ -735,10 +642,7 @@ async def create_registration_request(
         no_urut,
         kode_khusus,
     )
-    existing_nop = await session.execute(select(SpopRegistration.id).where(SpopRegistration.nop == nop_value).limit(1))
-    if existing_nop.scalar_one_or_none() is not None:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="NOP sudah terdaftar")
-    form_number = datetime.now().strftime("%Y.%m.%d.%H.%M")
+    form_number = await next_dated_number("spop_registration")
     user_id = getattr(current_user, "id", None) or getattr(current_user, "sub", None)
     if isinstance(user_id, str):
         user_id = user_id.strip()
@@ -791,8 +695,17 @@ async def create_registration_request(
     )
 
     session.add(registration)
+    await retain_paths(session, _registration_files(registration))
 
-    await session.commit()
+    try:
+        await session.commit()
+    except IntegrityError as exc:
+        await session.rollback()
+        if _is_duplicate_key(exc):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="NOP sudah terdaftar")
+        raise
+    audit_buffer.record(registration.nop, "registration", "create", entity_id=registration.id, actor_id=current_user.id)
+    background_tasks.add_task(build_renditions, registration.file_foto_objek)
 
     await session.refresh(registration)
     resolved_codes = (await _build_code_maps(session, [registration])).get(registration.id, code_struct)
@@ -812,6 +725,269 @@ async def create_registration_request(
     return schemas.RequestResponse(message="Permohonan berhasil dibuat", data=record)
 
 
+IMPORT_BATCH_SIZE = 500
+IMPORT_INSERT_CHUNK = 100
+
+
+def _read_csv_batch(reader: csv.DictReader, size: int) -> List[Tuple[int, Dict[str, str]]]:
+    batch: List[Tuple[int, Dict[str, str]]] = []
+    for row in reader:
+        batch.append((reader.line_num, row))
+        if len(batch) >= size:
+            break
+    return batch
+
+
+def _import_row_payload(raw: Dict[str, Optional[str]]) -> schemas.RequestImportRow:
+    data = {
+        key.strip(): value.strip() if isinstance(value, str) else value
+        for key, value in raw.items()
+        if key and key.strip()
+    }
+    return schemas.RequestImportRow(**data)
+
+
+async def _release_import_numbers(session: SessionDep, items: List[Dict[str, object]]) -> None:
+    """Kembalikan no urut yang dipesan untuk baris impor yang gagal."""
+
+    by_blok: Dict[BlokKey, List[Dict[str, object]]] = {}
+    for item in items:
+        by_blok.setdefault(item["key"], []).append(item)
+    for key, group in by_blok.items():
+        await release_reserved(session, key, [item["no_urut"] for item in group if item.get("fresh_no_urut")])
+
+
+async def _reserve_import_numbers(session: SessionDep, key: BlokKey, count: int) -> List[str]:
+    """No urut untuk `count` baris impor; bila blok tidak cukup, sebanyak yang masih tersedia."""
+
+    try:
+        return await reserve_no_urut_block(session, key, count)
+    except HTTPException:
+        pass
+    numbers: List[str] = []
+    while len(numbers) < count:
+        try:
+            numbers.append(await allocate_no_urut(session, key, reuse_gaps=False))
+        except HTTPException:
+            break
+    return numbers
+
+
+async def _insert_import_rows(session: SessionDep, rows: List[Tuple[Dict[str, object], Dict[str, object]]]) -> bool:
+    """Simpan baris impor dalam satu savepoint; False (tanpa perubahan) bila bentrok."""
+
+    try:
+        async with session.begin_nested():
+            await session.execute(insert(SpopRegistration), [values for _, values in rows])
+            await retain_paths(
+                session,
+                [values[field] for _, values in rows for field in REGISTRATION_FILE_FIELDS if field in values],
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+async def _import_batch(
+    session: SessionDep,
+    batch: List[Tuple[int, Dict[str, str]]],
+    user_id: Optional[str],
+    seen_nops: set,
+    created: List[schemas.RequestImportCreated],
+    errors: List[schemas.RequestImportError],
+) -> None:
+    first_created = len(created)
+    prepared: List[Dict[str, object]] = []
+    for row_no, raw in batch:
+        try:
+            payload = _import_row_payload(raw)
+            codes = _region_codes_from_cache(payload)
+        except ValidationError as exc:
+            messages = [f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in exc.errors()]
+            errors.append(schemas.RequestImportError(row=row_no, errors=messages))
+            continue
+        except HTTPException as exc:
+            errors.append(schemas.RequestImportError(row=row_no, errors=[str(exc.detail)]))
+            continue
+        blok = _normalize_code(payload.blok_op, 3)
+        if not blok:
+            errors.append(schemas.RequestImportError(row=row_no, errors=["Blok tidak valid"]))
+            continue
+        no_urut = _normalize_code(payload.no_urut_op, 4) if payload.no_urut_op else None
+        prepared.append(
+            {
+                "row": row_no,
+                "payload": payload,
+                "key": BlokKey(codes["kd_propinsi"], codes["kd_dati2"], codes["kd_kecamatan"], codes["kd_kelurahan"], blok),
+                "no_urut": no_urut,
+                "kode_khusus": str(payload.kode_khusus) if payload.kode_khusus is not None else "0",
+            }
+        )
+
+    by_blok: Dict[BlokKey, List[Dict[str, object]]] = {}
+    for item in prepared:
+        by_blok.setdefault(item["key"], []).append(item)
+
+    allocated: List[Dict[str, object]] = []
+    for key, items in by_blok.items():
+        for item in items:
+            if item["no_urut"]:
+                item["fresh_no_urut"] = await claim_no_urut(session, key, item["no_urut"])
+        pending = [item for item in items if not item["no_urut"]]
+        numbers = await _reserve_import_numbers(session, key, len(pending))
+        for item, number in zip(pending, numbers):
+            item["no_urut"] = number
+            item["fresh_no_urut"] = True
+        errors.extend(
+            schemas.RequestImportError(row=item["row"], errors=["No urut pada blok ini sudah habis"])
+            for item in pending[len(numbers) :]
+        )
+        for item in items:
+            if item["no_urut"]:
+                item["nop"] = _format_nop_fields(*key, item["no_urut"], item["kode_khusus"])
+                allocated.append(item)
+
+    if allocated:
+        existing = await session.execute(
+            select(SpopRegistration.nop).where(SpopRegistration.nop.in_([item["nop"] for item in allocated]))
+        )
+        seen_nops.update(existing.scalars().all())
+
+    failed: List[Dict[str, object]] = []
+    rows: List[Tuple[Dict[str, object], Dict[str, object]]] = []
+    for item in allocated:
+        if item["nop"] in seen_nops:
+            errors.append(schemas.RequestImportError(row=item["row"], errors=["NOP sudah terdaftar"]))
+            failed.append(item)
+            continue
+        seen_nops.add(item["nop"])
+        payload: schemas.RequestImportRow = item["payload"]
+        values = {
+            "id": uuid4().hex,
+            "nop": item["nop"],
+            "no_formulir": await next_dated_number("spop_registration"),
+            "nama_awal": payload.nama_awal.strip(),
+            "nik_awal": payload.nik_awal.strip(),
+            "alamat_rumah_awal": payload.alamat_rumah_awal.strip(),
+            "no_telp_awal": payload.no_telp_awal.strip(),
+            "provinsi_op": payload.provinsi_op,
+            "kabupaten_op": payload.kabupaten_op,
+            "kecamatan_op": payload.kecamatan_op,
+            "kelurahan_op": payload.kelurahan_op,
+            "blok_op": item["key"].kd_blok,
+            "no_urut_op": item["no_urut"],
+            "kode_khusus": int(item["kode_khusus"]),
+            "nama_lengkap": payload.nama_lengkap.strip(),
+            "nik": payload.nik.strip(),
+            "status_subjek": payload.status_subjek,
+            "pekerjaan_subjek": payload.pekerjaan_subjek,
+            "npwp": payload.npwp.strip() if payload.npwp else None,
+            "no_telp_subjek": payload.no_telp_subjek.strip(),
+            "jalan_subjek": payload.jalan_subjek.strip(),
+            "blok_kav_no_subjek": payload.blok_kav_no_subjek.strip(),
+            "kelurahan_subjek": payload.kelurahan_subjek,
+            "kecamatan_subjek": payload.kecamatan_subjek,
+            "kabupaten_subjek": payload.kabupaten_subjek,
+            "provinsi_subjek": payload.provinsi_subjek,
+            "rt_subjek": payload.rt_subjek.strip(),
+            "rw_subjek": payload.rw_subjek.strip(),
+            "kode_pos_subjek": payload.kode_pos_subjek.strip(),
+            "jenis_tanah": payload.jenis_tanah,
+            "luas_tanah": payload.luas_tanah,
+            "kelas_bangunan_njop": payload.kelas_bangunan_njop,
+            "kelas_bumi_njop": payload.kelas_bumi_njop,
+            "file_ktp": payload.file_ktp.strip(),
+            "file_sertifikat": payload.file_sertifikat.strip(),
+            "file_sppt_tetangga": payload.file_sppt_tetangga.strip(),
+            "file_foto_objek": payload.file_foto_objek.strip(),
+            "file_surat_kuasa": payload.file_surat_kuasa.strip() if payload.file_surat_kuasa else None,
+            "file_pendukung": payload.file_pendukung.strip() if payload.file_pendukung else None,
+            "status": payload.status.strip() if payload.status else None,
+            "keterangan": payload.keterangan.strip() if payload.keterangan else None,
+            "user_id": user_id or payload.user_id,
+        }
+        rows.append((item, values))
+
+    for start in range(0, len(rows), IMPORT_INSERT_CHUNK):
+        chunk = rows[start : start + IMPORT_INSERT_CHUNK]
+        if not await _insert_import_rows(session, chunk):
+            # Ada baris yang bentrok: ulangi satu per satu supaya hanya baris itu yang gagal.
+            stored = []
+            for row in chunk:
+                if await _insert_import_rows(session, [row]):
+                    stored.append(row)
+                else:
+                    errors.append(
+                        schemas.RequestImportError(
+                            row=row[0]["row"], errors=["Data gagal disimpan (bentrok dengan data lain)"]
+                        )
+                    )
+                    failed.append(row[0])
+            chunk = stored
+        created.extend(
+            schemas.RequestImportCreated(
+                row=item["row"], id=values["id"], nop=values["nop"], no_formulir=values["no_formulir"]
+            )
+            for item, values in chunk
+        )
+    await _release_import_numbers(session, failed)
+    await session.commit()
+    for item in created[first_created:]:
+        audit_buffer.record(item.nop, "registration", "import", entity_id=item.id, actor_id=user_id)
+
+
+@router.post("/requests/import", response_model=schemas.RequestImportResponse)
+async def import_registration_requests(
+    session: SessionDep,
+    current_user: CurrentUserDep,
+    file: UploadFile = File(...),
+) -> schemas.RequestImportResponse:
+    """Impor permohonan dari CSV (header = nama field `POST /spop/requests`).
+
+    Baris yang gagal validasi, tidak kebagian no urut, atau bentrok saat disimpan
+    dilaporkan per nomor baris tanpa membatalkan baris lain. No urut kosong
+    dialokasikan per blok secara berurutan; kode khusus kosong diisi 0.
+    """
+
+    await region_cache.ensure_loaded(session)
+    user_id = getattr(current_user, "id", None) or getattr(current_user, "sub", None)
+    if isinstance(user_id, str):
+        user_id = user_id.strip()
+
+    reader = csv.DictReader(io.TextIOWrapper(file.file, encoding="utf-8-sig", newline=""))
+    try:
+        fieldnames = await run_in_threadpool(lambda: reader.fieldnames)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Berkas CSV harus UTF-8")
+    if not fieldnames:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Berkas CSV kosong")
+
+    total = 0
+    seen_nops: set = set()
+    created: List[schemas.RequestImportCreated] = []
+    errors: List[schemas.RequestImportError] = []
+    while True:
+        try:
+            batch = await run_in_threadpool(_read_csv_batch, reader, IMPORT_BATCH_SIZE)
+        except (csv.Error, UnicodeDecodeError) as exc:
+            errors.append(schemas.RequestImportError(row=reader.line_num, errors=[f"CSV tidak valid: {exc}"]))
+            break
+        if not batch:
+            break
+        total += len(batch)
+        await _import_batch(session, batch, user_id, seen_nops, created, errors)
+
+    errors.sort(key=lambda err: err.row)
+    result = schemas.RequestImportResult(
+        total_rows=total,
+        imported=len(created),
+        failed=total - len(created),
+        created=created,
+        errors=errors,
+    )
+    return schemas.RequestImportResponse(message="Impor permohonan selesai", data=result)
+
+
 @router.get("/requests", response_model=schemas.RequestListResponse)
 @router.get("", response_model=schemas.RequestListResponse, include_in_schema=True)
 @router.get("/", response_model=schemas.RequestListResponse, include_in_schema=False)
@@ -820,54 +996,86 @@ async def list_registration_requests(
     current_user: CurrentUserDep,
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor dari meta.next_cursor; bila diisi, `page` diabaikan"),
+    include_total: bool = Query(True),
     user_id: Optional[str] = Query(None),
-) -> schemas.RequestListResponse:
-    stmt = select(SpopRegistration).order_by(SpopRegistration.submitted_at.desc())
-    count_stmt = select(func.count()).select_from(SpopRegistration)
-    if user_id:
-        trimmed = user_id.strip()
-        stmt = stmt.where(func.trim(SpopRegistration.user_id) == trimmed)
-        count_stmt = count_stmt.where(func.trim(SpopRegistration.user_id) == trimmed)
-
-    total = (await session.execute(count_stmt)).scalar_one()
-    offset = (page - 1) * limit
-    result = await session.execute(stmt.offset(offset).limit(limit))
-    rows = result.scalars().all()
-
-    code_map = await _build_code_maps(session, rows)
-    subject_map = await _build_subject_maps(session, rows)
-    status_map = await _build_status_maps(session, rows)
-    njop_map = await _build_njop_maps(session, rows)
-    data: List[schemas.RequestRecord] = []
-    for row in rows:
-        codes = code_map.get(row.id, {})
-        subj_codes = subject_map.get(row.id, {})
-        status_codes = status_map.get(row.id, {})
-        rec = _registration_to_record(row, codes, subj_codes, status_codes, njop_map.get(row.id, {}))
-        rec.nop = _format_nop_fields(
-            codes.get("provinsi", {}).get("kode_pad", ""),
-            codes.get("kabupaten", {}).get("kode_pad", ""),
-            codes.get("kecamatan", {}).get("kode_pad", ""),
-            codes.get("kelurahan", {}).get("kode_pad", ""),
-            row.blok_op,
-            row.no_urut_op,
-            str(row.kode_khusus or ""),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    submitted_from: Optional[date] = Query(None),
+    submitted_to: Optional[date] = Query(None),
+    provinsi_op: Optional[int] = Query(None),
+    kabupaten_op: Optional[int] = Query(None),
+    kecamatan_op: Optional[int] = Query(None),
+    kelurahan_op: Optional[int] = Query(None),
+) -> Response:
+    filters = []
+    if user_id and user_id.strip():
+        # user_id disimpan sudah di-strip saat create, sehingga index tetap terpakai.
+        filters.append(SpopRegistration.user_id == user_id.strip())
+    if status_filter and status_filter.strip():
+        filters.append(SpopRegistration.status == status_filter.strip())
+    if submitted_from:
+        filters.append(SpopRegistration.submitted_at >= datetime.combine(submitted_from, datetime.min.time()))
+    if submitted_to:
+        filters.append(
+            SpopRegistration.submitted_at < datetime.combine(submitted_to + timedelta(days=1), datetime.min.time())
         )
-        data.append(rec)
-
-    pages = (total + limit - 1) // limit if total else 0
+    for column, value in (
+        (SpopRegistration.provinsi_op, provinsi_op),
+        (SpopRegistration.kabupaten_op, kabupaten_op),
+        (SpopRegistration.kecamatan_op, kecamatan_op),
+        (SpopRegistration.kelurahan_op, kelurahan_op),
+    ):
+        if value is not None:
+            filters.append(column == value)
+
+    stmt = _registration_page_stmt().where(*filters).order_by(
+        SpopRegistration.submitted_at.desc(), SpopRegistration.id.desc()
+    )
+    if cursor:
+        cursor_at, cursor_id = _decode_request_cursor(cursor)
+        stmt = stmt.where(
+            or_(
+                SpopRegistration.submitted_at < cursor_at,
+                and_(SpopRegistration.submitted_at == cursor_at, SpopRegistration.id < cursor_id),
+            )
+        )
+    else:
+        stmt = stmt.offset((page - 1) * limit)
+
+    total: Optional[int] = None
+    if include_total:
+        count_stmt = select(func.count()).select_from(SpopRegistration).where(*filters)
+        total = (await session.execute(count_stmt)).scalar_one()
+
+    rows = (await session.execute(stmt.limit(limit + 1))).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    await region_cache.ensure_loaded(session)
+    data: List[schemas.RequestRecord] = [_joined_row_to_record(row) for row in rows]
+
+    next_cursor = None
+    if has_next and rows:
+        last: SpopRegistration = rows[-1][0]
+        next_cursor = _encode_request_cursor(last.submitted_at, last.id)
+
+    pages = None
+    if total is not None:
+        pages = (total + limit - 1) // limit if total else 0
     meta = schemas.RequestPagination(
         total=total,
-        page=page,
+        page=1 if cursor else page,
         limit=limit,
         pages=pages,
-        has_next=page < pages if pages else False,
-        has_prev=page > 1,
+        has_next=has_next,
+        has_prev=bool(cursor) or page > 1,
+        next_cursor=next_cursor,
+    )
+    response = schemas.RequestListResponse.model_construct(
+        success=True, message="Daftar permohonan berhasil diambil", data=data, meta=meta
     )
-    return schemas.RequestListResponse(message="Daftar permohonan berhasil diambil", data=data, meta=meta)
+    return json_response(REQUEST_LIST_ADAPTER, response)
 
 @router.get("/requests/{request_id}", response_model=schemas.RequestResponse)
-@router.get("/{request_id}", response_model=schemas.RequestResponse, include_in_schema=False)
 async def get_registration_request(
     request_id: str,
     session: SessionDep,
@@ -893,6 +1101,26 @@ async def get_registration_request(
     return schemas.RequestResponse(message="Detail permohonan berhasil diambil", data=record)
 
 
+@router.api_route("/requests/{request_id}/files/{field}", methods=["GET", "HEAD"], response_class=Response)
+async def download_registration_file(
+    request_id: str,
+    field: str,
+    request: Request,
+    session: SessionDep,
+    current_user: CurrentUserDep,
+    variant: Optional[Literal["review", "thumb"]] = Query(None),
+) -> Response:
+    if field not in REGISTRATION_FILE_FIELDS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Jenis berkas tidak dikenal")
+    stmt = select(getattr(SpopRegistration, field)).where(SpopRegistration.id == request_id)
+    relative = (await session.execute(stmt)).scalar_one_or_none()
+    if variant and field in IMAGE_FIELDS:
+        # Rendition belum jadi (atau bukan gambar): kirim berkas asli.
+        relative = await run_in_threadpool(existing_variant, relative, variant) or relative
+    path = resolve_upload(relative)
+    return build_file_response(request, path, download_name=f"{field}{path.suffix}")
+
+
 @router.patch("/requests/{request_id}", response_model=schemas.RequestResponse)
 @router.put("/requests/{request_id}", response_model=schemas.RequestResponse, include_in_schema=False)
 @router.post("/requests/{request_id}", response_model=schemas.RequestResponse, include_in_schema=False)
@@ -911,6 +1139,7 @@ async def update_registration_request(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Permohonan tidak ditemukan")
 
     updates = payload.model_dump(exclude_unset=True, exclude_none=True)
+    previous_nop = registration.nop
     for key, value in updates.items():
         if isinstance(value, str):
             value = value.strip()
@@ -919,7 +1148,11 @@ async def update_registration_request(
         else:
             setattr(registration, key, value)
 
+    await sppt_summary.refresh(session, [previous_nop, registration.nop])
     await session.commit()
+    audit_buffer.record(
+        registration.nop, "registration", "update", entity_id=registration.id, actor_id=current_user.id, changes=updates
+    )
     await session.refresh(registration)
     codes = (await _build_code_maps(session, [registration])).get(registration.id, {})
     subj_codes = (await _build_subject_maps(session, [registration])).get(registration.id, {})
@@ -943,6 +1176,7 @@ async def update_registration_request(
 async def update_registration_staff_fields(
     request_id: str,
     request: Request,
+    background_tasks: BackgroundTasks,
     session: SessionDep,
     current_user: CurrentUserDep,
 ) -> schemas.RequestResponse:
@@ -950,7 +1184,8 @@ async def update_registration_staff_fields(
     if registration is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Permohonan tidak ditemukan")
 
-    payload = await _load_payload_with_files(request, schemas.StaffUpdatePayload, ["foto_objek_pajak"], UPLOAD_ROOT)
+    previous_foto = registration.foto_objek_pajak
+    payload = await _load_payload_with_files(request, session, schemas.StaffUpdatePayload, ["foto_objek_pajak"], UPLOAD_ROOT)
     updates = payload.model_dump(exclude_unset=True, exclude_none=True)
     for key, value in updates.items():
         if isinstance(value, str):
@@ -962,7 +1197,16 @@ async def update_registration_staff_fields(
                 value = None
         setattr(registration, key, value)
 
+    if registration.foto_objek_pajak != previous_foto:
+        await retain_paths(session, [registration.foto_objek_pajak])
+        await release_paths(session, [previous_foto])
+        background_tasks.add_task(build_renditions, registration.foto_objek_pajak)
+        background_tasks.add_task(purge_unreferenced)
+    await sppt_summary.refresh(session, [registration.nop])
     await session.commit()
+    audit_buffer.record(
+        registration.nop, "registration", "staff_update", entity_id=registration.id, actor_id=current_user.id, changes=updates
+    )
     await session.refresh(registration)
     codes = (await _build_code_maps(session, [registration])).get(registration.id, {})
     subj_codes = (await _build_subject_maps(session, [registration])).get(registration.id, {})
@@ -985,19 +1229,50 @@ async def update_registration_staff_fields(
 @router.delete("/{request_id}", response_model=schemas.RequestDeleteResponse, include_in_schema=False)
 async def delete_registration_request(
     request_id: str,
+    background_tasks: BackgroundTasks,
     session: SessionDep,
     current_user: CurrentUserDep,
 ) -> schemas.RequestDeleteResponse:
     registration = await session.get(SpopRegistration, request_id)
     if registration is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Permohonan tidak ditemukan")
+    nop_parts = (registration.nop or "").split(".")
+    files = _registration_files(registration)
     await session.delete(registration)
+    if len(nop_parts) == len(NOP_SEGMENTS):
+        await release_no_urut(session, BlokKey(*nop_parts[:5]), nop_parts[5])
+    await release_paths(session, files)
+    await sppt_summary.refresh(session, [registration.nop])
     await session.commit()
+    audit_buffer.record(registration.nop, "registration", "delete", entity_id=request_id, actor_id=current_user.id)
+    background_tasks.add_task(purge_unreferenced)
     return schemas.RequestDeleteResponse(message="Permohonan berhasil dihapus")
 
 
 
 
+def _spop_detail_stmt():
+    return (
+        select(
+            Spop,
+            DatSubjekPajak,
+            RefKelasBangunanNjop,
+            RefKelasBumiNjop,
+        )
+        .outerjoin(DatSubjekPajak, DatSubjekPajak.subjek_pajak_key == Spop.subjek_pajak_key)
+        .outerjoin(RefKelasBangunanNjop, RefKelasBangunanNjop.id == Spop.kelas_bangunan_njop)
+        .outerjoin(RefKelasBumiNjop, RefKelasBumiNjop.id == Spop.kelas_bumi_njop)
+    )
+
+
+def _spop_detail_row(row):
+    spop, subjek, kelas_bangunan, kelas_bumi = row
+    nm_propinsi, nm_dati2, nm_kecamatan, nm_kelurahan = region_cache.legacy_names(
+        spop.kd_propinsi, spop.kd_dati2, spop.kd_kecamatan, spop.kd_kelurahan
+    )
+    return spop, subjek, nm_propinsi, nm_dati2, nm_kecamatan, nm_kelurahan, kelas_bangunan, kelas_bumi
+
+
 async def _fetch_spop_detail(
     session: SessionDep,
     keys: Dict[str, str],
@@ -1013,64 +1288,41 @@ async def _fetch_spop_detail(
         Optional[RefKelasBumiNjop],
     ]
 ]:
-    prop_alias = aliased(RefPropinsi)
-    dati2_alias = aliased(RefDati2)
-    kec_alias = aliased(RefKecamatan)
-    kel_alias = aliased(RefKelurahan)
-
-    stmt = (
-        select(
-            Spop,
-            DatSubjekPajak,
-            prop_alias.nm_propinsi,
-            dati2_alias.nm_dati2,
-            kec_alias.nm_kecamatan,
-            kel_alias.nm_kelurahan,
-            RefKelasBangunanNjop,
-            RefKelasBumiNjop,
-        )
-        .outerjoin(DatSubjekPajak, _trim(DatSubjekPajak.subjek_pajak_id) == _trim(Spop.subjek_pajak_id))
-        .outerjoin(prop_alias, prop_alias.kd_propinsi == func.substr(Spop.kd_propinsi, 1, 2))
-        .outerjoin(
-            dati2_alias,
-            and_(
-                dati2_alias.kd_propinsi == func.substr(Spop.kd_propinsi, 1, 2),
-                dati2_alias.kd_dati2 == func.substr(Spop.kd_dati2, 1, 2),
-            ),
-        )
-        .outerjoin(
-            kec_alias,
-            and_(
-                kec_alias.kd_propinsi == func.substr(Spop.kd_propinsi, 1, 2),
-                kec_alias.kd_dati2 == func.substr(Spop.kd_dati2, 1, 2),
-                kec_alias.kd_kecamatan == func.substr(Spop.kd_kecamatan, 1, 3),
-            ),
-        )
-        .outerjoin(
-            kel_alias,
-            and_(
-                kel_alias.kd_propinsi == func.substr(Spop.kd_propinsi, 1, 2),
-                kel_alias.kd_dati2 == func.substr(Spop.kd_dati2, 1, 2),
-                kel_alias.kd_kecamatan == func.substr(Spop.kd_kecamatan, 1, 3),
-                kel_alias.kd_kelurahan == func.substr(Spop.kd_kelurahan, 1, 3),
-            ),
-        )
-        .outerjoin(RefKelasBangunanNjop, RefKelasBangunanNjop.id == Spop.kelas_bangunan_njop)
-        .outerjoin(RefKelasBumiNjop, RefKelasBumiNjop.id == Spop.kelas_bumi_njop)
-        .where(
-            and_(
-                Spop.kd_propinsi == keys["kd_propinsi"],
-                Spop.kd_dati2 == keys["kd_dati2"],
-                Spop.kd_kecamatan == keys["kd_kecamatan"],
-                Spop.kd_kelurahan == keys["kd_kelurahan"],
-                Spop.kd_blok == keys["kd_blok"],
-                Spop.no_urut == keys["no_urut"],
-                Spop.kd_jns_op == keys["kd_jns_op"],
-            )
+    stmt = _spop_detail_stmt().where(
+        and_(
+            Spop.kd_propinsi == keys["kd_propinsi"],
+            Spop.kd_dati2 == keys["kd_dati2"],
+            Spop.kd_kecamatan == keys["kd_kecamatan"],
+            Spop.kd_kelurahan == keys["kd_kelurahan"],
+            Spop.kd_blok == keys["kd_blok"],
+            Spop.no_urut == keys["no_urut"],
+            Spop.kd_jns_op == keys["kd_jns_op"],
         )
     )
+    await region_cache.ensure_loaded(session)
     result = await session.execute(stmt)
-    return result.one_or_none()
+    row = result.one_or_none()
+    if row is None:
+        return None
+    return _spop_detail_row(row)
+
+
+async def _fetch_spop_details(session: SessionDep, key_list: List[Dict[str, str]]) -> Dict[str, tuple]:
+    """Detail banyak SPOP dalam satu query tuple-IN; hasil dikunci NOP 18 digit."""
+
+    if not key_list:
+        return {}
+    stmt = _spop_detail_stmt().where(
+        _spop_key_in({tuple(keys[key] for key, _ in NOP_SEGMENTS) for keys in key_list})
+    )
+    await region_cache.ensure_loaded(session)
+    rows = (await session.execute(stmt)).all()
+    details: Dict[str, tuple] = {}
+    for row in rows:
+        spop = row[0]
+        keys = {key: _normalize_code(getattr(spop, key), length) or "" for key, length in NOP_SEGMENTS}
+        details[_compose_nop(keys)] = _spop_detail_row(row)
+    return details
 
 
 def _subjek_to_schema(subjek: Optional[DatSubjekPajak]) -> Optional[schemas.SubjekPajakInfo]:
@@ -1096,14 +1348,16 @@ def _njop_class_to_schema(ref, fallback_id: Optional[int] = None) -> Optional[sc
     if ref is None and fallback_id is None:
         return None
     if ref is None:
-        return schemas.NjopClass(id=fallback_id, kelas=None, njop=None)
+        return schemas.NjopClass.model_construct(id=fallback_id, kelas=None, njop=None)
     kelas_val = None
     if ref.kelas is not None:
         try:
             kelas_val = int(ref.kelas)
         except (TypeError, ValueError):
             kelas_val = None
-    return schemas.NjopClass(id=ref.id, kelas=kelas_val, njop=int(ref.njop) if ref.njop is not None else None)
+    return schemas.NjopClass.model_construct(
+        id=ref.id, kelas=kelas_val, njop=int(ref.njop) if ref.njop is not None else None
+    )
 
 
 def _spop_to_detail(
@@ -1185,27 +1439,136 @@ async def _get_detail_or_404(session: SessionDep, keys: Dict[str, str]) -> schem
     return _spop_to_detail(row)
 
 
-@router.get("/legacy", response_model=schemas.SpopSearchResponse, include_in_schema=False)
-@router.get("/legacy/", response_model=schemas.SpopSearchResponse, include_in_schema=False)
-async def list_spop(
-    *,
+def _spop_key_in(candidates):
+    columns = tuple_(
+        Spop.kd_propinsi,
+        Spop.kd_dati2,
+        Spop.kd_kecamatan,
+        Spop.kd_kelurahan,
+        Spop.kd_blok,
+        Spop.no_urut,
+        Spop.kd_jns_op,
+    )
+    return columns.in_(sorted(candidates))
+
+
+def _index_spop_row(detail_row) -> None:
+    spop, subjek = detail_row[0], detail_row[1]
+    spop_search_index.upsert(spop_key(spop), subjek.nm_wp if subjek else None, spop.jalan_op, spop.subjek_pajak_id)
+
+
+def _text_candidates(nm_wp: Optional[str], jalan_op: Optional[str]) -> Optional[set]:
+    """Irisan kandidat index untuk filter teks (AND); None bila tidak ada yang bisa dipersempit."""
+
+    result: Optional[set] = None
+    for field, term in (("nm_wp", nm_wp), ("jalan_op", jalan_op)):
+        if not term:
+            continue
+        spop_search_index.schedule_refresh()
+        found = spop_search_index.candidates((field,), term)
+        if found is not None:
+            result = found if result is None else result & found
+    return result
+
+
+@router.post("/nop/batch", response_model=schemas.SpopBatchResponse)
+async def get_spop_batch(
+    payload: schemas.SpopBatchPayload,
     session: SessionDep,
     current_user: CurrentUserDep,
-    nop: Optional[str] = Query(None),
-    kd_propinsi: Optional[str] = Query(None),
-    kd_dati2: Optional[str] = Query(None),
-    kd_kecamatan: Optional[str] = Query(None),
-    kd_kelurahan: Optional[str] = Query(None),
-    kd_blok: Optional[str] = Query(None),
-    kd_jns_op: Optional[str] = Query(None),
-    user_id: Optional[str] = Query(None),
-    nm_wp: Optional[str] = Query(None),
-    jalan_op: Optional[str] = Query(None),
-    limit: int = Query(10, ge=1, le=200),
-    page: int = Query(1, ge=1),
-    request_url: str = Query(None, include_in_schema=False),
-) -> schemas.SpopSearchResponse:
-    offset = (page - 1) * limit
+) -> schemas.SpopBatchResponse:
+    requested: Dict[str, Dict[str, str]] = {}
+    invalid: List[str] = []
+    for raw in payload.nops:
+        digits = "".join(ch for ch in raw if ch.isdigit())
+        if len(digits) != 18:
+            invalid.append(raw)
+            continue
+        requested.setdefault(digits, _parse_nop(digits))
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"NOP tidak valid: {', '.join(invalid[:20])}",
+        )
+
+    details = await _fetch_spop_details(session, list(requested.values()))
+    data = schemas.SpopBatchData(
+        items={nop: _spop_to_detail(details[nop]) for nop in requested if nop in details},
+        not_found=[nop for nop in requested if nop not in details],
+    )
+    return schemas.SpopBatchResponse(message="Detail SPOP berhasil diambil", data=data)
+
+
+def _nop_prefix_filters(digits: str) -> list:
+    filters = []
+    cursor = 0
+    for key, width in NOP_SEGMENTS:
+        segment = digits[cursor : cursor + width]
+        if not segment:
+            break
+        column = getattr(Spop, key)
+        filters.append(column == segment if len(segment) == width else column.like(f"{segment}%"))
+        cursor += width
+    return filters
+
+
+async def _suggest_from_db(session: SessionDep, q: str, limit: int) -> List[schemas.SpopSuggestItem]:
+    """Saran langsung dari MySQL selama index belum selesai dibangun (nama: prefix nama utuh saja)."""
+
+    needle = " ".join(normalize_text(q).split())
+    if not needle:
+        return []
+    key_columns = [getattr(Spop, key) for key, _ in NOP_SEGMENTS]
+    stmt = select(*key_columns, DatSubjekPajak.nm_wp, Spop.jalan_op).outerjoin(
+        DatSubjekPajak, DatSubjekPajak.subjek_pajak_key == Spop.subjek_pajak_key
+    )
+    if is_nop_query(needle):
+        stmt = stmt.where(*_nop_prefix_filters(nop_digits(needle))).order_by(*key_columns)
+    else:
+        stmt = stmt.where(func.upper(DatSubjekPajak.nm_wp).like(f"{needle}%")).order_by(DatSubjekPajak.nm_wp)
+    rows = (await session.execute(stmt.limit(limit))).all()
+    return [
+        schemas.SpopSuggestItem(
+            nop="".join((part or "").strip() for part in row[: len(NOP_SEGMENTS)]),
+            nama_wp=normalize_text(row.nm_wp) or None,
+            jalan_op=normalize_text(row.jalan_op) or None,
+        )
+        for row in rows
+    ]
+
+
+@router.get("/suggest", response_model=schemas.SpopSuggestResponse)
+async def suggest_spop(
+    session: SessionDep,
+    current_user: CurrentUserDep,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+) -> schemas.SpopSuggestResponse:
+    spop_search_index.schedule_refresh()
+    docs = spop_search_index.suggest(q, limit)
+    if docs is None:
+        items = await _suggest_from_db(session, q, limit)
+    else:
+        items = [
+            schemas.SpopSuggestItem(nop=doc.values[0], nama_wp=doc.values[1] or None, jalan_op=doc.values[2] or None)
+            for doc in docs
+        ]
+    return schemas.SpopSuggestResponse(message="Saran SPOP berhasil diambil", data=items)
+
+
+def _legacy_filters(
+    *,
+    nop: Optional[str],
+    kd_propinsi: Optional[str],
+    kd_dati2: Optional[str],
+    kd_kecamatan: Optional[str],
+    kd_kelurahan: Optional[str],
+    kd_blok: Optional[str],
+    kd_jns_op: Optional[str],
+    user_id: Optional[str],
+    nm_wp: Optional[str],
+    jalan_op: Optional[str],
+) -> list:
     filters = []
     if nop:
         keys = _parse_nop(nop)
@@ -1239,13 +1602,53 @@ async def list_spop(
             filters.append(Spop.kd_jns_op == normalized_jns)
 
     if nm_wp:
-        filters.append(func.lower(_trim(DatSubjekPajak.nm_wp)).like(f"%{nm_wp.lower()}%"))
+        filters.append(func.lower(DatSubjekPajak.nm_wp).like(f"%{nm_wp.lower()}%"))
     if jalan_op:
         filters.append(func.lower(Spop.jalan_op).like(f"%{jalan_op.lower()}%"))
+    # Index hanya mempersempit kunci; LIKE di atas tetap menyaring hasil akhirnya.
+    candidates = _text_candidates(nm_wp, jalan_op)
+    if candidates is not None:
+        filters.append(_spop_key_in(candidates))
     if user_id:
         filters.append(func.trim(Spop.user_id) == user_id.strip())
 
-    join_condition = _trim(DatSubjekPajak.subjek_pajak_id) == _trim(Spop.subjek_pajak_id)
+    return filters
+
+
+@router.get("/legacy", response_model=schemas.SpopSearchResponse, include_in_schema=False)
+@router.get("/legacy/", response_model=schemas.SpopSearchResponse, include_in_schema=False)
+async def list_spop(
+    *,
+    session: SessionDep,
+    current_user: CurrentUserDep,
+    nop: Optional[str] = Query(None),
+    kd_propinsi: Optional[str] = Query(None),
+    kd_dati2: Optional[str] = Query(None),
+    kd_kecamatan: Optional[str] = Query(None),
+    kd_kelurahan: Optional[str] = Query(None),
+    kd_blok: Optional[str] = Query(None),
+    kd_jns_op: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    nm_wp: Optional[str] = Query(None),
+    jalan_op: Optional[str] = Query(None),
+    limit: int = Query(10, ge=1, le=200),
+    page: int = Query(1, ge=1),
+    request_url: str = Query(None, include_in_schema=False),
+) -> schemas.SpopSearchResponse:
+    offset = (page - 1) * limit
+    filters = _legacy_filters(
+        nop=nop,
+        kd_propinsi=kd_propinsi,
+        kd_dati2=kd_dati2,
+        kd_kecamatan=kd_kecamatan,
+        kd_kelurahan=kd_kelurahan,
+        kd_blok=kd_blok,
+        kd_jns_op=kd_jns_op,
+        user_id=user_id,
+        nm_wp=nm_wp,
+        jalan_op=jalan_op,
+    )
+    join_condition = DatSubjekPajak.subjek_pajak_key == Spop.subjek_pajak_key
 
     count_stmt = select(func.count()).select_from(Spop).outerjoin(DatSubjekPajak, join_condition)
     if filters:
@@ -1336,6 +1739,109 @@ async def list_spop(
     return schemas.SpopSearchResponse(message="Daftar SPOP berhasil diambil", data=data)
 
 
+EXPORT_COLUMNS = ("nop", "nama_wp", "jalan_op", "jns_transaksi_op", "status", "no_formulir_spop")
+EXPORT_BATCH_SIZE = 1000
+
+
+def _export_record(row) -> Dict[str, Optional[str]]:
+    keys = {key: _normalize_code(row[index], length) or "" for index, (key, length) in enumerate(NOP_SEGMENTS)}
+    return {
+        "nop": _compose_nop(keys),
+        "nama_wp": row.nm_wp.strip() if row.nm_wp else None,
+        "jalan_op": row.jalan_op,
+        "jns_transaksi_op": row.jns_transaksi_op,
+        "status": _status_label(row.jns_transaksi_op),
+        "no_formulir_spop": row.no_formulir_spop,
+    }
+
+
+def _encode_export_rows(rows, export_format: str) -> str:
+    records = [_export_record(row) for row in rows]
+    if export_format == "ndjson":
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, lineterminator="\n")
+    writer.writerows(records)
+    return buffer.getvalue()
+
+
+async def _stream_spop_export(filters: list, export_format: str):
+    if export_format == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\n"
+    stmt = (
+        select(
+            Spop.kd_propinsi,
+            Spop.kd_dati2,
+            Spop.kd_kecamatan,
+            Spop.kd_kelurahan,
+            Spop.kd_blok,
+            Spop.no_urut,
+            Spop.kd_jns_op,
+            Spop.jalan_op,
+            Spop.jns_transaksi_op,
+            Spop.no_formulir_spop,
+            DatSubjekPajak.nm_wp,
+        )
+        .outerjoin(DatSubjekPajak, DatSubjekPajak.subjek_pajak_key == Spop.subjek_pajak_key)
+        .order_by(
+            Spop.kd_propinsi,
+            Spop.kd_dati2,
+            Spop.kd_kecamatan,
+            Spop.kd_kelurahan,
+            Spop.kd_blok,
+            Spop.no_urut,
+            Spop.kd_jns_op,
+        )
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    if filters:
+        stmt = stmt.where(and_(*filters))
+    # Session dependency sudah ditutup saat body dikirim, jadi stream memakai session sendiri.
+    async with AsyncSessionFactory() as stream_session:
+        result = await stream_session.stream(stmt)
+        async for partition in result.partitions():
+            yield _encode_export_rows(partition, export_format)
+
+
+@router.get("/legacy/export", include_in_schema=False)
+async def export_spop(
+    *,
+    current_user: CurrentUserDep,
+    format: Literal["csv", "ndjson"] = Query("csv"),
+    nop: Optional[str] = Query(None),
+    kd_propinsi: Optional[str] = Query(None),
+    kd_dati2: Optional[str] = Query(None),
+    kd_kecamatan: Optional[str] = Query(None),
+    kd_kelurahan: Optional[str] = Query(None),
+    kd_blok: Optional[str] = Query(None),
+    kd_jns_op: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    nm_wp: Optional[str] = Query(None),
+    jalan_op: Optional[str] = Query(None),
+) -> StreamingResponse:
+    filters = _legacy_filters(
+        nop=nop,
+        kd_propinsi=kd_propinsi,
+        kd_dati2=kd_dati2,
+        kd_kecamatan=kd_kecamatan,
+        kd_kelurahan=kd_kelurahan,
+        kd_blok=kd_blok,
+        kd_jns_op=kd_jns_op,
+        user_id=user_id,
+        nm_wp=nm_wp,
+        jalan_op=jalan_op,
+    )
+    if format == "ndjson":
+        media_type, filename = "application/x-ndjson", "spop.ndjson"
+    else:
+        media_type, filename = "text/csv; charset=utf-8", "spop.csv"
+    return StreamingResponse(
+        _stream_spop_export(filters, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.post("", response_model=schemas.SpopMutationResponse, status_code=status.HTTP_201_CREATED, include_in_schema=False)
 @router.post("/", response_model=schemas.SpopMutationResponse, status_code=status.HTTP_201_CREATED)
 async def create_spop(
@@ -1356,24 +1862,10 @@ async def create_spop(
                 )
             keys[key] = normalized
 
-    existing_stmt = select(Spop).where(
-        and_(
-            Spop.kd_propinsi == keys["kd_propinsi"],
-            Spop.kd_dati2 == keys["kd_dati2"],
-            Spop.kd_kecamatan == keys["kd_kecamatan"],
-            Spop.kd_kelurahan == keys["kd_kelurahan"],
-            Spop.kd_blok == keys["kd_blok"],
-            Spop.no_urut == keys["no_urut"],
-            Spop.kd_jns_op == keys["kd_jns_op"],
-        )
-    )
-    exists = await session.execute(existing_stmt)
-    if exists.scalar_one_or_none():
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="SPOP sudah terdaftar")
-
     await _ensure_subjek_exists(session, payload.subjek_pajak_id)
+    await claim_no_urut(session, _blok_key(keys), keys["no_urut"])
 
-    no_formulir = await _generate_no_formulir(session)
+    no_formulir = await _generate_no_formulir()
 
     spop = Spop(
         kd_propinsi=keys["kd_propinsi"],
@@ -1423,12 +1915,23 @@ async def create_spop(
     )
 
     session.add(spop)
-    await session.commit()
+    try:
+        await session.commit()
+    except IntegrityError as exc:
+        await session.rollback()
+        if _is_duplicate_key(exc):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="SPOP sudah terdaftar")
+        raise
 
     detail_row = await _fetch_spop_detail(session, keys)
     if detail_row is None:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Gagal memuat data SPOP")
 
+    _index_spop_row(detail_row)
+    invalidate_esppt(_compose_nop(keys))
+    audit_buffer.record(
+        _compose_nop(keys), "spop", "create", actor_id=current_user.id, changes=payload.model_dump(exclude_none=True)
+    )
     detail = _spop_to_detail(detail_row)
     return schemas.SpopMutationResponse(message="SPOP berhasil ditambahkan", data=detail)
 
@@ -1485,23 +1988,32 @@ async def _apply_spop_updates(session: SessionDep, spop: Spop, updates: Dict[str
             setattr(spop, field, updates[field])
 
 
-async def _update_spop(session: SessionDep, keys: Dict[str, str], payload: schemas.SpopUpdatePayload) -> schemas.SpopDetail:
+async def _update_spop(
+    session: SessionDep, keys: Dict[str, str], payload: schemas.SpopUpdatePayload, actor_id: Optional[str] = None
+) -> schemas.SpopDetail:
     detail_row = await _fetch_spop_detail(session, keys)
     if detail_row is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SPOP tidak ditemukan")
 
     spop: Spop = detail_row[0]
     updates = payload.model_dump(exclude_unset=True)
+    changes = dict(updates)
     await _apply_spop_updates(session, spop, updates)
 
     await session.commit()
+    invalidate_esppt(_compose_nop(keys))
+    audit_buffer.record(_compose_nop(keys), "spop", "update", actor_id=actor_id, changes=changes)
 
     refreshed = await _fetch_spop_detail(session, keys)
+    _index_spop_row(refreshed)
     return _spop_to_detail(refreshed)
 
 
 async def _partial_update_spop(
-    session: SessionDep, keys: Dict[str, str], payload: schemas.SpopPartialUpdatePayload
+    session: SessionDep,
+    keys: Dict[str, str],
+    payload: schemas.SpopPartialUpdatePayload,
+    actor_id: Optional[str] = None,
 ) -> schemas.SpopDetail:
     detail_row = await _fetch_spop_detail(session, keys)
     if detail_row is None:
@@ -1509,11 +2021,15 @@ async def _partial_update_spop(
 
     spop: Spop = detail_row[0]
     updates = payload.model_dump(exclude_unset=True)
+    changes = dict(updates)
     await _apply_spop_updates(session, spop, updates)
 
     await session.commit()
+    invalidate_esppt(_compose_nop(keys))
+    audit_buffer.record(_compose_nop(keys), "spop", "update", actor_id=actor_id, changes=changes)
 
     refreshed = await _fetch_spop_detail(session, keys)
+    _index_spop_row(refreshed)
     return _spop_to_detail(refreshed)
 
 
@@ -1542,7 +2058,7 @@ async def update_spop_by_components(
         no_urut,
         kd_jns_op,
     )
-    detail = await _update_spop(session, keys, payload)
+    detail = await _update_spop(session, keys, payload, current_user.id)
     return schemas.SpopMutationResponse(message="SPOP berhasil diperbarui", data=detail)
 
 
@@ -1571,7 +2087,7 @@ async def partial_update_spop_by_components(
         no_urut,
         kd_jns_op,
     )
-    detail = await _partial_update_spop(session, keys, payload)
+    detail = await _partial_update_spop(session, keys, payload, current_user.id)
     return schemas.SpopMutationResponse(message="SPOP berhasil diperbarui", data=detail)
 
 
@@ -1583,7 +2099,7 @@ async def update_spop_by_nop(
     current_user: CurrentUserDep,
 ) -> schemas.SpopMutationResponse:
     keys = _parse_nop(nop)
-    detail = await _update_spop(session, keys, payload)
+    detail = await _update_spop(session, keys, payload, current_user.id)
     return schemas.SpopMutationResponse(message="SPOP berhasil diperbarui", data=detail)
 
 
@@ -1595,11 +2111,11 @@ async def partial_update_spop_by_nop(
     current_user: CurrentUserDep,
 ) -> schemas.SpopMutationResponse:
     keys = _parse_nop(nop)
-    detail = await _partial_update_spop(session, keys, payload)
+    detail = await _partial_update_spop(session, keys, payload, current_user.id)
     return schemas.SpopMutationResponse(message="SPOP berhasil diperbarui", data=detail)
 
 
-async def _delete_spop(session: SessionDep, keys: Dict[str, str]) -> None:
+async def _delete_spop(session: SessionDep, keys: Dict[str, str], actor_id: Optional[str] = None) -> None:
     stmt = select(Spop).where(
         and_(
             Spop.kd_propinsi == keys["kd_propinsi"],
@@ -1616,12 +2132,17 @@ async def _delete_spop(session: SessionDep, keys: Dict[str, str]) -> None:
     if spop is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SPOP tidak ditemukan")
 
+    key = spop_key(spop)
     try:
         await session.delete(spop)
+        await release_no_urut(session, _blok_key(keys), keys["no_urut"])
         await session.commit()
     except IntegrityError:
         await session.rollback()
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="SPOP tidak dapat dihapus karena masih terhubung")
+    spop_search_index.remove(key)
+    invalidate_esppt(_compose_nop(keys))
+    audit_buffer.record(_compose_nop(keys), "spop", "delete", actor_id=actor_id)
 
 
 @router.delete(
@@ -1648,7 +2169,7 @@ async def delete_spop_by_components(
         no_urut,
         kd_jns_op,
     )
-    await _delete_spop(session, keys)
+    await _delete_spop(session, keys, current_user.id)
     return schemas.SpopDeleteResponse(message="SPOP berhasil dihapus")
 
 
@@ -1659,51 +2180,118 @@ async def delete_spop_by_nop(
     current_user: CurrentUserDep,
 ) -> schemas.SpopDeleteResponse:
     keys = _parse_nop(nop)
-    await _delete_spop(session, keys)
+    await _delete_spop(session, keys, current_user.id)
     return schemas.SpopDeleteResponse(message="SPOP berhasil dihapus")
 
 
-async def _get_history(session: SessionDep, keys: Dict[str, str]) -> List[schemas.RiwayatEntry]:
-    stmt = select(Spop).where(
-        and_(
-            Spop.kd_propinsi == keys["kd_propinsi"],
-            Spop.kd_dati2 == keys["kd_dati2"],
-            Spop.kd_kecamatan == keys["kd_kecamatan"],
-            Spop.kd_kelurahan == keys["kd_kelurahan"],
-            Spop.kd_blok == keys["kd_blok"],
-            Spop.no_urut == keys["no_urut"],
-            Spop.kd_jns_op == keys["kd_jns_op"],
-        )
-    )
-    result = await session.execute(stmt)
-    spop = result.scalar_one_or_none()
-    if spop is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SPOP tidak ditemukan")
+RIWAYAT_LABELS = {
+    ("spop", "create"): "SPOP dibuat",
+    ("spop", "update"): "SPOP diperbarui",
+    ("spop", "delete"): "SPOP dihapus",
+    ("registration", "create"): "Permohonan diajukan",
+    ("registration", "import"): "Permohonan diimpor",
+    ("registration", "update"): "Permohonan diperbarui",
+    ("registration", "staff_update"): "Data petugas permohonan diperbarui",
+    ("registration", "delete"): "Permohonan dihapus",
+    ("lspop", "create"): "Lampiran SPOP dibuat",
+    ("lspop", "update"): "Lampiran SPOP diperbarui",
+    ("lspop", "staff_update"): "Data petugas LSPOP diperbarui",
+    ("lspop", "delete"): "Lampiran SPOP dihapus",
+}
+
+
+def _legacy_history(spop: Spop) -> List[schemas.RiwayatEntry]:
+    """Riwayat dari kolom tanggal `spop` untuk data yang ada sebelum log kejadian."""
 
     entries: List[schemas.RiwayatEntry] = []
     if spop.tgl_pendataan_op:
         entries.append(
             schemas.RiwayatEntry(
                 aktivitas="Pendataan",
-                tanggal=spop.tgl_pendataan_op,
+                tanggal=datetime.combine(spop.tgl_pendataan_op, datetime.min.time()),
                 petugas=spop.nm_pendataan_op,
                 nip=spop.nip_pendata,
+                sumber="spop",
             )
         )
     if spop.tgl_pemeriksaan_op:
         entries.append(
             schemas.RiwayatEntry(
                 aktivitas="Pemeriksaan",
-                tanggal=spop.tgl_pemeriksaan_op,
+                tanggal=datetime.combine(spop.tgl_pemeriksaan_op, datetime.min.time()),
                 petugas=spop.nm_pemeriksaan_op,
                 nip=spop.nip_pemeriksa_op,
+                sumber="spop",
             )
         )
-
     entries.sort(key=lambda item: item.tanggal)
     return entries
 
 
+async def _get_history(
+    session: SessionDep, keys: Dict[str, str], cursor: Optional[str], limit: int
+) -> Tuple[List[schemas.RiwayatEntry], Optional[str]]:
+    nop = _compose_nop(keys)
+    stmt = select(SpopEvent).where(SpopEvent.nop == nop)
+    if cursor:
+        occurred_at, event_id = _decode_request_cursor(cursor)
+        if not event_id.isdigit():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor tidak valid")
+        stmt = stmt.where(
+            or_(
+                SpopEvent.occurred_at > occurred_at,
+                and_(SpopEvent.occurred_at == occurred_at, SpopEvent.id > int(event_id)),
+            )
+        )
+    stmt = stmt.order_by(SpopEvent.occurred_at, SpopEvent.id).limit(limit + 1)
+    events = (await session.execute(stmt)).scalars().all()
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = _encode_request_cursor(events[-1].occurred_at, str(events[-1].id))
+
+    entries: List[schemas.RiwayatEntry] = []
+    if not cursor:
+        spop = (
+            await session.execute(
+                select(Spop).where(
+                    and_(
+                        Spop.kd_propinsi == keys["kd_propinsi"],
+                        Spop.kd_dati2 == keys["kd_dati2"],
+                        Spop.kd_kecamatan == keys["kd_kecamatan"],
+                        Spop.kd_kelurahan == keys["kd_kelurahan"],
+                        Spop.kd_blok == keys["kd_blok"],
+                        Spop.no_urut == keys["no_urut"],
+                        Spop.kd_jns_op == keys["kd_jns_op"],
+                    )
+                )
+            )
+        ).scalar_one_or_none()
+        if spop is None and not events:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SPOP tidak ditemukan")
+        if spop is not None:
+            entries.extend(_legacy_history(spop))
+
+    actor_ids = {event.actor_id for event in events if event.actor_id}
+    actor_names: Dict[str, Optional[str]] = {}
+    if actor_ids:
+        rows = await session.execute(select(User.id, User.nama).where(User.id.in_(actor_ids)))
+        actor_names = {row.id: row.nama for row in rows}
+    for event in events:
+        entries.append(
+            schemas.RiwayatEntry(
+                aktivitas=RIWAYAT_LABELS.get((event.entity, event.action), f"{event.entity} {event.action}"),
+                tanggal=event.occurred_at,
+                petugas=actor_names.get(event.actor_id) or event.actor_id,
+                nip=None,
+                sumber=event.entity,
+                aksi=event.action,
+                perubahan=event.changes,
+            )
+        )
+    return entries, next_cursor
+
+
 @router.get("/riwayat", response_model=schemas.RiwayatResponse)
 async def get_spop_history(
     session: SessionDep,
@@ -1716,6 +2304,8 @@ async def get_spop_history(
     kd_blok: Optional[str] = Query(None),
     no_urut: Optional[str] = Query(None),
     kd_jns_op: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
 ) -> schemas.RiwayatResponse:
     if nop:
         keys = _parse_nop(nop)
@@ -1744,5 +2334,17 @@ async def get_spop_history(
             kd_jns_op,
         )
 
-    items = await _get_history(session, keys)
-    return schemas.RiwayatResponse(message="Riwayat SPOP berhasil diambil", items=items)
+    items, next_cursor = await _get_history(session, keys, cursor, limit)
+    meta = schemas.RiwayatMeta(limit=limit, has_next=next_cursor is not None, next_cursor=next_cursor)
+    return schemas.RiwayatResponse(message="Riwayat SPOP berhasil diambil", items=items, meta=meta)
+
+
+# Alias lama `GET /spop/{request_id}` didaftarkan paling akhir supaya tidak
+# menutupi rute statis seperti `/legacy` dan `/riwayat`.
+router.add_api_route(
+    "/{request_id}",
+    get_registration_request,
+    methods=["GET"],
+    response_model=schemas.RequestResponse,
+    include_in_schema=False,
+)
@@ -1,9 +1,9 @@
 from __future__ import annotations
 
 from datetime import date, datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel, ConfigDict, Field, model_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 
 
 def _strip_or_none(value: Optional[str]) -> Optional[str]:
@@ -46,6 +46,18 @@ class SpopSearchResponse(BaseModel):
     data: SpopSearchData
 
 
+class SpopSuggestItem(BaseModel):
+    nop: str
+    nama_wp: Optional[str]
+    jalan_op: Optional[str]
+
+
+class SpopSuggestResponse(BaseModel):
+    success: bool = True
+    message: str
+    data: List[SpopSuggestItem]
+
+
 class SpopBasePayload(BaseModel):
     subjek_pajak_id: str
     jns_transaksi_op: str = Field(min_length=1, max_length=1)
@@ -169,6 +181,24 @@ class SpopPartialUpdatePayload(BaseModel):
         return self
 
 
+SPOP_BATCH_MAX = 500
+
+
+class SpopBatchPayload(BaseModel):
+    nops: List[str] = Field(min_length=1, max_length=SPOP_BATCH_MAX)
+
+
+class SpopBatchData(BaseModel):
+    items: Dict[str, SpopDetail]
+    not_found: List[str]
+
+
+class SpopBatchResponse(BaseModel):
+    success: bool = True
+    message: str
+    data: SpopBatchData
+
+
 class SpopDeleteResponse(BaseModel):
     success: bool = True
     message: str
@@ -267,15 +297,25 @@ class SpopMutationResponse(BaseModel):
 
 class RiwayatEntry(BaseModel):
     aktivitas: str
-    tanggal: date
+    tanggal: datetime
     petugas: Optional[str]
     nip: Optional[str]
+    sumber: Optional[str] = None
+    aksi: Optional[str] = None
+    perubahan: Optional[dict] = None
+
+
+class RiwayatMeta(BaseModel):
+    limit: int
+    has_next: bool
+    next_cursor: Optional[str] = None
 
 
 class RiwayatResponse(BaseModel):
     success: bool = True
     message: str
     items: List[RiwayatEntry]
+    meta: Optional[RiwayatMeta] = None
 
 
 class RequestCreatePayload(BaseModel):
@@ -290,7 +330,7 @@ class RequestCreatePayload(BaseModel):
     no_telp_awal: str = Field(max_length=30)
 
     blok_op: str
-    no_urut_op: str
+    no_urut_op: Optional[str] = None
     kode_khusus: Optional[int] = None
 
     nama_lengkap: str
@@ -332,6 +372,60 @@ class RequestCreatePayload(BaseModel):
         return self
 
 
+class RequestImportRow(RequestCreatePayload):
+    """Satu baris CSV impor massal; berkas boleh kosong (dilengkapi kemudian)."""
+
+    file_ktp: str = ""
+    file_sertifikat: str = ""
+    file_sppt_tetangga: str = ""
+    file_foto_objek: str = ""
+
+    @field_validator(
+        "kode_khusus",
+        "kelas_bangunan_njop",
+        "kelas_bumi_njop",
+        "npwp",
+        "no_urut_op",
+        "file_surat_kuasa",
+        "file_pendukung",
+        "status",
+        "keterangan",
+        "user_id",
+        mode="before",
+    )
+    @classmethod
+    def blank_to_none(cls, value):
+        if isinstance(value, str) and not value.strip():
+            return None
+        return value
+
+
+class RequestImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class RequestImportCreated(BaseModel):
+    row: int
+    id: str
+    nop: str
+    no_formulir: str
+
+
+class RequestImportResult(BaseModel):
+    total_rows: int
+    imported: int
+    failed: int
+    created: List[RequestImportCreated]
+    errors: List[RequestImportError]
+
+
+class RequestImportResponse(BaseModel):
+    success: bool = True
+    message: str
+    data: RequestImportResult
+
+
 class RequestRecord(BaseModel):
     id: str
     submitted_at: datetime
@@ -377,11 +471,15 @@ class RequestRecord(BaseModel):
     file_sertifikat: str
     file_sppt_tetangga: str
     file_foto_objek: str
+    file_foto_objek_review: Optional[str] = None
+    file_foto_objek_thumb: Optional[str] = None
     file_surat_kuasa: Optional[str] = None
     file_pendukung: Optional[str] = None
     user_id: Optional[str] = None
     tanggal_pelaksanaan: Optional[datetime] = None
     foto_objek_pajak: Optional[str] = None
+    foto_objek_pajak_review: Optional[str] = None
+    foto_objek_pajak_thumb: Optional[str] = None
     nama_petugas: Optional[str] = None
     nip: Optional[str] = None
     status: Optional[str] = None
@@ -395,12 +493,13 @@ class RequestResponse(BaseModel):
 
 
 class RequestPagination(BaseModel):
-    total: int
+    total: Optional[int] = None
     page: int
     limit: int
-    pages: int
+    pages: Optional[int] = None
     has_next: bool
     has_prev: bool
+    next_cursor: Optional[str] = None
 
 
 class RequestListResponse(BaseModel):
@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import AsyncSessionFactory
+from app.modules.spop.models import DatSubjekPajak, Spop
+
+SpopKey = Tuple[str, str, str, str, str, str, str]
+
+FIELDS = ("nop", "nm_wp", "jalan_op", "subjek_pajak_id")
+GRAM = 3
+LOAD_PARTITION = 5000
+
+logger = logging.getLogger(__name__)
+
+
+class SpopDoc(NamedTuple):
+    key: SpopKey
+    values: Tuple[str, str, str, str]  # urutan FIELDS
+
+
+def normalize_text(value: Optional[str]) -> str:
+    return (value or "").strip().upper()
+
+
+def _nop_text(key: Sequence[str]) -> str:
+    return "".join((part or "").strip() for part in key)
+
+
+def _name_entries(name: str) -> List[str]:
+    """Kunci prefix nama: nama utuh + potongan mulai tiap kata berikutnya."""
+
+    words = name.split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def _grams(value: str) -> Set[str]:
+    return {value[i : i + GRAM] for i in range(len(value) - GRAM + 1)}
+
+
+def spop_key(spop) -> SpopKey:
+    return (
+        spop.kd_propinsi,
+        spop.kd_dati2,
+        spop.kd_kecamatan,
+        spop.kd_kelurahan,
+        spop.kd_blok,
+        spop.no_urut,
+        spop.kd_jns_op,
+    )
+
+
+class _Snapshot:
+    """Isi index: dokumen, posting list trigram per field, dan daftar terurut untuk typeahead.
+
+    Nilai non-ASCII tidak dipecah jadi trigram (collation MySQL bisa menyamakan
+    huruf beraksen dengan huruf biasa); dokumennya selalu ikut jadi kandidat field itu.
+    """
+
+    def __init__(self) -> None:
+        self.docs: List[Optional[SpopDoc]] = []
+        self.ids: Dict[SpopKey, int] = {}
+        self.postings: Dict[str, Dict[str, array]] = {field: {} for field in FIELDS}
+        self.unindexed: Dict[str, Set[int]] = {field: set() for field in FIELDS}
+        self.nop_prefixes: List[Tuple[str, int]] = []
+        self.name_prefixes: List[Tuple[str, int]] = []
+        self.sorted = False
+
+    def _prefix_entries(self, doc_id: int, doc: SpopDoc) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        return [(doc.values[0], doc_id)], [(entry, doc_id) for entry in _name_entries(doc.values[1])]
+
+    def _drop_prefixes(self, doc_id: int) -> None:
+        doc = self.docs[doc_id]
+        if doc is None or not self.sorted:
+            return
+        nops, names = self._prefix_entries(doc_id, doc)
+        for target, entries in ((self.nop_prefixes, nops), (self.name_prefixes, names)):
+            for entry in entries:
+                position = bisect_left(target, entry)
+                if position < len(target) and target[position] == entry:
+                    del target[position]
+
+    def add(
+        self, key: SpopKey, nm_wp: Optional[str], jalan_op: Optional[str], subjek_pajak_id: Optional[str]
+    ) -> None:
+        old = self.ids.get(key)
+        if old is not None:
+            # Posting lama tidak dibongkar; dokumen lama cukup ditandai mati (tombstone).
+            self._drop(old)
+        doc_id = len(self.docs)
+        values = (_nop_text(key), normalize_text(nm_wp), normalize_text(jalan_op), normalize_text(subjek_pajak_id))
+        doc = SpopDoc(key, values)
+        self.docs.append(doc)
+        self.ids[key] = doc_id
+        nops, names = self._prefix_entries(doc_id, doc)
+        if self.sorted:
+            for entry in nops:
+                insort(self.nop_prefixes, entry)
+            for entry in names:
+                insort(self.name_prefixes, entry)
+        else:
+            self.nop_prefixes.extend(nops)
+            self.name_prefixes.extend(names)
+        for field, value in zip(FIELDS, values):
+            if not value.isascii():
+                self.unindexed[field].add(doc_id)
+                continue
+            postings = self.postings[field]
+            for gram in _grams(value):
+                bucket = postings.get(gram)
+                if bucket is None:
+                    bucket = postings[gram] = array("I")
+                bucket.append(doc_id)
+
+    def _drop(self, doc_id: int) -> None:
+        self._drop_prefixes(doc_id)
+        for unindexed in self.unindexed.values():
+            unindexed.discard(doc_id)
+        self.docs[doc_id] = None
+
+    def remove(self, key: SpopKey) -> None:
+        doc_id = self.ids.pop(key, None)
+        if doc_id is not None:
+            self._drop(doc_id)
+
+    def add_rows(self, rows: Iterable) -> None:
+        for row in rows:
+            self.add(tuple(row[:7]), row.nm_wp, row.jalan_op, row.subjek_pajak_id)
+
+    def sort_prefixes(self) -> None:
+        self.nop_prefixes.sort()
+        self.name_prefixes.sort()
+        self.sorted = True
+
+    def prefix_scan(self, target: List[Tuple[str, int]], prefix: str, limit: int) -> List[SpopDoc]:
+        docs: List[SpopDoc] = []
+        seen: Set[int] = set()
+        position = bisect_left(target, (prefix, -1))
+        while position < len(target) and len(docs) < limit:
+            value, doc_id = target[position]
+            if not value.startswith(prefix):
+                break
+            position += 1
+            doc = self.docs[doc_id]
+            if doc is not None and doc_id not in seen:
+                seen.add(doc_id)
+                docs.append(doc)
+        return docs
+
+    def matching(self, field: str, needle: str) -> Set[int]:
+        """Doc id hidup yang nilai `field`-nya memuat `needle` (ASCII, >= GRAM karakter)."""
+
+        position = FIELDS.index(field)
+        postings = self.postings[field]
+        buckets = []
+        for gram in _grams(needle):
+            bucket = postings.get(gram)
+            if bucket is None:
+                buckets = []
+                break
+            buckets.append(bucket)
+        found = set(self.unindexed[field])
+        if buckets:
+            buckets.sort(key=len)
+            for doc_id in buckets[0]:
+                doc = self.docs[doc_id]
+                if doc is not None and needle in doc.values[position]:
+                    found.add(doc_id)
+        return found
+
+
+class SpopSearchIndex:
+    """Index di memori proses: trigram NOP / NM_WP / JALAN_OP / subjek pajak dan prefix untuk typeahead.
+
+    Dibangun di latar (`schedule_refresh()`) saat startup dan setiap kali TTL
+    habis, tidak pernah di jalur request; penulisan SPOP di proses ini langsung
+    diterapkan. Penulisan dari worker lain atau perubahan `dat_subjek_pajak`
+    dari luar aplikasi baru terlihat setelah dibangun ulang, jadi `candidates()`
+    hanya mempersempit kunci SPOP: pemanggil tetap menyaring dengan `LIKE` di
+    MySQL, dan index yang umurnya melewati TTL tidak dipakai sampai selesai
+    dibangun ulang.
+    """
+
+    def __init__(self, ttl_seconds: int, max_candidates: int) -> None:
+        self._ttl = ttl_seconds
+        self._max_candidates = max_candidates
+        self._lock = asyncio.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._loaded_at = 0.0
+        self._building = False
+        self._pending: List[Tuple[str, tuple]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    def _is_fresh(self) -> bool:
+        if self._snapshot is None:
+            return False
+        return self._ttl <= 0 or (time.monotonic() - self._loaded_at) < self._ttl
+
+    def invalidate(self) -> None:
+        self._loaded_at = 0.0
+
+    def schedule_refresh(self) -> None:
+        """Bangun ulang index di task latar bila belum ada / sudah basi; tidak menunggu."""
+
+        if self._is_fresh() or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._refresh())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _refresh(self) -> None:
+        try:
+            async with AsyncSessionFactory() as session:
+                await self.ensure_loaded(session)
+        except Exception:
+            logger.exception("Gagal membangun index saran SPOP")
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if self._is_fresh():
+                return
+            self._building = True
+            try:
+                snapshot = await self._build(session)
+                for action, args in self._pending:
+                    getattr(snapshot, action)(*args)
+                self._snapshot = snapshot
+                self._loaded_at = time.monotonic()
+            finally:
+                self._building = False
+                self._pending = []
+
+    async def _build(self, session: AsyncSession) -> _Snapshot:
+        snapshot = _Snapshot()
+        stmt = (
+            select(
+                Spop.kd_propinsi,
+                Spop.kd_dati2,
+                Spop.kd_kecamatan,
+                Spop.kd_kelurahan,
+                Spop.kd_blok,
+                Spop.no_urut,
+                Spop.kd_jns_op,
+                Spop.jalan_op,
+                Spop.subjek_pajak_id,
+                DatSubjekPajak.nm_wp,
+            )
+            .outerjoin(DatSubjekPajak, DatSubjekPajak.subjek_pajak_key == Spop.subjek_pajak_key)
+            .execution_options(yield_per=LOAD_PARTITION)
+        )
+        result = await session.stream(stmt)
+        async for partition in result.partitions():
+            await run_in_threadpool(snapshot.add_rows, partition)
+        await run_in_threadpool(snapshot.sort_prefixes)
+        return snapshot
+
+    def upsert(
+        self, key: SpopKey, nm_wp: Optional[str], jalan_op: Optional[str], subjek_pajak_id: Optional[str]
+    ) -> None:
+        args = (tuple(key), nm_wp, jalan_op, subjek_pajak_id)
+        if self._building:
+            self._pending.append(("add", args))
+        if self._snapshot is not None:
+            self._snapshot.add(*args)
+
+    def remove(self, key: SpopKey) -> None:
+        if self._building:
+            self._pending.append(("remove", (tuple(key),)))
+        if self._snapshot is not None:
+            self._snapshot.remove(tuple(key))
+
+    def candidates(self, fields: Sequence[str], term: Optional[str]) -> Optional[Set[SpopKey]]:
+        """Kunci SPOP yang salah satu `fields`-nya mungkin memuat `term` (`LIKE '%term%'`).
+
+        None bila index tidak bisa dipakai: belum siap / melewati TTL, istilah
+        < 3 karakter, non-ASCII atau memuat wildcard LIKE, atau kandidat lebih
+        dari batas (`SEARCH_INDEX_MAX_CANDIDATES`).
+        """
+
+        snapshot = self._snapshot
+        needle = normalize_text(term)
+        if not self._is_fresh() or self._max_candidates <= 0 or len(needle) < GRAM:
+            return None
+        if not needle.isascii() or any(ch in needle for ch in "%_\\"):
+            return None
+        found: Set[int] = set()
+        for field in fields:
+            found |= snapshot.matching(field, needle)
+            if len(found) > self._max_candidates:
+                return None
+        return {snapshot.docs[doc_id].key for doc_id in found}
+
+    def suggest(self, query: Optional[str], limit: int) -> Optional[List[SpopDoc]]:
+        """Top-k dokumen yang NOP-nya (query berisi angka) atau namanya diawali `query`.
+
+        Urutan leksikografis (NOP naik / nama naik). None bila index belum siap.
+        """
+
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        needle = " ".join(normalize_text(query).split())
+        if not needle:
+            return []
+        if is_nop_query(needle):
+            return snapshot.prefix_scan(snapshot.nop_prefixes, nop_digits(needle), limit)
+        return snapshot.prefix_scan(snapshot.name_prefixes, needle, limit)
+
+
+def nop_digits(query: str) -> str:
+    return "".join(ch for ch in query if ch.isdigit())
+
+
+def is_nop_query(query: str) -> bool:
+    return bool(nop_digits(query)) and all(ch.isdigit() or ch in ".-/ " for ch in query)
+
+
+spop_search_index = SpopSearchIndex(
+    ttl_seconds=settings.search_index_ttl_seconds,
+    max_candidates=settings.search_index_max_candidates,
+)
+
+__all__ = [
+    "FIELDS",
+    "SpopDoc",
+    "SpopKey",
+    "SpopSearchIndex",
+    "is_nop_query",
+    "nop_digits",
+    "normalize_text",
+    "spop_key",
+    "spop_search_index",
+]
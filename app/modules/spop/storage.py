@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, select, text, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.database import AsyncSessionFactory
+from app.modules.spop.models import UploadBlob
+
+UPLOAD_BASE = Path(__file__).resolve().parent.parent.parent / "storage" / "uploads"
+UPLOAD_ROOT = UPLOAD_BASE / "spop"
+UPLOAD_ROOT.mkdir(parents=True, exist_ok=True)
+
+# Blob tanpa referensi baru dihapus setelah masa tenggang ini, supaya unggahan
+# yang belum sempat dipasang ke permohonan tidak ikut terhapus.
+PURGE_GRACE_SECONDS = 3600
+
+_SUFFIX_RE = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+# session.info: berkas sementara yang menunggu commit -> [(tmp_path, target)]
+_STAGED_KEY = "staged_uploads"
+
+logger = logging.getLogger(__name__)
+
+
+def blob_path(sha256: str, suffix: str, module_dir: Path = UPLOAD_ROOT) -> Path:
+    """Lokasi berkas content-addressed: `<module>/ab/cd/<sha256><suffix>`."""
+
+    suffix = suffix.lower()
+    if not _SUFFIX_RE.match(suffix):
+        suffix = ""
+    return module_dir / sha256[:2] / sha256[2:4] / f"{sha256}{suffix}"
+
+
+def _publish(tmp_path: Path, target: Path) -> None:
+    try:
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, target)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_staged(session: Session) -> None:
+    staged: List[Tuple[Path, Path]] = session.info.pop(_STAGED_KEY, [])
+    for tmp_path, target in staged:
+        try:
+            _publish(tmp_path, target)
+        except OSError:
+            logger.exception("Gagal memindahkan unggahan ke %s", target)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_staged(session: Session, transaction) -> None:
+    # Transaksi terluar selesai tanpa commit (rollback/close): buang berkas sementara.
+    if transaction.parent is not None:
+        return
+    for tmp_path, _ in session.info.pop(_STAGED_KEY, []):
+        tmp_path.unlink(missing_ok=True)
+
+
+def confine_upload(relative: Optional[str]) -> Optional[Path]:
+    """Path absolut (resolved) di bawah UPLOAD_BASE, atau None bila kosong / keluar dari direktori upload."""
+
+    if not relative or not relative.strip():
+        return None
+    base = UPLOAD_BASE.resolve()
+    target = (base / relative.strip()).resolve()
+    return target if base in target.parents else None
+
+
+async def store_blob(
+    session: AsyncSession,
+    tmp_path: Path,
+    sha256: str,
+    size: int,
+    suffix: str,
+    module_dir: Path = UPLOAD_ROOT,
+) -> str:
+    """Daftarkan isi berkas di `upload_blob`; berkas dipindahkan ke lokasi shard-nya setelah commit.
+
+    Sampai transaksi sesi di-commit berkas tetap di folder sementara, sehingga
+    request yang gagal (rollback) tidak meninggalkan berkas tanpa baris blob.
+    Mengembalikan path relatif terhadap UPLOAD_BASE seperti kolom `file_*`.
+    """
+
+    candidate = str(blob_path(sha256, suffix, module_dir).relative_to(UPLOAD_BASE))
+    stmt = mysql_insert(UploadBlob).values(sha256=sha256, path=candidate, size=size, ref_count=0)
+    await session.execute(stmt.on_duplicate_key_update(sha256=stmt.inserted.sha256))
+    path = (await session.execute(select(UploadBlob.path).where(UploadBlob.sha256 == sha256))).scalar_one()
+    session.info.setdefault(_STAGED_KEY, []).append((tmp_path, UPLOAD_BASE / path))
+    return path
+
+
+async def _adjust_refs(session: AsyncSession, paths: Iterable[Optional[str]], delta: int) -> None:
+    counts = Counter(path.strip() for path in paths if path and path.strip())
+    for path, count in counts.items():
+        await session.execute(
+            update(UploadBlob)
+            .where(UploadBlob.path == path)
+            .values(ref_count=func.greatest(UploadBlob.ref_count + delta * count, 0))
+        )
+
+
+async def retain_paths(session: AsyncSession, paths: Iterable[Optional[str]]) -> None:
+    """Tambah referensi untuk path yang disimpan di record (path lama non-blob diabaikan)."""
+
+    await _adjust_refs(session, paths, 1)
+
+
+async def release_paths(session: AsyncSession, paths: Iterable[Optional[str]]) -> None:
+    await _adjust_refs(session, paths, -1)
+
+
+def _purge_stale_tmp(tmp_dir: Path) -> None:
+    # Sisa unggahan dari proses yang mati sebelum commit/rollback.
+    cutoff = time.time() - PURGE_GRACE_SECONDS
+    for tmp_path in tmp_dir.glob(".upload-*"):
+        try:
+            if tmp_path.stat().st_mtime < cutoff:
+                tmp_path.unlink(missing_ok=True)
+        except OSError:
+            continue
+
+
+async def purge_unreferenced(limit: int = 500) -> int:
+    """Hapus blob tanpa referensi (baris + berkas). Aman dijalankan berulang."""
+
+    await run_in_threadpool(_purge_stale_tmp, UPLOAD_ROOT / ".tmp")
+    cutoff = func.date_sub(func.now(), text(f"INTERVAL {PURGE_GRACE_SECONDS} SECOND"))
+    async with AsyncSessionFactory() as session:
+        rows = (
+            await session.execute(
+                select(UploadBlob.sha256, UploadBlob.path)
+                .where(UploadBlob.ref_count == 0, UploadBlob.created_at < cutoff)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+        ).all()
+        if not rows:
+            return 0
+        for row in rows:
+            target = UPLOAD_BASE / row.path
+            target.unlink(missing_ok=True)
+            # Rendition foto (`<sha>.review.jpg`, `<sha>.thumb.jpg`) ikut dihapus.
+            for rendition in target.parent.glob(f"{target.stem}.*.jpg"):
+                rendition.unlink(missing_ok=True)
+        await session.execute(delete(UploadBlob).where(UploadBlob.sha256.in_([row.sha256 for row in rows])))
+        await session.commit()
+    return len(rows)
+
+
+__all__ = [
+    "UPLOAD_BASE",
+    "UPLOAD_ROOT",
+    "blob_path",
+    "confine_upload",
+    "purge_unreferenced",
+    "release_paths",
+    "retain_paths",
+    "store_blob",
+]
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, NamedTuple
+
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.modules.spop.storage import UPLOAD_BASE, UPLOAD_ROOT, store_blob
+
+CHUNK_SIZE = 1024 * 1024
+
+PHOTO_FIELDS = frozenset({"file_foto_objek", "foto_objek_pajak"})
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+
+def field_limit(field: str) -> int:
+    if field in PHOTO_FIELDS:
+        return settings.upload_photo_max_bytes
+    return settings.upload_max_bytes
+
+
+def _write_stream(source: BinaryIO, tmp_dir: Path, field: str, limit: int) -> tuple[Path, str, int]:
+    """Salin berkas per chunk ke file sementara sambil menghitung SHA-256."""
+
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(prefix=".upload-", dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            source.seek(0)
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Ukuran berkas {field} melebihi batas {limit // (1024 * 1024)} MB",
+                    )
+                digest.update(chunk)
+                tmp.write(chunk)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return Path(tmp_name), digest.hexdigest(), size
+
+
+async def save_upload(
+    session: AsyncSession,
+    file: UploadFile,
+    field: str,
+    module_dir: Path = UPLOAD_ROOT,
+) -> StoredUpload:
+    """Simpan UploadFile tanpa memblokir event loop (I/O berjalan di threadpool).
+
+    Isi berkas disimpan content-addressed lewat `store_blob`; berkas yang sama
+    persis hanya tersimpan sekali dan path relatifnya dipakai bersama. Berkas
+    baru ada di path tersebut setelah transaksi `session` di-commit.
+    """
+
+    tmp_path, sha256, size = await run_in_threadpool(
+        _write_stream, file.file, module_dir / ".tmp", field, field_limit(field)
+    )
+    try:
+        path = await store_blob(session, tmp_path, sha256, size, Path(file.filename or "").suffix, module_dir)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return StoredUpload(path, sha256, size)
+
+
+__all__ = ["StoredUpload", "UPLOAD_BASE", "UPLOAD_ROOT", "field_limit", "save_upload"]
@@ -0,0 +1,550 @@
+"""Penetapan massal SPPT tahunan per wilayah.
+
+Jalankan manual::
+
+    python -m app.modules.sppt.assessment <tahun> <kabupaten_op> [kecamatan_op] [kelurahan_op]
+
+atau lewat `POST /sppt/assessment` (admin). Permohonan SPOP berstatus
+"disetujui" dibaca per kelurahan (partisi) berurutan NOP, dinilai per chunk
+dengan `ValuationTables`, lalu ditulis ke `sppt` dengan multi-row INSERT:
+satu baris per bangunan LSPOP (sama seperti `POST /lspop`), atau satu baris
+bumi saja bila objek belum punya bangunan.
+
+Checkpoint `sppt_assessment_checkpoint` (NOP terakhir per partisi) diperbarui
+dalam transaksi yang sama dengan INSERT, sehingga job yang terhenti bisa
+dilanjutkan. Baris yang sudah ada untuk tahun itu dilewati, jadi aman
+dijalankan ulang; baris dari `POST /lspop` tanpa THN_PAJAK_SPPT dianggap
+milik tahun `create_at`-nya. `sppt_summary` dihitung ulang sekali per partisi, di
+transaksi yang menandai partisi `done`, untuk semua NOP partisi yang punya
+SPPT tahun itu (termasuk chunk dari run yang terhenti).
+
+Dengan `workers > 1` (`--workers=N` / `ASSESSMENT_WORKERS`) partisi
+(kecamatan, kelurahan) dibagikan ke `ProcessPoolExecutor`; tiap proses worker
+punya event loop dan engine database sendiri, dan laporan per partisi
+digabung di proses induk.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from uuid import uuid4
+
+from sqlalchemy import BigInteger, DateTime, Integer, String, cast, column, delete, func, insert, select, table
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.config import settings
+from app.core.database import AsyncSessionFactory, Base, create_engine, engine
+from app.modules.lspop.models import LampiranSpop
+from app.modules.spop.models import SpopRegistration
+from app.modules.sppt import summary as sppt_summary
+from app.modules.sppt.cache import invalidate_esppt
+from app.modules.sppt.valuation import ValuationTables, load_tables, pick_pbb_tarif
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH = 500
+SUMMARY_BATCH = 1000
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+
+SPPT_TABLE = table(
+    "sppt",
+    column("id"),
+    column("spop_id"),
+    column("lspop_id"),
+    column("nop"),
+    column("bumi_njop"),
+    column("bangunan_njop"),
+    column("njoptkp"),
+    column("pbb_persen"),
+    column("THN_PAJAK_SPPT"),
+    column("create_at"),
+)
+
+
+class AssessmentCheckpoint(Base):
+    __tablename__ = "sppt_assessment_checkpoint"
+
+    tahun: Mapped[str] = mapped_column(String(4), primary_key=True)
+    kabupaten_op: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kecamatan_op: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kelurahan_op: Mapped[int] = mapped_column(Integer, primary_key=True)
+    status: Mapped[str] = mapped_column(String(10), nullable=False, default=STATUS_RUNNING)
+    last_nop: Mapped[Optional[str]] = mapped_column(String(32))
+    objek: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sppt_rows: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    pbb_total: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+class Partition(NamedTuple):
+    kecamatan_op: int
+    kelurahan_op: int
+
+
+@dataclass(frozen=True)
+class AssessmentContext:
+    tahun: str
+    kabupaten_op: int
+    tables: ValuationTables
+    tarif_id: int
+    njoptkp: int
+
+
+@dataclass
+class AssessmentReport:
+    tahun: str
+    kabupaten_op: int
+    partitions: int = 0
+    partitions_skipped: int = 0
+    objek: int = 0
+    sppt_rows: int = 0
+    existing_rows: int = 0
+    pbb_total: int = 0
+    elapsed_seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def objek_per_detik(self) -> float:
+        return round(self.objek / self.elapsed_seconds, 1) if self.elapsed_seconds > 0 else 0.0
+
+    def merge(self, other: "AssessmentReport") -> None:
+        self.partitions += other.partitions
+        self.partitions_skipped += other.partitions_skipped
+        self.objek += other.objek
+        self.sppt_rows += other.sppt_rows
+        self.existing_rows += other.existing_rows
+        self.pbb_total += other.pbb_total
+        self.errors.extend(other.errors)
+
+    def as_dict(self) -> Dict[str, object]:
+        data = asdict(self)
+        data["objek_per_detik"] = self.objek_per_detik
+        return data
+
+
+def _approved():
+    return func.lower(func.trim(SpopRegistration.status)) == "disetujui"
+
+
+def _tax_year():
+    # Baris lama dari POST /lspop belum mengisi THN_PAJAK_SPPT; tahunnya diambil dari create_at.
+    return func.coalesce(SPPT_TABLE.c.THN_PAJAK_SPPT, cast(func.year(SPPT_TABLE.c.create_at), String(4)))
+
+
+def _digits(value: Optional[str]) -> str:
+    return "".join(ch for ch in (value or "") if ch.isdigit())
+
+
+def _id_or_missing(value) -> int:
+    return int(value) if value is not None else -1
+
+
+async def list_partitions(
+    session: AsyncSession,
+    kabupaten_op: int,
+    kecamatan_op: Optional[int] = None,
+    kelurahan_op: Optional[int] = None,
+) -> List[Partition]:
+    stmt = select(SpopRegistration.kecamatan_op, SpopRegistration.kelurahan_op).where(
+        SpopRegistration.kabupaten_op == kabupaten_op, _approved()
+    )
+    if kecamatan_op is not None:
+        stmt = stmt.where(SpopRegistration.kecamatan_op == kecamatan_op)
+    if kelurahan_op is not None:
+        stmt = stmt.where(SpopRegistration.kelurahan_op == kelurahan_op)
+    stmt = stmt.distinct().order_by(SpopRegistration.kecamatan_op, SpopRegistration.kelurahan_op)
+    return [Partition(int(row[0]), int(row[1])) for row in (await session.execute(stmt)).all()]
+
+
+async def build_context(session: AsyncSession, tahun: str, kabupaten_op: int) -> AssessmentContext:
+    tarif_id, _ = await pick_pbb_tarif(session, kabupaten_op)
+    return AssessmentContext(
+        tahun=tahun,
+        kabupaten_op=kabupaten_op,
+        tables=await load_tables(session),
+        tarif_id=tarif_id,
+        njoptkp=int(settings.pbb_njoptkp or 0),
+    )
+
+
+async def _lock_checkpoint(session: AsyncSession, context: AssessmentContext, partition: Partition) -> AssessmentCheckpoint:
+    # INSERT IGNORE lalu SELECT ... FOR UPDATE: dua job untuk partisi yang sama berjalan bergantian per chunk.
+    await session.execute(
+        insert(AssessmentCheckpoint)
+        .prefix_with("IGNORE")
+        .values(
+            tahun=context.tahun,
+            kabupaten_op=context.kabupaten_op,
+            kecamatan_op=partition.kecamatan_op,
+            kelurahan_op=partition.kelurahan_op,
+            status=STATUS_RUNNING,
+            objek=0,
+            sppt_rows=0,
+            pbb_total=0,
+            updated_at=datetime.utcnow(),
+        )
+    )
+    stmt = (
+        select(AssessmentCheckpoint)
+        .where(
+            AssessmentCheckpoint.tahun == context.tahun,
+            AssessmentCheckpoint.kabupaten_op == context.kabupaten_op,
+            AssessmentCheckpoint.kecamatan_op == partition.kecamatan_op,
+            AssessmentCheckpoint.kelurahan_op == partition.kelurahan_op,
+        )
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return (await session.execute(stmt)).scalar_one()
+
+
+async def _refresh_partition_summary(session: AsyncSession, context: AssessmentContext, partition: Partition) -> None:
+    stmt = (
+        select(SPPT_TABLE.c.nop)
+        .join(SpopRegistration, SpopRegistration.id == SPPT_TABLE.c.spop_id)
+        .where(
+            SpopRegistration.kabupaten_op == context.kabupaten_op,
+            SpopRegistration.kecamatan_op == partition.kecamatan_op,
+            SpopRegistration.kelurahan_op == partition.kelurahan_op,
+            _tax_year() == context.tahun,
+        )
+        .distinct()
+        .order_by(SPPT_TABLE.c.nop)
+    )
+    nops = list((await session.execute(stmt)).scalars())
+    for start in range(0, len(nops), SUMMARY_BATCH):
+        await sppt_summary.refresh(session, nops[start : start + SUMMARY_BATCH])
+
+
+async def _assess_chunk(
+    session: AsyncSession,
+    context: AssessmentContext,
+    partition: Partition,
+    chunk_size: int,
+    report: AssessmentReport,
+) -> bool:
+    """Proses satu chunk dalam satu transaksi; False bila partisi sudah selesai."""
+
+    checkpoint = await _lock_checkpoint(session, context, partition)
+    if checkpoint.status == STATUS_DONE:
+        await session.commit()
+        return False
+
+    stmt = (
+        select(
+            SpopRegistration.id,
+            SpopRegistration.nop,
+            SpopRegistration.luas_tanah,
+            SpopRegistration.kelas_bumi_njop,
+            SpopRegistration.kelas_bangunan_njop,
+        )
+        .where(
+            SpopRegistration.kabupaten_op == context.kabupaten_op,
+            SpopRegistration.kecamatan_op == partition.kecamatan_op,
+            SpopRegistration.kelurahan_op == partition.kelurahan_op,
+            SpopRegistration.nop.is_not(None),
+            _approved(),
+        )
+        .order_by(SpopRegistration.nop)
+        .limit(chunk_size)
+    )
+    if checkpoint.last_nop is not None:
+        stmt = stmt.where(SpopRegistration.nop > checkpoint.last_nop)
+    registrations = (await session.execute(stmt)).all()
+    if not registrations:
+        await _refresh_partition_summary(session, context, partition)
+        checkpoint.status = STATUS_DONE
+        checkpoint.updated_at = datetime.utcnow()
+        await session.commit()
+        return False
+
+    spop_ids = [row.id for row in registrations]
+    buildings: Dict[str, List[Tuple[Optional[str], int]]] = {}
+    building_rows = await session.execute(
+        select(LampiranSpop.spop_id, LampiranSpop.id, LampiranSpop.luas_bangunan_m2)
+        .where(LampiranSpop.spop_id.in_(spop_ids))
+        .order_by(LampiranSpop.spop_id, LampiranSpop.id)
+    )
+    for spop_id, lspop_id, luas in building_rows:
+        buildings.setdefault(spop_id, []).append((lspop_id, int(luas or 0)))
+    existing: Set[Tuple[str, Optional[str]]] = {
+        (row[0], row[1])
+        for row in await session.execute(
+            select(SPPT_TABLE.c.spop_id, SPPT_TABLE.c.lspop_id).where(
+                SPPT_TABLE.c.spop_id.in_(spop_ids), _tax_year() == context.tahun
+            )
+        )
+    }
+
+    # Kolom per baris SPPT (per bangunan) dan per objek (bumi sekali + Σ bangunan, untuk PBB).
+    row_refs: List[Tuple[int, Optional[str]]] = []
+    row_luas_bumi: List[int] = []
+    row_luas_bangunan: List[int] = []
+    obj_luas_bangunan: List[int] = []
+    for index, registration in enumerate(registrations):
+        entries = buildings.get(registration.id) or [(None, 0)]
+        obj_luas_bangunan.append(sum(luas for _, luas in entries))
+        for lspop_id, luas in entries:
+            row_refs.append((index, lspop_id))
+            row_luas_bumi.append(int(registration.luas_tanah or 0))
+            row_luas_bangunan.append(luas)
+
+    kelas_bumi = [_id_or_missing(row.kelas_bumi_njop) for row in registrations]
+    kelas_bangunan = [_id_or_missing(row.kelas_bangunan_njop) for row in registrations]
+    row_kelas_bumi = [kelas_bumi[index] for index, _ in row_refs]
+    row_kelas_bangunan = [kelas_bangunan[index] for index, _ in row_refs]
+    rows_value = context.tables.value(
+        row_luas_bumi,
+        row_luas_bangunan,
+        row_kelas_bumi,
+        row_kelas_bangunan,
+        [context.tarif_id] * len(row_refs),
+        context.njoptkp,
+    )
+    objects_value = context.tables.value(
+        [int(row.luas_tanah or 0) for row in registrations],
+        obj_luas_bangunan,
+        kelas_bumi,
+        kelas_bangunan,
+        [context.tarif_id] * len(registrations),
+        context.njoptkp,
+    )
+
+    now = datetime.utcnow()
+    values: List[Dict[str, object]] = []
+    assessed: Set[int] = set()
+    skipped = 0
+    for position, (index, lspop_id) in enumerate(row_refs):
+        registration = registrations[index]
+        if (registration.id, lspop_id) in existing:
+            skipped += 1
+            continue
+        assessed.add(index)
+        values.append(
+            {
+                "id": uuid4().hex,
+                "spop_id": registration.id,
+                "lspop_id": lspop_id,
+                "nop": _digits(registration.nop),
+                "bumi_njop": int(rows_value.bumi_njop[position]),
+                "bangunan_njop": int(rows_value.bangunan_njop[position]),
+                "njoptkp": context.njoptkp,
+                "pbb_persen": context.tarif_id,
+                "THN_PAJAK_SPPT": context.tahun,
+                "create_at": now,
+            }
+        )
+    for start in range(0, len(values), INSERT_BATCH):
+        await session.execute(insert(SPPT_TABLE).values(values[start : start + INSERT_BATCH]))
+    pbb_total = sum(int(objects_value.pbb_terhutang[index]) for index in assessed)
+
+    checkpoint.last_nop = registrations[-1].nop
+    checkpoint.objek += len(registrations)
+    checkpoint.sppt_rows += len(values)
+    checkpoint.pbb_total += pbb_total
+    checkpoint.updated_at = now
+    await session.commit()
+    invalidate_esppt(*(registrations[index].nop for index in assessed))
+
+    report.objek += len(registrations)
+    report.sppt_rows += len(values)
+    report.existing_rows += skipped
+    report.pbb_total += pbb_total
+    return True
+
+
+async def assess_partition(
+    session_factory: async_sessionmaker,
+    context: AssessmentContext,
+    partition: Partition,
+    chunk_size: int,
+) -> AssessmentReport:
+    report = AssessmentReport(tahun=context.tahun, kabupaten_op=context.kabupaten_op, partitions=1)
+    started = time.monotonic()
+    async with session_factory() as session:
+        try:
+            chunks = 0
+            while await _assess_chunk(session, context, partition, chunk_size, report):
+                chunks += 1
+            if chunks == 0:
+                report.partitions_skipped = 1
+        except Exception as exc:
+            await session.rollback()
+            logger.exception("Penetapan %s partisi %s gagal", context.tahun, partition)
+            report.errors.append(f"{partition.kecamatan_op}/{partition.kelurahan_op}: {exc}")
+    report.elapsed_seconds = time.monotonic() - started
+    if report.objek:
+        logger.info(
+            "Penetapan %s partisi %s/%s: %s objek, %s baris SPPT, %.1f objek/detik",
+            context.tahun,
+            partition.kecamatan_op,
+            partition.kelurahan_op,
+            report.objek,
+            report.sppt_rows,
+            report.objek_per_detik,
+        )
+    return report
+
+
+async def reset_checkpoints(
+    session: AsyncSession,
+    tahun: str,
+    kabupaten_op: int,
+    kecamatan_op: Optional[int] = None,
+    kelurahan_op: Optional[int] = None,
+) -> None:
+    stmt = delete(AssessmentCheckpoint).where(
+        AssessmentCheckpoint.tahun == tahun, AssessmentCheckpoint.kabupaten_op == kabupaten_op
+    )
+    if kecamatan_op is not None:
+        stmt = stmt.where(AssessmentCheckpoint.kecamatan_op == kecamatan_op)
+    if kelurahan_op is not None:
+        stmt = stmt.where(AssessmentCheckpoint.kelurahan_op == kelurahan_op)
+    await session.execute(stmt)
+    await session.commit()
+
+
+# State per proses worker: satu event loop + satu engine yang dipakai untuk semua partisi worker itu.
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_sessions: Optional[async_sessionmaker] = None
+
+
+def _init_worker() -> None:
+    global _worker_loop, _worker_sessions
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+    _worker_sessions = async_sessionmaker(create_engine(pool_size=1, max_overflow=0), expire_on_commit=False)
+
+
+def _assess_in_worker(context: AssessmentContext, partition: Partition, chunk_size: int) -> AssessmentReport:
+    assert _worker_loop is not None and _worker_sessions is not None
+    return _worker_loop.run_until_complete(assess_partition(_worker_sessions, context, partition, chunk_size))
+
+
+async def _assess_parallel(
+    context: AssessmentContext,
+    partitions: List[Partition],
+    chunk_size: int,
+    workers: int,
+    report: AssessmentReport,
+) -> None:
+    loop = asyncio.get_running_loop()
+    # spawn: worker tidak mewarisi pool koneksi proses induk.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    ) as pool:
+        futures = {
+            loop.run_in_executor(pool, _assess_in_worker, context, partition, chunk_size): partition
+            for partition in partitions
+        }
+        done = 0
+        for future in asyncio.as_completed(futures):
+            try:
+                report.merge(await future)
+            except Exception as exc:
+                # Worker mati / hasil tidak bisa dikirim balik; partisinya bisa dilanjutkan dari checkpoint.
+                logger.exception("Worker penetapan %s gagal", context.tahun)
+                report.errors.append(f"worker: {exc}")
+            done += 1
+            logger.info(
+                "Penetapan %s: %s/%s partisi, %s objek, %s baris SPPT",
+                context.tahun,
+                done,
+                len(partitions),
+                report.objek,
+                report.sppt_rows,
+            )
+
+
+async def run_assessment(
+    tahun: str,
+    kabupaten_op: int,
+    kecamatan_op: Optional[int] = None,
+    kelurahan_op: Optional[int] = None,
+    *,
+    chunk_size: Optional[int] = None,
+    rescan: bool = False,
+    workers: Optional[int] = None,
+    session_factory: async_sessionmaker = AsyncSessionFactory,
+) -> AssessmentReport:
+    """Tetapkan SPPT `tahun` untuk wilayah; partisi yang sudah `done` dilewati kecuali `rescan`."""
+
+    chunk_size = max(chunk_size or settings.assessment_chunk_size, 1)
+    workers = max(workers or settings.assessment_workers, 1)
+    started = time.monotonic()
+    async with session_factory() as session:
+        if rescan:
+            await reset_checkpoints(session, tahun, kabupaten_op, kecamatan_op, kelurahan_op)
+        context = await build_context(session, tahun, kabupaten_op)
+        partitions = await list_partitions(session, kabupaten_op, kecamatan_op, kelurahan_op)
+
+    report = AssessmentReport(tahun=tahun, kabupaten_op=kabupaten_op)
+    if workers > 1 and len(partitions) > 1:
+        await _assess_parallel(context, partitions, chunk_size, min(workers, len(partitions)), report)
+    else:
+        for partition in partitions:
+            report.merge(await assess_partition(session_factory, context, partition, chunk_size))
+    report.elapsed_seconds = time.monotonic() - started
+    logger.info("Penetapan %s selesai (%s worker): %s", tahun, workers, report.as_dict())
+    return report
+
+
+async def progress(session: AsyncSession, tahun: str, kabupaten_op: int) -> List[AssessmentCheckpoint]:
+    stmt = (
+        select(AssessmentCheckpoint)
+        .where(AssessmentCheckpoint.tahun == tahun, AssessmentCheckpoint.kabupaten_op == kabupaten_op)
+        .order_by(AssessmentCheckpoint.kecamatan_op, AssessmentCheckpoint.kelurahan_op)
+    )
+    return list((await session.execute(stmt)).scalars().all())
+
+
+async def _main(argv: List[str]) -> int:
+    workers = None
+    positional = []
+    for arg in argv:
+        if arg.startswith("--workers="):
+            workers = int(arg.split("=", 1)[1])
+        else:
+            positional.append(arg)
+    if len(positional) < 2:
+        print("Perintah: <tahun> <kabupaten_op> [kecamatan_op] [kelurahan_op] [--workers=N]")
+        return 2
+    optional = [int(value) for value in positional[2:4]]
+    try:
+        report = await run_assessment(positional[0], int(positional[1]), *optional, workers=workers)
+    finally:
+        await engine.dispose()
+    for key, value in report.as_dict().items():
+        print(f"{key}: {value}")
+    return 1 if report.errors else 0
+
+
+__all__ = [
+    "AssessmentCheckpoint",
+    "AssessmentContext",
+    "AssessmentReport",
+    "Partition",
+    "assess_partition",
+    "build_context",
+    "list_partitions",
+    "progress",
+    "run_assessment",
+]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import NamedTuple, Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.modules.sppt import schemas
+
+
+class EspptEntry(NamedTuple):
+    """Data e-SPPT satu NOP tanpa pemeriksaan KTP (dilakukan per request oleh endpoint)."""
+
+    subjek_pajak_id: str
+    spop: schemas.SpopResponse
+    subjek_pajak: Optional[schemas.SubjekPajakResponse]
+    sppt: Optional[schemas.SpptDetail]
+
+
+# Nilai None = SPOP untuk NOP itu tidak ada (ikut di-cache agar NOP asal-asalan tidak selalu ke DB).
+esppt_cache: TTLCache[str, Optional[EspptEntry]] = TTLCache(
+    maxsize=settings.esppt_cache_size,
+    ttl_seconds=settings.esppt_cache_ttl_seconds,
+)
+
+
+def esppt_key(nop: Optional[str]) -> str:
+    return "".join(ch for ch in (nop or "") if ch.isdigit())
+
+
+def invalidate_esppt(*nops: Optional[str]) -> None:
+    """Dipanggil setelah SPOP/SPPT untuk NOP ini ditulis; worker lain menunggu TTL."""
+
+    for nop in nops:
+        key = esppt_key(nop)
+        if len(key) == 18:
+            esppt_cache.invalidate(key)
+
+
+__all__ = ["EspptEntry", "esppt_cache", "esppt_key", "invalidate_esppt"]
@@ -3,14 +3,18 @@ from __future__ import annotations
 from math import ceil
 from typing import Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import func, text
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from sqlalchemy import bindparam, func, text, tuple_
 from sqlmodel import and_, or_, select
 
 from app.auth.service import get_current_user
 from app.core.deps import SessionDep
-from app.modules.sppt import schemas
+from app.modules.spop.search_index import spop_search_index
+from app.modules.sppt import assessment, schemas
+from app.modules.sppt import summary as sppt_summary
+from app.modules.sppt.cache import EspptEntry, esppt_cache
 from app.modules.sppt.models import DatSubjekPajak, Spop, Sppt, User, OpRegistration
+from app.modules.sppt.valuation import pick_pbb_tarif
 from uuid import uuid4
 
 router = APIRouter(prefix="/sppt", tags=["op"])
@@ -86,46 +90,15 @@ async def list_sppt_by_nop(
     session: SessionDep,
     current_user: User = Depends(get_current_user),
     nop: str = Query(..., min_length=5, max_length=32),
+    include_items: bool = Query(True),
 ) -> schemas.SpptAutoListResponse:
     digits = "".join(ch for ch in (nop or "") if ch.isdigit())
     if len(digits) != 18:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="NOP tidak valid")
     nop_norm = digits
 
-    result = await session.execute(
-        text(
-            """
-            SELECT s.id, s.spop_id, s.lspop_id, s.nop, s.bumi_njop, s.bangunan_njop,
-                   COALESCE(s.bumi_njop,0) + COALESCE(s.bangunan_njop,0) AS total_njop,
-                   s.njoptkp,
-                   s.pbb_persen AS pbb_persen_id,
-                   COALESCE(t.pbb_persen, 0) AS pbb_persen_value,
-                   s.create_at,
-                   COALESCE(sr.luas_tanah, 0) AS luas_bumi,
-                   rb.id AS kelas_bumi_njop_id,
-                   rb.kelas AS kelas_bumi_njop_kelas,
-                   rb.njop AS kelas_bumi_njop_njop,
-                   sr.kelas_bangunan_njop AS kelas_bangunan_njop_id,
-                   rbn.kelas AS kelas_bangunan_njop_kelas,
-                   rbn.njop AS kelas_bangunan_njop_njop,
-                   COALESCE(ls.luas_bangunan_m2, 0) AS luas_bangunan
-            FROM sppt s
-            LEFT JOIN pbb_p2 t ON t.id = s.pbb_persen
-            LEFT JOIN spop_registration sr ON sr.id = s.spop_id
-            LEFT JOIN kelas_bumi_njop rb ON rb.id = sr.kelas_bumi_njop
-            LEFT JOIN lampiran_spop ls ON ls.id = s.lspop_id
-            LEFT JOIN kelas_bangunan_njop rbn ON rbn.id = sr.kelas_bangunan_njop
-            WHERE s.nop = :nop
-            ORDER BY s.create_at DESC
-            """
-        ),
-        {"nop": nop_norm},
-    )
-    rows = result.mappings().all()
-    items: List[schemas.SpptAutoItem] = [_sppt_auto_row_to_schema(row) for row in rows]
-
-    total_bangunan = len(items)
-    if not items:
+    summary = await sppt_summary.get_summary(session, nop_norm)
+    if summary is None:
         return schemas.SpptAutoListResponse(
             message="Data SPPT",
             data=[],
@@ -138,34 +111,51 @@ async def list_sppt_by_nop(
             pbb_terhutang=0,
         )
 
-    # Hitung summary: 1x bumi_njop + seluruh bangunan_njop
-    bumi_njop = max((int(row["bumi_njop"] or 0) for row in rows), default=0)
-    bangunan_sum = sum(int(row["bangunan_njop"] or 0) for row in rows)
-    summary_total_njop = bumi_njop + bangunan_sum
-    pbb_persen_id = int(rows[0]["pbb_persen_id"] or 0)
-    pbb_persen = float(rows[0]["pbb_persen_value"] or 0)
-    njoptkp = int(rows[0]["njoptkp"] or 0)
-    summary_pbb_terhutang = int(max(summary_total_njop - njoptkp, 0) * pbb_persen)
-    total_luas_bumi = max((int(row["luas_bumi"] or 0) for row in rows), default=0)
-    total_luas_bangunan = sum(int(row["luas_bangunan"] or 0) for row in rows)
+    items: List[schemas.SpptAutoItem] = []
+    if include_items:
+        result = await session.execute(
+            text(
+                f"""
+                SELECT s.id, s.spop_id, s.lspop_id, s.nop, s.bumi_njop, s.bangunan_njop,
+                       s.create_at,
+                       COALESCE(sr.luas_tanah, 0) AS luas_bumi,
+                       rb.id AS kelas_bumi_njop_id,
+                       rb.kelas AS kelas_bumi_njop_kelas,
+                       rb.njop AS kelas_bumi_njop_njop,
+                       sr.kelas_bangunan_njop AS kelas_bangunan_njop_id,
+                       rbn.kelas AS kelas_bangunan_njop_kelas,
+                       rbn.njop AS kelas_bangunan_njop_njop,
+                       COALESCE(ls.luas_bangunan_m2, 0) AS luas_bangunan
+                FROM sppt s
+                {sppt_summary.LATEST_YEAR_JOIN}
+                LEFT JOIN spop_registration sr ON sr.id = s.spop_id
+                LEFT JOIN kelas_bumi_njop rb ON rb.id = sr.kelas_bumi_njop
+                LEFT JOIN lampiran_spop ls ON ls.id = s.lspop_id
+                LEFT JOIN kelas_bangunan_njop rbn ON rbn.id = sr.kelas_bangunan_njop
+                ORDER BY s.create_at DESC
+                """
+            ).bindparams(bindparam("nops", expanding=True)),
+            {"nops": [nop_norm]},
+        )
+        items = [_sppt_auto_row_to_schema(row) for row in result.mappings().all()]
 
     return schemas.SpptAutoListResponse(
         message="Data SPPT",
         data=items,
-        total_bangunan=total_bangunan,
-        total_luas_bumi=total_luas_bumi,
-        total_luas_bangunan=total_luas_bangunan,
-        total_njop=summary_total_njop,
-        pbb_persen_id=pbb_persen_id,
-        pbb_persen=pbb_persen,
-        pbb_terhutang=summary_pbb_terhutang,
+        total_bangunan=summary.total_bangunan,
+        total_luas_bumi=summary.total_luas_bumi,
+        total_luas_bangunan=summary.total_luas_bangunan,
+        total_njop=summary.total_njop,
+        pbb_persen_id=summary.pbb_persen_id,
+        pbb_persen=float(summary.pbb_persen),
+        pbb_terhutang=summary.pbb_terhutang,
     )
 
 def _sppt_auto_row_to_schema(row) -> schemas.SpptAutoItem:
     return schemas.SpptAutoItem(
         id=str(row["id"]),
         spop_id=str(row["spop_id"]),
-        lspop_id=str(row["lspop_id"]),
+        lspop_id=str(row["lspop_id"]) if row["lspop_id"] is not None else None,
         nop=str(row["nop"]),
         bumi_njop=int(row["bumi_njop"] or 0),
         bangunan_njop=int(row["bangunan_njop"] or 0),
@@ -278,6 +268,20 @@ async def list_spop(
             func.upper(Spop.subjek_pajak_id).like(term),
             func.upper(Spop.jalan_op).like(term),
         )
+        spop_search_index.schedule_refresh()
+        candidates = spop_search_index.candidates(("nop", "subjek_pajak_id", "jalan_op"), search)
+        if candidates is not None:
+            # Index hanya mempersempit kunci; LIKE tetap menyaring hasil akhirnya.
+            key_columns = tuple_(
+                Spop.kd_propinsi,
+                Spop.kd_dati2,
+                Spop.kd_kecamatan,
+                Spop.kd_kelurahan,
+                Spop.kd_blok,
+                Spop.no_urut,
+                Spop.kd_jns_op,
+            )
+            condition = and_(key_columns.in_(sorted(candidates)), condition)
         stmt = stmt.where(condition)
         count_stmt = count_stmt.where(condition)
 
@@ -334,31 +338,8 @@ async def list_spop(
     )
 
 
-@router.post("/esppt", response_model=schemas.EspptResponse)
-async def cek_esppt(
-    payload: schemas.EspptRequest,
-    session: SessionDep,
-) -> schemas.EspptResponse:
-    """Public E-SPPT check by NOP + KTP (SUBJEK_PAJAK_ID).
-
-    Returns latest SPPT data along with SPOP and subject info.
-    """
-    fields = parse_nop(payload.nop)
-
-    # Fetch SPOP + subject first to validate KTP linkage
-    result = await _fetch_spop(session, nop_fields=fields)
-    if result is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data tidak ditemukan")
-
-    spop, subjek = result
-    ktp_input = (payload.ktp or "").strip()
-    spid = (spop.subjek_pajak_id or "").strip()
-    if not ktp_input or (spid and spid != ktp_input):
-        # Hide existence details to avoid leakage
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data tidak ditemukan")
-
-    # Latest SPPT for the NOP
-    stmt = (
+def _latest_sppt_stmt(fields: Dict[str, str]):
+    return (
         select(Sppt)
         .where(
             and_(
@@ -375,28 +356,68 @@ async def cek_esppt(
         .limit(1)
     )
 
-    sppt_row = (await session.execute(stmt)).scalar_one_or_none()
-    if sppt_row is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SPPT tidak ditemukan")
 
-    detail = schemas.SpptDetail(
-        year=int(sppt_row.thn_pajak_sppt),
-        nop=compose_nop(fields),
-        luas_bumi=float(sppt_row.luas_bumi_sppt or 0),
-        luas_bangunan=float(sppt_row.luas_bng_sppt or 0),
-        pbb_terhutang=float(sppt_row.pbb_terhutang_sppt or 0),
-        pbb_harus_bayar=float(getattr(sppt_row, "pbb_yg_harus_dibayar_sppt", 0) or 0),
-    )
+async def _load_esppt(session: SessionDep, fields: Dict[str, str]) -> Optional[EspptEntry]:
+    result = await _fetch_spop(session, nop_fields=fields)
+    if result is None:
+        return None
+    spop, subjek = result
 
-    data = schemas.EspptData(
+    sppt_row = (await session.execute(_latest_sppt_stmt(fields))).scalar_one_or_none()
+    detail = None
+    if sppt_row is not None:
+        detail = schemas.SpptDetail(
+            year=int(sppt_row.thn_pajak_sppt),
+            nop=compose_nop(fields),
+            luas_bumi=float(sppt_row.luas_bumi_sppt or 0),
+            luas_bangunan=float(sppt_row.luas_bng_sppt or 0),
+            pbb_terhutang=float(sppt_row.pbb_terhutang_sppt or 0),
+            pbb_harus_bayar=float(sppt_row.pbb_yg_harus_dibayar_sppt or 0),
+        )
+    return EspptEntry(
+        subjek_pajak_id=(spop.subjek_pajak_id or "").strip(),
         spop=_spop_to_response(fields, spop),
         subjek_pajak=_subjek_to_response(subjek) if subjek else None,
         sppt=detail,
     )
 
+
+async def _cached_esppt(session: SessionDep, fields: Dict[str, str]) -> Optional[EspptEntry]:
+    return await esppt_cache.get_or_load(compose_nop(fields), lambda: _load_esppt(session, fields))
+
+
+def _esppt_response(entry: EspptEntry) -> schemas.EspptResponse:
+    if entry.sppt is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SPPT tidak ditemukan")
+    data = schemas.EspptData(spop=entry.spop, subjek_pajak=entry.subjek_pajak, sppt=entry.sppt)
     return schemas.EspptResponse(message="Data e-SPPT", data=data)
 
 
+@router.post("/esppt", response_model=schemas.EspptResponse)
+async def cek_esppt(
+    payload: schemas.EspptRequest,
+    session: SessionDep,
+) -> schemas.EspptResponse:
+    """Public E-SPPT check by NOP + KTP (SUBJEK_PAJAK_ID).
+
+    Returns latest SPPT data along with SPOP and subject info. Data per NOP
+    comes from `esppt_cache`; the KTP check runs on every request.
+    """
+    fields = parse_nop(payload.nop)
+
+    entry = await _cached_esppt(session, fields)
+    if entry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data tidak ditemukan")
+
+    ktp_input = (payload.ktp or "").strip()
+    spid = entry.subjek_pajak_id
+    if not ktp_input or (spid and spid != ktp_input):
+        # Hide existence details to avoid leakage
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data tidak ditemukan")
+
+    return _esppt_response(entry)
+
+
 @router.post("/op-registration", response_model=schemas.OpRegResponse)
 async def submit_op_registration(
     payload: schemas.OpRegCreate,
@@ -444,83 +465,49 @@ async def cek_esppt_params(
     if not nop and not ktp:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Minimal isi salah satu dari 'nop' atau 'ktp'")
 
-    spop: Optional[Spop] = None
-    subjek: Optional[DatSubjekPajak] = None
-    fields: Dict[str, str]
-
     if nop:
         fields = parse_nop(nop)
-        res = await _fetch_spop(session, nop_fields=fields)
-        if res is None:
+        entry = await _cached_esppt(session, fields)
+        if entry is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data tidak ditemukan")
-        spop, subjek = res
         if ktp:
-            spid = (spop.subjek_pajak_id or "").strip()
+            spid = entry.subjek_pajak_id
             if not spid or spid != ktp.strip():
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data tidak ditemukan")
-    else:
-        # Only KTP provided: pick one SPOP by SUBJEK_PAJAK_ID
-        ktp_norm = ktp.strip()
-        row = (
-            await session.execute(
-                select(Spop, DatSubjekPajak)
-                .select_from(Spop)
-                .join(DatSubjekPajak, Spop.subjek_pajak_id == DatSubjekPajak.subjek_pajak_id, isouter=True)
-                .where(Spop.subjek_pajak_id == ktp_norm)
-                .limit(1)
-            )
-        ).first()
-        if row is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data tidak ditemukan")
-        spop, subjek = row
-        fields = {
-            "kd_propinsi": spop.kd_propinsi,
-            "kd_dati2": spop.kd_dati2,
-            "kd_kecamatan": spop.kd_kecamatan,
-            "kd_kelurahan": spop.kd_kelurahan,
-            "kd_blok": spop.kd_blok,
-            "no_urut": spop.no_urut,
-            "kd_jns_op": spop.kd_jns_op,
-        }
-
-    # Latest SPPT for the resolved fields
-    stmt = (
-        select(Sppt)
-        .where(
-            and_(
-                Sppt.kd_propinsi == fields["kd_propinsi"],
-                Sppt.kd_dati2 == fields["kd_dati2"],
-                Sppt.kd_kecamatan == fields["kd_kecamatan"],
-                Sppt.kd_kelurahan == fields["kd_kelurahan"],
-                Sppt.kd_blok == fields["kd_blok"],
-                Sppt.no_urut == fields["no_urut"],
-                Sppt.kd_jns_op == fields["kd_jns_op"],
+        return _esppt_response(entry)
+
+    # Only KTP provided: pick one SPOP by SUBJEK_PAJAK_ID
+    ktp_norm = ktp.strip()
+    row = (
+        await session.execute(
+            select(
+                Spop.kd_propinsi,
+                Spop.kd_dati2,
+                Spop.kd_kecamatan,
+                Spop.kd_kelurahan,
+                Spop.kd_blok,
+                Spop.no_urut,
+                Spop.kd_jns_op,
             )
+            .where(Spop.subjek_pajak_id == ktp_norm)
+            .limit(1)
         )
-        .order_by(Sppt.thn_pajak_sppt.desc())
-        .limit(1)
-    )
-
-    sppt_row = (await session.execute(stmt)).scalar_one_or_none()
-    if sppt_row is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SPPT tidak ditemukan")
-
-    detail = schemas.SpptDetail(
-        year=int(sppt_row.thn_pajak_sppt),
-        nop=compose_nop(fields),
-        luas_bumi=float(sppt_row.luas_bumi_sppt or 0),
-        luas_bangunan=float(sppt_row.luas_bng_sppt or 0),
-        pbb_terhutang=float(sppt_row.pbb_terhutang_sppt or 0),
-        pbb_harus_bayar=float(getattr(sppt_row, "pbb_yg_harus_dibayar_sppt", 0) or 0),
-    )
-
-    data = schemas.EspptData(
-        spop=_spop_to_response(fields, spop),
-        subjek_pajak=_subjek_to_response(subjek) if subjek else None,
-        sppt=detail,
-    )
-
-    return schemas.EspptResponse(message="Data e-SPPT", data=data)
+    ).first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data tidak ditemukan")
+    fields = {
+        "kd_propinsi": row.kd_propinsi,
+        "kd_dati2": row.kd_dati2,
+        "kd_kecamatan": row.kd_kecamatan,
+        "kd_kelurahan": row.kd_kelurahan,
+        "kd_blok": row.kd_blok,
+        "no_urut": row.no_urut,
+        "kd_jns_op": row.kd_jns_op,
+    }
+    entry = await _cached_esppt(session, fields)
+    if entry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data tidak ditemukan")
+    return _esppt_response(entry)
 
 
 @router.post("/years", response_model=schemas.YearsResponse)
@@ -640,5 +627,129 @@ async def get_sppt_batch(
     return schemas.SpptBatchResponse(message="Data SPPT berhasil diambil", data=data)
 
 
+@router.post("/batch", response_model=schemas.SpptMultiResponse)
+async def get_sppt_multi(
+    payload: schemas.SpptMultiRequest,
+    session: SessionDep,
+    current_user: User = Depends(get_current_user),
+) -> schemas.SpptMultiResponse:
+    """SPPT banyak NOP sekaligus: tahun tertentu, atau tahun terbaru bila `year` kosong."""
+
+    requested: Dict[str, Dict[str, str]] = {}
+    for raw in payload.nops:
+        digits = "".join(filter(str.isdigit, raw))
+        if len(digits) != 18:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"NOP tidak valid: {raw}")
+        requested.setdefault(digits, parse_nop(digits))
+
+    key_columns = (
+        Sppt.kd_propinsi,
+        Sppt.kd_dati2,
+        Sppt.kd_kecamatan,
+        Sppt.kd_kelurahan,
+        Sppt.kd_blok,
+        Sppt.no_urut,
+        Sppt.kd_jns_op,
+    )
+    keys = [
+        (
+            fields["kd_propinsi"],
+            fields["kd_dati2"],
+            fields["kd_kecamatan"],
+            fields["kd_kelurahan"],
+            fields["kd_blok"],
+            fields["no_urut"],
+            fields["kd_jns_op"],
+        )
+        for fields in requested.values()
+    ]
+    # Kolom saja (bukan entitas): primary key model tidak memuat tahun, jadi entitas antar-tahun akan tertumpuk.
+    stmt = select(
+        *key_columns,
+        Sppt.thn_pajak_sppt,
+        Sppt.luas_bumi_sppt,
+        Sppt.luas_bng_sppt,
+        Sppt.pbb_terhutang_sppt,
+        Sppt.pbb_yg_harus_dibayar_sppt,
+    ).where(tuple_(*key_columns).in_(keys))
+    if payload.year is not None:
+        stmt = stmt.where(Sppt.thn_pajak_sppt == str(payload.year))
+    stmt = stmt.order_by(Sppt.thn_pajak_sppt.desc())
+
+    found: Dict[str, schemas.SpptDetail] = {}
+    for row in await session.execute(stmt):
+        nop = "".join(str(value) for value in row[:7])
+        if nop not in requested or nop in found:
+            continue
+        found[nop] = schemas.SpptDetail(
+            year=int(row.thn_pajak_sppt),
+            nop=nop,
+            luas_bumi=float(row.luas_bumi_sppt or 0),
+            luas_bangunan=float(row.luas_bng_sppt or 0),
+            pbb_terhutang=float(row.pbb_terhutang_sppt or 0),
+            pbb_harus_bayar=float(row.pbb_yg_harus_dibayar_sppt or 0),
+        )
 
+    data = [schemas.SpptMultiItem(nop=nop, sppt=found.get(nop)) for nop in requested]
+    return schemas.SpptMultiResponse(message="Data SPPT berhasil diambil", data=data)
 
+
+@router.post(
+    "/assessment",
+    response_model=schemas.AssessmentStartResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def start_assessment(
+    payload: schemas.AssessmentRequest,
+    background_tasks: BackgroundTasks,
+    session: SessionDep,
+    current_user: User = Depends(get_current_user),
+) -> schemas.AssessmentStartResponse:
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Hanya admin yang dapat menjalankan penetapan")
+    # Validasi tarif sekarang supaya kesalahan konfigurasi langsung terlihat, bukan di task latar.
+    await pick_pbb_tarif(session, payload.kabupaten_op)
+    background_tasks.add_task(
+        assessment.run_assessment,
+        str(payload.tahun),
+        payload.kabupaten_op,
+        payload.kecamatan_op,
+        payload.kelurahan_op,
+        rescan=payload.rescan,
+        workers=payload.workers,
+    )
+    return schemas.AssessmentStartResponse(message="Penetapan SPPT dijalankan", data=payload)
+
+
+@router.get("/assessment", response_model=schemas.AssessmentStatusResponse)
+async def get_assessment_progress(
+    session: SessionDep,
+    current_user: User = Depends(get_current_user),
+    tahun: int = Query(..., ge=1900, le=2100),
+    kabupaten_op: int = Query(..., gt=0),
+) -> schemas.AssessmentStatusResponse:
+    checkpoints = await assessment.progress(session, str(tahun), kabupaten_op)
+    items = [
+        schemas.AssessmentPartition(
+            kecamatan_op=row.kecamatan_op,
+            kelurahan_op=row.kelurahan_op,
+            status=row.status,
+            last_nop=row.last_nop,
+            objek=row.objek,
+            sppt_rows=row.sppt_rows,
+            pbb_total=row.pbb_total,
+            updated_at=row.updated_at,
+        )
+        for row in checkpoints
+    ]
+    data = schemas.AssessmentStatusData(
+        tahun=str(tahun),
+        kabupaten_op=kabupaten_op,
+        partitions=len(items),
+        partitions_done=sum(1 for item in items if item.status == assessment.STATUS_DONE),
+        objek=sum(item.objek for item in items),
+        sppt_rows=sum(item.sppt_rows for item in items),
+        pbb_total=sum(item.pbb_total for item in items),
+        items=items,
+    )
+    return schemas.AssessmentStatusResponse(message="Progres penetapan SPPT", data=data)
@@ -99,10 +99,25 @@ class SpptDetailResponse(BaseResponse):
 class SpptBatchResponse(BaseResponse):
     data: List[SpptDetail]
 
+
+class SpptMultiRequest(BaseModel):
+    nops: List[str] = Field(min_length=1, max_length=500)
+    year: Optional[int] = Field(default=None, ge=1900, le=2100)
+
+
+class SpptMultiItem(BaseModel):
+    nop: str
+    sppt: Optional[SpptDetail] = None
+
+
+class SpptMultiResponse(BaseResponse):
+    data: List[SpptMultiItem]
+
+
 class SpptAutoItem(BaseModel):
     id: str
     spop_id: str
-    lspop_id: str
+    lspop_id: Optional[str] = None
     nop: str
     bumi_njop: int
     bangunan_njop: int
@@ -184,3 +199,43 @@ class OpRegRead(BaseModel):
 
 class OpRegResponse(BaseResponse):
     data: OpRegRead
+
+
+# Penetapan massal SPPT
+class AssessmentRequest(BaseModel):
+    tahun: int = Field(ge=1900, le=2100)
+    kabupaten_op: int = Field(gt=0)
+    kecamatan_op: Optional[int] = None
+    kelurahan_op: Optional[int] = None
+    rescan: bool = False
+    workers: Optional[int] = Field(default=None, ge=1, le=32)
+
+
+class AssessmentStartResponse(BaseResponse):
+    data: AssessmentRequest
+
+
+class AssessmentPartition(BaseModel):
+    kecamatan_op: int
+    kelurahan_op: int
+    status: str
+    last_nop: Optional[str] = None
+    objek: int
+    sppt_rows: int
+    pbb_total: int
+    updated_at: Optional[datetime] = None
+
+
+class AssessmentStatusData(BaseModel):
+    tahun: str
+    kabupaten_op: int
+    partitions: int
+    partitions_done: int
+    objek: int
+    sppt_rows: int
+    pbb_total: int
+    items: List[AssessmentPartition]
+
+
+class AssessmentStatusResponse(BaseResponse):
+    data: AssessmentStatusData
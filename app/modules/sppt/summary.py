@@ -0,0 +1,146 @@
+"""Ringkasan SPPT per NOP yang dimaterialisasi di tabel `sppt_summary`.
+
+Isi ringkasan sama dengan summary `GET /sppt`: hanya baris tahun pajak
+terakhir NOP itu yang dihitung, bumi sekali (nilai terbesar), bangunan
+dijumlahkan, NJOPTKP dan tarif diambil dari baris SPPT terbaru. Baris lama
+dari `POST /lspop` yang belum mengisi THN_PAJAK_SPPT dihitung sebagai tahun
+`create_at`-nya. Ringkasan dihitung ulang di transaksi yang sama setiap kali baris
+SPPT ditulis, atau LSPOP / permohonan SPOP yang menjadi sumber luasnya
+berubah. NOP yang belum punya ringkasan dihitung saat pertama kali dibaca.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import BigInteger, DateTime, Integer, Numeric, String, bindparam, delete, select, text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+class SpptSummary(Base):
+    __tablename__ = "sppt_summary"
+
+    nop: Mapped[str] = mapped_column(String(18), primary_key=True)
+    total_bangunan: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total_luas_bumi: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    total_luas_bangunan: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    total_njop: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    njoptkp: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    pbb_persen_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    pbb_persen: Mapped[Decimal] = mapped_column(Numeric(12, 6), nullable=False, default=0)
+    pbb_terhutang: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+# Batasi `sppt s` ke tahun pajak terakhir tiap NOP di :nops (parameter expanding).
+LATEST_YEAR_JOIN = """
+    JOIN (
+        SELECT y.nop, MAX(COALESCE(y.THN_PAJAK_SPPT, CAST(YEAR(y.create_at) AS CHAR(4)))) AS tahun
+        FROM sppt y
+        WHERE y.nop IN :nops
+        GROUP BY y.nop
+    ) latest_year ON latest_year.nop = s.nop
+        AND COALESCE(s.THN_PAJAK_SPPT, CAST(YEAR(s.create_at) AS CHAR(4))) = latest_year.tahun
+"""
+
+_TOTALS = text(
+    f"""
+    SELECT s.nop,
+           COUNT(*) AS total_bangunan,
+           MAX(COALESCE(s.bumi_njop, 0)) AS bumi_njop,
+           SUM(COALESCE(s.bangunan_njop, 0)) AS bangunan_njop,
+           MAX(COALESCE(sr.luas_tanah, 0)) AS luas_bumi,
+           SUM(COALESCE(ls.luas_bangunan_m2, 0)) AS luas_bangunan
+    FROM sppt s
+    {LATEST_YEAR_JOIN}
+    LEFT JOIN spop_registration sr ON sr.id = s.spop_id
+    LEFT JOIN lampiran_spop ls ON ls.id = s.lspop_id
+    GROUP BY s.nop
+    """
+).bindparams(bindparam("nops", expanding=True))
+
+_LATEST = text(
+    f"""
+    SELECT s.nop, s.njoptkp, s.pbb_persen AS pbb_persen_id, COALESCE(t.pbb_persen, 0) AS pbb_persen_value
+    FROM sppt s
+    {LATEST_YEAR_JOIN}
+    LEFT JOIN pbb_p2 t ON t.id = s.pbb_persen
+    ORDER BY s.nop, s.create_at DESC
+    """
+).bindparams(bindparam("nops", expanding=True))
+
+
+def _digits(value: Optional[str]) -> str:
+    return "".join(ch for ch in (value or "") if ch.isdigit())
+
+
+async def compute(session: AsyncSession, keys: List[str]) -> List[dict]:
+    """Nilai baris `sppt_summary` untuk NOP (18 digit) yang punya SPPT; tanpa menulis apa pun."""
+
+    totals = {row["nop"]: row for row in (await session.execute(_TOTALS, {"nops": keys})).mappings()}
+    latest: Dict[str, dict] = {}
+    for row in (await session.execute(_LATEST, {"nops": keys})).mappings():
+        latest.setdefault(row["nop"], row)
+
+    now = datetime.utcnow()
+    values: List[dict] = []
+    for nop, row in totals.items():
+        head = latest[nop]
+        total_njop = int(row["bumi_njop"] or 0) + int(row["bangunan_njop"] or 0)
+        njoptkp = int(head["njoptkp"] or 0)
+        pbb_persen = Decimal(str(head["pbb_persen_value"] or 0))
+        values.append(
+            {
+                "nop": nop,
+                "total_bangunan": int(row["total_bangunan"]),
+                "total_luas_bumi": int(row["luas_bumi"] or 0),
+                "total_luas_bangunan": int(row["luas_bangunan"] or 0),
+                "total_njop": total_njop,
+                "njoptkp": njoptkp,
+                "pbb_persen_id": int(head["pbb_persen_id"] or 0),
+                "pbb_persen": pbb_persen,
+                # Sama dengan perhitungan lama GET /sppt (float, dibulatkan ke bawah).
+                "pbb_terhutang": int(max(total_njop - njoptkp, 0) * float(pbb_persen)),
+                "updated_at": now,
+            }
+        )
+    return values
+
+
+async def refresh(session: AsyncSession, nops: Iterable[Optional[str]]) -> None:
+    """Hitung ulang ringkasan NOP-NOP ini (tanpa commit); NOP tanpa SPPT dihapus dari ringkasan."""
+
+    keys = sorted({digits for digits in map(_digits, nops) if len(digits) == 18})
+    if not keys:
+        return
+    await session.flush()
+    values = await compute(session, keys)
+    if values:
+        stmt = mysql_insert(SpptSummary).values(values)
+        await session.execute(
+            stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in values[0] if name != "nop"})
+        )
+    found = {row["nop"] for row in values}
+    gone = [nop for nop in keys if nop not in found]
+    if gone:
+        await session.execute(delete(SpptSummary).where(SpptSummary.nop.in_(gone)))
+
+
+async def get_summary(session: AsyncSession, nop: str) -> Optional[SpptSummary]:
+    """Ringkasan satu NOP (digit); dihitung dan disimpan dulu bila belum ada."""
+
+    summary = await session.get(SpptSummary, nop)
+    if summary is not None:
+        return summary
+    await refresh(session, [nop])
+    await session.commit()
+    return (await session.execute(select(SpptSummary).where(SpptSummary.nop == nop))).scalar_one_or_none()
+
+
+__all__ = ["LATEST_YEAR_JOIN", "SpptSummary", "compute", "get_summary", "refresh"]
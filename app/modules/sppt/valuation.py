@@ -0,0 +1,243 @@
+"""Perhitungan NJOP/PBB: jalur skalar (per objek) dan jalur batch berbasis array.
+
+Aturan yang sama dipakai keduanya:
+
+- bumi_njop = luas_bumi x NJOP kelas bumi, bangunan_njop = luas_bangunan x NJOP kelas bangunan
+  (kelas tidak dikenal bernilai 0, sama seperti `_njop_value`);
+- dasar = max(bumi_njop + bangunan_njop - NJOPTKP, 0);
+- pbb_terhutang = dasar x tarif, dibulatkan ROUND_HALF_UP ke rupiah.
+
+Jalur batch memakai aritmetika fixed-point int64: tarif disimpan sebagai
+bilangan bulat per `RATE_SCALE`, sehingga hasilnya identik dengan Decimal
+selama tarif tidak punya lebih dari 6 angka desimal.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+RATE_DECIMALS = 6
+RATE_SCALE = 10**RATE_DECIMALS
+
+ArrayLike = Union[np.ndarray, Sequence[int]]
+
+
+def rate_to_fixed(tarif: Union[Decimal, float, str]) -> int:
+    """Tarif desimal -> bilangan bulat per `RATE_SCALE`; ValueError bila presisinya terlalu tinggi."""
+
+    scaled = Decimal(str(tarif)) * RATE_SCALE
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f"Tarif {tarif} melebihi {RATE_DECIMALS} angka desimal")
+    return int(scaled)
+
+
+def dasar_pengenaan(total_njop: int, njoptkp: int) -> int:
+    return max(int(total_njop) - int(njoptkp), 0)
+
+
+def pbb_terhutang(total_njop: int, njoptkp: int, tarif: Union[Decimal, float, str]) -> int:
+    dasar = Decimal(dasar_pengenaan(total_njop, njoptkp))
+    return int((dasar * Decimal(str(tarif))).quantize(Decimal("1."), rounding=ROUND_HALF_UP))
+
+
+def _safe_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _normalize_label(text: str) -> str:
+    # Buang digit dan whitespace, lowercase, untuk mencocokkan "1 Kabupaten Badung" == "Kabupaten Badung"
+    clean = "".join(ch for ch in (text or "") if not ch.isdigit())
+    return clean.strip().lower()
+
+
+async def pick_pbb_tarif(session: AsyncSession, kabupaten_op: Optional[int]) -> Tuple[int, Decimal]:
+    """
+    Pilih tarif PBB dari tabel pbb_p2:
+    1) Jika PBB_TARIF_ID di env, wajib ada baris itu.
+    2) Jika tidak, pakai nama kabupaten (kabupaten_kota.nama_kabupaten) yang dicocokkan dengan pbb_p2.daerah (tanpa angka, case-insensitive).
+    Kolom yang dipakai: pbb_persen (angka desimal, misal 0.2).
+    """
+    # 1. Env override
+    if settings.pbb_tarif_id is not None:
+        result = await session.execute(
+            text("SELECT id, pbb_persen FROM pbb_p2 WHERE id = :id LIMIT 1"),
+            {"id": settings.pbb_tarif_id},
+        )
+        row = result.first()
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Tarif PBB_TARIF_ID tidak ditemukan di pbb_p2",
+            )
+        return _safe_int(row[0]), Decimal(str(row[1] or 0))
+
+    # 2. Berdasarkan nama kabupaten
+    kab_id = _safe_int(kabupaten_op)
+    if kab_id <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="kabupaten_op tidak valid untuk menentukan tarif PBB",
+        )
+
+    # Ambil nama kabupaten lalu cocokan dengan pbb_p2.daerah (normalisasi nama buang angka)
+    try:
+        kab_row = await session.execute(
+            text("SELECT nama_kabupaten FROM kabupaten_kota WHERE id_kabupaten = :id LIMIT 1"),
+            {"id": kab_id},
+        )
+        kab_name_row = kab_row.first()
+        kab_name = _normalize_label(kab_name_row[0]) if kab_name_row and kab_name_row[0] else ""
+    except OperationalError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Kolom/struktur kabupaten_kota tidak sesuai: {exc}",
+        ) from exc
+
+    if not kab_name:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Nama kabupaten tidak ditemukan untuk menentukan tarif PBB",
+        )
+
+    try:
+        pbb_rows = await session.execute(text("SELECT id, daerah, pbb_persen FROM pbb_p2"))
+    except OperationalError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Kolom/struktur pbb_p2 tidak sesuai: {exc}",
+        ) from exc
+
+    match_id: Optional[int] = None
+    match_rate = Decimal(0)
+    for r in pbb_rows:
+        daerah_norm = _normalize_label(r.daerah)
+        if daerah_norm == kab_name:
+            match_id = _safe_int(r.id)
+            match_rate = Decimal(str(r.pbb_persen or 0))
+            break
+
+    if match_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Tarif PBB untuk kabupaten_op tidak ditemukan di pbb_p2 (cocokkan nama daerah)",
+        )
+
+    return match_id, match_rate
+
+
+class Valuation(NamedTuple):
+    bumi_njop: np.ndarray
+    bangunan_njop: np.ndarray
+    total_njop: np.ndarray
+    dasar_pengenaan: np.ndarray
+    pbb_terhutang: np.ndarray
+
+
+def _dense_table(values: Mapping[int, int], fill: int = 0) -> np.ndarray:
+    ids = [int(key) for key in values if int(key) >= 0]
+    table = np.full(max(ids, default=-1) + 1, fill, dtype=np.int64)
+    for key in ids:
+        table[key] = int(values[key])
+    return table
+
+
+def _lookup(table: np.ndarray, ids: np.ndarray, fill: int = 0) -> np.ndarray:
+    valid = (ids >= 0) & (ids < len(table))
+    out = np.full(ids.shape, fill, dtype=np.int64)
+    out[valid] = table[ids[valid]]
+    return out
+
+
+def _mul_rate_half_up(dasar: np.ndarray, rates: np.ndarray) -> np.ndarray:
+    # dasar x tarif bisa melampaui int64; pecah dasar = hi*SCALE + lo supaya hasil antara tetap kecil.
+    hi, lo = np.divmod(dasar, RATE_SCALE)
+    return hi * rates + (lo * rates + RATE_SCALE // 2) // RATE_SCALE
+
+
+@dataclass(frozen=True)
+class ValuationTables:
+    """Tabel referensi padat (index = id) untuk kelas bumi, kelas bangunan, dan tarif `pbb_p2`."""
+
+    kelas_bumi: np.ndarray
+    kelas_bangunan: np.ndarray
+    tarif: np.ndarray
+
+    @classmethod
+    def from_mappings(
+        cls,
+        kelas_bumi: Mapping[int, int],
+        kelas_bangunan: Mapping[int, int],
+        tarif: Mapping[int, Decimal],
+    ) -> "ValuationTables":
+        return cls(
+            kelas_bumi=_dense_table(kelas_bumi),
+            kelas_bangunan=_dense_table(kelas_bangunan),
+            tarif=_dense_table({int(key): rate_to_fixed(value) for key, value in tarif.items()}, fill=-1),
+        )
+
+    def value(
+        self,
+        luas_bumi: ArrayLike,
+        luas_bangunan: ArrayLike,
+        kelas_bumi_ids: ArrayLike,
+        kelas_bangunan_ids: ArrayLike,
+        tarif_ids: ArrayLike,
+        njoptkp: int,
+    ) -> Valuation:
+        """Nilai banyak objek sekaligus; semua input berupa kolom sepanjang jumlah objek.
+
+        Id kelas kosong diisi -1 (NJOP 0). Id tarif yang tidak ada di `pbb_p2`
+        menghasilkan ValueError karena tarif tidak boleh ditebak.
+        """
+
+        luas_bumi = np.asarray(luas_bumi, dtype=np.int64)
+        luas_bangunan = np.asarray(luas_bangunan, dtype=np.int64)
+        tarif_ids = np.asarray(tarif_ids, dtype=np.int64)
+
+        rates = _lookup(self.tarif, tarif_ids, fill=-1)
+        if (rates < 0).any():
+            missing = sorted({int(value) for value in tarif_ids[rates < 0]})
+            raise ValueError(f"Tarif pbb_p2 tidak ditemukan: {missing}")
+
+        bumi_njop = luas_bumi * _lookup(self.kelas_bumi, np.asarray(kelas_bumi_ids, dtype=np.int64))
+        bangunan_njop = luas_bangunan * _lookup(self.kelas_bangunan, np.asarray(kelas_bangunan_ids, dtype=np.int64))
+        total_njop = bumi_njop + bangunan_njop
+        dasar = np.maximum(total_njop - int(njoptkp), 0)
+        pbb = _mul_rate_half_up(dasar, rates)
+        return Valuation(bumi_njop, bangunan_njop, total_njop, dasar, pbb)
+
+
+async def load_tables(session: AsyncSession) -> ValuationTables:
+    kelas_bumi = (await session.execute(text("SELECT id, njop FROM kelas_bumi_njop"))).all()
+    kelas_bangunan = (await session.execute(text("SELECT id, njop FROM kelas_bangunan_njop"))).all()
+    tarif = (await session.execute(text("SELECT id, pbb_persen FROM pbb_p2"))).all()
+    return ValuationTables.from_mappings(
+        {int(row[0]): int(row[1] or 0) for row in kelas_bumi},
+        {int(row[0]): int(row[1] or 0) for row in kelas_bangunan},
+        {int(row[0]): Decimal(str(row[1] or 0)) for row in tarif},
+    )
+
+
+__all__ = [
+    "RATE_SCALE",
+    "Valuation",
+    "ValuationTables",
+    "dasar_pengenaan",
+    "load_tables",
+    "pbb_terhutang",
+    "pick_pbb_tarif",
+    "rate_to_fixed",
+]
@@ -0,0 +1,109 @@
+"""Bandingkan pembacaan halaman `GET /spop/requests`: builder N-query lama vs `_registration_page_stmt`.
+
+Jalur lama: satu SELECT permohonan lalu `_build_code_maps`, `_build_subject_maps`,
+`_build_status_maps` dan `_build_njop_maps` (query referensi berurutan). Jalur
+baru: satu SELECT dengan join referensi, wilayah dari `region_cache`. Hanya
+membaca permohonan yang sudah ada di database `DATABASE_URL`:
+
+    python -m scripts.bench_registration_page [--limits=10,100] [--repeat=20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("JWT_SECRET", "bench")
+
+from sqlalchemy import event, select  # noqa: E402
+
+from app.core.database import AsyncSessionFactory, engine  # noqa: E402
+from app.modules.spop.models import SpopRegistration  # noqa: E402
+from app.modules.spop.router import (  # noqa: E402
+    _build_code_maps,
+    _build_njop_maps,
+    _build_status_maps,
+    _build_subject_maps,
+    _joined_row_to_record,
+    _registration_page_stmt,
+    _registration_to_record,
+    region_cache,
+)
+
+ORDER = (SpopRegistration.submitted_at.desc(), SpopRegistration.id.desc())
+
+
+async def _old_page(session, limit: int):
+    rows = (await session.execute(select(SpopRegistration).order_by(*ORDER).limit(limit))).scalars().all()
+    codes = await _build_code_maps(session, rows)
+    subject_codes = await _build_subject_maps(session, rows)
+    status_codes = await _build_status_maps(session, rows)
+    njop_codes = await _build_njop_maps(session, rows)
+    return [
+        _registration_to_record(
+            row, codes.get(row.id, {}), subject_codes.get(row.id, {}), status_codes.get(row.id, {}),
+            njop_codes.get(row.id, {}),
+        )
+        for row in rows
+    ]
+
+
+async def _new_page(session, limit: int):
+    rows = (await session.execute(_registration_page_stmt().order_by(*ORDER).limit(limit))).all()
+    await region_cache.ensure_loaded(session)
+    return [_joined_row_to_record(row) for row in rows]
+
+
+async def _timed(repeat: int, page, limit: int, queries: list):
+    """Waktu terbaik dan jumlah query per halaman; tiap putaran memakai sesi baru."""
+
+    best = float("inf")
+    count = 0
+    for _ in range(repeat):
+        async with AsyncSessionFactory() as session:
+            before = queries[0]
+            started = time.perf_counter()
+            await page(session, limit)
+            best = min(best, time.perf_counter() - started)
+            count = queries[0] - before
+    return best, count
+
+
+async def _run(limits, repeat: int) -> None:
+    queries = [0]
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count(*_):
+        queries[0] += 1
+
+    async with AsyncSessionFactory() as session:
+        await region_cache.ensure_loaded(session)
+        for limit in limits:
+            old = [record.model_dump() for record in await _old_page(session, limit)]
+            session.expunge_all()
+            new = [record.model_dump() for record in await _new_page(session, limit)]
+            if old != new:
+                raise SystemExit(f"limit={limit}: keluaran jalur lama dan baru berbeda")
+
+    for limit in limits:
+        old_seconds, old_queries = await _timed(repeat, _old_page, limit, queries)
+        new_seconds, new_queries = await _timed(repeat, _new_page, limit, queries)
+        print(
+            f"limit={limit:<4} lama {old_seconds * 1000:8.2f} ms ({old_queries} query)"
+            f"  baru {new_seconds * 1000:8.2f} ms ({new_queries} query)  ({old_seconds / new_seconds:.1f}x)"
+        )
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limits", default="10,100")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(_run([int(limit) for limit in args.limits.split(",")], args.repeat))
+
+
+if __name__ == "__main__":
+    main()
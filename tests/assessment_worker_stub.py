@@ -0,0 +1,44 @@
+"""Initializer worker untuk test penetapan massal: `_assess_chunk` diganti stub tanpa database.
+
+Diimpor oleh proses worker (spawn), jadi harus berupa modul biasa yang bisa
+diimpor dari `tests/`.
+"""
+
+import os
+from typing import Dict
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.modules.sppt import assessment
+
+CHUNKS_PER_PARTITION = 3
+
+_chunks: Dict[tuple, int] = {}
+
+
+def chunk_luas(partition, chunk: int, chunk_size: int):
+    return [partition.kelurahan_op * 1000 + chunk * chunk_size + offset for offset in range(chunk_size)]
+
+
+async def fake_assess_chunk(session, context, partition, chunk_size, report) -> bool:
+    assert isinstance(session, AsyncSession)
+    done = _chunks.get(partition, 0)
+    if done == CHUNKS_PER_PARTITION:
+        return False
+    _chunks[partition] = done + 1
+    luas = chunk_luas(partition, done, chunk_size)
+    value = context.tables.value(
+        luas, [0] * chunk_size, [1] * chunk_size, [-1] * chunk_size, [context.tarif_id] * chunk_size, context.njoptkp
+    )
+    report.objek += chunk_size
+    report.sppt_rows += chunk_size
+    report.pbb_total += int(value.pbb_terhutang.sum())
+    engine = session.bind
+    with open(os.path.join(os.environ["ASSESSMENT_STUB_DIR"], str(os.getpid())), "a") as handle:
+        handle.write(f"{id(engine)} {engine.pool.size()} {partition.kecamatan_op}/{partition.kelurahan_op}\n")
+    return True
+
+
+def init_worker() -> None:
+    assessment._assess_chunk = fake_assess_chunk
+    assessment._init_worker()
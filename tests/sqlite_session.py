@@ -0,0 +1,43 @@
+"""Session async tipis di atas SQLite (sinkron) untuk menjalankan query yang sebenarnya di test.
+
+Fungsi MySQL yang dipakai query (`YEAR`) didaftarkan sebagai fungsi SQLite.
+"""
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+
+class SqliteSession:
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    async def execute(self, stmt, params=None):
+        return self.session.execute(stmt, params)
+
+    async def flush(self):
+        self.session.flush()
+
+    async def commit(self):
+        self.session.commit()
+
+    async def rollback(self):
+        self.session.rollback()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def sqlite_session(*ddl: str) -> SqliteSession:
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def add_functions(connection, record):
+        connection.create_function("YEAR", 1, lambda value: int(str(value)[:4]) if value else None)
+
+    with engine.begin() as connection:
+        for statement in ddl:
+            connection.exec_driver_sql(statement)
+    return SqliteSession(Session(engine))
@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.modules.spop import allocator
+from app.modules.spop.allocator import MAX_NO_URUT, BlokKey
+
+KEY = BlokKey("51", "03", "010", "001", "001")
+
+
+def _patch_counter(monkeypatch, counter):
+    async def lock(session, key):
+        return counter
+
+    monkeypatch.setattr(allocator, "_lock_counter", lock)
+
+
+def _bitmap_counter(numbers):
+    used = 0
+    for number in numbers:
+        used |= 1 << number
+    return SimpleNamespace(used_bitmap=allocator._from_bitmap(used), last_no_urut=max(numbers, default=0))
+
+
+def _used(counter):
+    bitmap = allocator._to_bitmap(counter.used_bitmap)
+    return [number for number in range(1, 20) if bitmap >> number & 1]
+
+
+def test_block_reservation_is_all_or_nothing(monkeypatch):
+    counter = _bitmap_counter(range(1, MAX_NO_URUT - 1))
+    _patch_counter(monkeypatch, counter)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(allocator.reserve_no_urut_block(None, KEY, 3))
+    assert exc.value.status_code == 409
+    assert counter.last_no_urut == MAX_NO_URUT - 2
+    assert asyncio.run(allocator.reserve_no_urut_block(None, KEY, 2)) == [f"{MAX_NO_URUT - 1:04d}", f"{MAX_NO_URUT:04d}"]
+
+
+def test_failed_import_rows_give_numbers_back(monkeypatch):
+    counter = _bitmap_counter([1, 2])
+    _patch_counter(monkeypatch, counter)
+    in_use = {2}
+
+    async def numbers_in_use(session, key, numbers):
+        return in_use & set(numbers)
+
+    monkeypatch.setattr(allocator, "_numbers_in_use", numbers_in_use)
+
+    async def run():
+        reserved = await allocator.reserve_no_urut_block(None, KEY, 3)
+        fresh = await allocator.claim_no_urut(None, KEY, "0009")
+        again = await allocator.claim_no_urut(None, KEY, "0002")
+        # Baris dengan no urut 0004, 0005, 0009 gagal disimpan.
+        await allocator.release_reserved(None, KEY, ["0004", "0005", "0009"])
+        return reserved, fresh, again
+
+    reserved, fresh, again = asyncio.run(run())
+    assert reserved == ["0003", "0004", "0005"]
+    assert fresh is True and again is False
+    assert _used(counter) == [1, 2, 3]
+    assert counter.last_no_urut == 3
+    assert asyncio.run(allocator.reserve_no_urut_block(None, KEY, 1)) == ["0004"]
+
+
+def test_release_keeps_numbers_used_elsewhere(monkeypatch):
+    counter = _bitmap_counter([1, 2, 3])
+    _patch_counter(monkeypatch, counter)
+
+    async def numbers_in_use(session, key, numbers):
+        return {3} & set(numbers)
+
+    monkeypatch.setattr(allocator, "_numbers_in_use", numbers_in_use)
+    asyncio.run(allocator.release_reserved(None, KEY, ["0002", "0003"]))
+    assert _used(counter) == [1, 3]
+    assert counter.last_no_urut == 3
@@ -0,0 +1,217 @@
+import asyncio
+import dataclasses
+import os
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy import inspect, text
+from sqlalchemy.sql.dml import Insert
+
+import assessment_worker_stub as stub
+from sqlite_session import sqlite_session
+from app.modules.lspop.models import LampiranSpop
+from app.modules.spop.models import SpopRegistration
+from app.modules.sppt import assessment
+from app.modules.sppt.assessment import AssessmentContext, AssessmentReport, Partition, assess_partition
+from app.modules.sppt.summary import compute as compute_summary
+from app.modules.sppt.valuation import ValuationTables, pbb_terhutang
+
+TARIF = Decimal("0.0015")
+
+
+def _context() -> AssessmentContext:
+    return AssessmentContext(
+        tahun="2026",
+        kabupaten_op=4,
+        tables=ValuationTables.from_mappings({1: 48_000}, {}, {3: TARIF}),
+        tarif_id=3,
+        njoptkp=10_000_000,
+    )
+
+
+def test_partitions_run_in_spawned_workers_with_own_engine(monkeypatch, tmp_path):
+    monkeypatch.setenv("ASSESSMENT_STUB_DIR", str(tmp_path))
+    monkeypatch.setattr(assessment, "_init_worker", stub.init_worker)
+    context = _context()
+    partitions = [Partition(10, kelurahan) for kelurahan in range(1, 6)]
+    chunk_size = 4
+    report = AssessmentReport(tahun=context.tahun, kabupaten_op=context.kabupaten_op)
+
+    asyncio.run(assessment._assess_parallel(context, partitions, chunk_size, 2, report))
+
+    assert report.errors == []
+    assert report.partitions == len(partitions)
+    assert report.objek == len(partitions) * stub.CHUNKS_PER_PARTITION * chunk_size
+    expected = sum(
+        pbb_terhutang(luas * 48_000, context.njoptkp, TARIF)
+        for partition in partitions
+        for chunk in range(stub.CHUNKS_PER_PARTITION)
+        for luas in stub.chunk_luas(partition, chunk, chunk_size)
+    )
+    assert report.pbb_total == expected
+
+    seen = []
+    workers = list(tmp_path.iterdir())
+    assert 1 <= len(workers) <= 2
+    for worker in workers:
+        assert int(worker.name) != os.getpid()
+        lines = [line.split() for line in worker.read_text().splitlines()]
+        # Satu engine (pool_size=1) per proses worker, dipakai ulang untuk semua partisinya.
+        assert {(engine, size) for engine, size, _ in lines} == {(lines[0][0], "1")}
+        seen.extend(label for _, _, label in lines)
+    assert sorted(set(seen)) == sorted(f"10/{kelurahan}" for kelurahan in range(1, 6))
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+    def scalars(self):
+        return iter(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeSession:
+    """Cukup untuk `_assess_chunk`: permohonan berurutan NOP, tanpa LSPOP dan tanpa SPPT lama."""
+
+    def __init__(self, checkpoint, registrations):
+        self.checkpoint = checkpoint
+        self.registrations = registrations
+        self.inserted = []
+        self.commits = 0
+
+    async def execute(self, stmt, params=None):
+        if isinstance(stmt, Insert):
+            self.inserted.extend(row["nop"] for row in stmt._multi_values[0])
+            return FakeResult([])
+        first = stmt.selected_columns[0]
+        if first.table is SpopRegistration.__table__:
+            last = self.checkpoint.last_nop or ""
+            pending = [row for row in self.registrations if row.nop > last]
+            return FakeResult(pending[: stmt._limit])
+        if first.table is LampiranSpop.__table__:
+            return FakeResult([])
+        if first.table is assessment.SPPT_TABLE and first.key == "spop_id":
+            return FakeResult([])
+        if first.table is assessment.SPPT_TABLE and first.key == "nop":
+            return FakeResult(sorted(set(self.inserted)))
+        raise AssertionError(f"query tak terduga: {stmt}")
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_summary_is_refreshed_once_per_partition(monkeypatch):
+    checkpoint = SimpleNamespace(status=assessment.STATUS_RUNNING, last_nop=None, objek=0, sppt_rows=0, pbb_total=0)
+    registrations = [
+        SimpleNamespace(
+            id=f"r{index}", nop=f"3204010001001{index:04d}0", luas_tanah=500, kelas_bumi_njop=1, kelas_bangunan_njop=None
+        )
+        for index in range(5)
+    ]
+    session = FakeSession(checkpoint, registrations)
+    refreshed = []
+
+    async def lock_checkpoint(session, context, partition):
+        return checkpoint
+
+    async def refresh(session, nops):
+        refreshed.append(list(nops))
+
+    monkeypatch.setattr(assessment, "_lock_checkpoint", lock_checkpoint)
+    monkeypatch.setattr(assessment.sppt_summary, "refresh", refresh)
+
+    report = asyncio.run(assess_partition(lambda: session, _context(), Partition(10, 1), 2))
+
+    assert report.errors == []
+    assert report.objek == 5 and report.sppt_rows == 5
+    assert session.commits == 4  # 3 chunk + transaksi penutup partisi
+    assert refreshed == [sorted(row.nop for row in registrations)]
+    assert checkpoint.status == assessment.STATUS_DONE
+
+
+def _sqlite_session():
+    session = sqlite_session(
+        "CREATE TABLE sppt (id TEXT PRIMARY KEY, spop_id TEXT, lspop_id TEXT, nop TEXT, bumi_njop INTEGER,"
+        " bangunan_njop INTEGER, njoptkp INTEGER, pbb_persen INTEGER, THN_PAJAK_SPPT TEXT, create_at DATETIME)",
+        "CREATE TABLE pbb_p2 (id INTEGER PRIMARY KEY, pbb_persen NUMERIC)",
+        "INSERT INTO pbb_p2 VALUES (3, 0.0015)",
+    )
+    SpopRegistration.__table__.create(session.session.get_bind())
+    LampiranSpop.__table__.create(session.session.get_bind())
+    return session
+
+
+def test_lspop_row_without_year_is_not_assessed_twice(monkeypatch):
+    nop = "32.04.010.001.001.0001.0"
+    digits = "320401000100100010"
+    sqlite = _sqlite_session()
+    registration = {
+        attr.key: 0 if attr.columns[0].type.python_type is int else "-"
+        for attr in inspect(SpopRegistration).column_attrs
+        if not attr.columns[0].nullable and attr.columns[0].server_default is None
+    }
+    registration.update(
+        id="r1", nop=nop, kabupaten_op=4, kecamatan_op=10, kelurahan_op=1, luas_tanah=500, kelas_bumi_njop=1,
+        status="Disetujui",
+    )
+    sqlite.session.add(SpopRegistration(**registration))
+    sqlite.session.add(LampiranSpop(id="l1", spop_id="r1", nop=nop, luas_bangunan_m2=0))
+    # SPPT otomatis dari POST /lspop versi lama: THN_PAJAK_SPPT kosong.
+    sqlite.session.execute(
+        text(
+            "INSERT INTO sppt (id, spop_id, lspop_id, nop, bumi_njop, bangunan_njop, njoptkp, pbb_persen, create_at)"
+            " VALUES ('s1', 'r1', 'l1', :nop, 24000000, 0, 10000000, 3, :create_at)"
+        ),
+        {"nop": digits, "create_at": datetime(2026, 3, 1)},
+    )
+    sqlite.session.commit()
+    summaries = {}
+
+    async def lock_checkpoint(session, context, partition):
+        return checkpoints.setdefault(
+            context.tahun,
+            SimpleNamespace(status=assessment.STATUS_RUNNING, last_nop=None, objek=0, sppt_rows=0, pbb_total=0),
+        )
+
+    async def refresh(session, nops):
+        for row in await compute_summary(session, sorted(nops)):
+            summaries[row["nop"]] = row
+
+    checkpoints = {}
+    monkeypatch.setattr(assessment, "_lock_checkpoint", lock_checkpoint)
+    monkeypatch.setattr(assessment.sppt_summary, "refresh", refresh)
+
+    def run(tahun):
+        context = dataclasses.replace(_context(), tahun=tahun)
+        return asyncio.run(assess_partition(lambda: sqlite, context, Partition(10, 1), 10))
+
+    report = run("2026")
+    assert report.errors == []
+    assert report.sppt_rows == 0 and report.existing_rows == 1
+
+    report = run("2027")
+    assert report.errors == [] and report.sppt_rows == 1
+    rows = sqlite.session.execute(text("SELECT THN_PAJAK_SPPT FROM sppt ORDER BY id = 's1' DESC")).scalars().all()
+    assert rows == [None, "2027"]
+
+    summary = summaries[digits]
+    # Hanya baris tahun 2027: bumi 500 m2 x 48.000 dihitung sekali, bukan dua kali.
+    assert summary["total_bangunan"] == 1
+    assert summary["total_njop"] == 24_000_000
+    assert summary["pbb_terhutang"] == int((24_000_000 - 10_000_000) * 0.0015)
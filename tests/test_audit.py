@@ -0,0 +1,115 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from sqlalchemy.exc import DataError, OperationalError
+
+from app.core.audit import AuditBuffer
+
+NOP = "32.04.010.001.001.0001.0"
+
+
+class FakeDatabase:
+    """Pengganti `spop_event`: baris ber-`entity` "rusak" ditolak, `down` meniru koneksi putus."""
+
+    def __init__(self):
+        self.rows = []
+        self.down = False
+        self.batch_calls = 0
+
+    def session(self):
+        return FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, database):
+        self.database = database
+        self.staged = []
+
+    async def execute(self, stmt, rows):
+        if self.database.down:
+            raise OperationalError("INSERT", {}, Exception("koneksi putus"))
+        if len(rows) > 1:
+            self.database.batch_calls += 1
+        if any(row["entity"] == "rusak" for row in rows):
+            raise DataError("INSERT", {}, Exception("Data too long"))
+        self.staged.extend(rows)
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        staged = len(self.staged)
+        try:
+            yield
+        except Exception:
+            del self.staged[staged:]
+            raise
+
+    async def commit(self):
+        self.database.rows.extend(self.staged)
+        self.staged = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _buffer(database, **kwargs):
+    return AuditBuffer(batch_size=3, flush_interval=60, session_factory=database.session, **kwargs)
+
+
+def test_record_and_flush_in_batches():
+    database = FakeDatabase()
+    buffer = _buffer(database)
+    for index in range(7):
+        buffer.record(NOP, "spop", "update", entity_id=str(index), changes={"luas": index})
+    buffer.record("-", "spop", "update")
+
+    assert asyncio.run(buffer.flush()) == 7
+    assert [row["entity_id"] for row in database.rows] == [str(index) for index in range(7)]
+    assert database.rows[0]["nop"] == "320401000100100010"
+    assert database.batch_calls == 2
+    assert asyncio.run(buffer.flush()) == 0
+
+
+def test_full_queue_drops_new_events():
+    database = FakeDatabase()
+    buffer = _buffer(database, max_pending=4)
+    for index in range(6):
+        buffer.record(NOP, "spop", "update", entity_id=str(index))
+
+    assert buffer.dropped == 2
+    assert asyncio.run(buffer.flush()) == 4
+    assert [row["entity_id"] for row in database.rows] == ["0", "1", "2", "3"]
+
+
+def test_rejected_rows_are_dropped_after_max_attempts():
+    database = FakeDatabase()
+    buffer = _buffer(database, max_attempts=2)
+    buffer.record(NOP, "spop", "update", entity_id="a")
+    buffer.record(NOP, "rusak", "update", entity_id="b")
+    buffer.record(NOP, "spop", "update", entity_id="c")
+    buffer.record(NOP, "spop", "update", entity_id="d")
+
+    assert asyncio.run(buffer.flush()) == 0
+    assert asyncio.run(buffer.flush()) == 0
+    assert database.rows == []
+    # Percobaan ketiga: per baris, "b" dibuang, sisanya kembali ke batch biasa.
+    assert asyncio.run(buffer.flush()) == 3
+    assert [row["entity_id"] for row in database.rows] == ["a", "c", "d"]
+    assert buffer.dropped == 1
+
+
+def test_connection_errors_keep_events_queued():
+    database = FakeDatabase()
+    buffer = _buffer(database, max_attempts=1)
+    buffer.record(NOP, "spop", "update", entity_id="a")
+    database.down = True
+
+    for _ in range(3):
+        assert asyncio.run(buffer.flush()) == 0
+    assert buffer.dropped == 0
+
+    database.down = False
+    assert asyncio.run(buffer.flush()) == 1
+    assert [row["entity_id"] for row in database.rows] == ["a"]
@@ -0,0 +1,187 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app.core import idempotency
+from app.core.idempotency import STATE_DONE, STATE_PENDING, IdempotencyMiddleware
+
+PATH = "/api/sppt/op-registration"
+ANONYMOUS_KEY = b"k" * idempotency.MIN_ANONYMOUS_KEY_LENGTH
+
+
+class MemoryStore:
+    """Pengganti tabel `idempotency_key` untuk satu middleware."""
+
+    def __init__(self, middleware: IdempotencyMiddleware) -> None:
+        self.rows = {}
+        self.renewals = 0
+        middleware._claim = self.claim
+        middleware._load = self.load
+        middleware._store = self.store
+        middleware._release = self.release
+        middleware._renew = self.renew
+        middleware._maybe_purge = self.noop
+        self.middleware = middleware
+
+    async def claim(self, key_hash):
+        if key_hash in self.rows:
+            return False
+        self.rows[key_hash] = SimpleNamespace(state=STATE_PENDING, request_hash=None)
+        self.middleware._inflight[key_hash] = asyncio.Event()
+        return True
+
+    async def load(self, key_hash):
+        return self.rows.get(key_hash)
+
+    async def store(self, key_hash, request_hash, status_code, content_type, body):
+        self.rows[key_hash] = SimpleNamespace(
+            state=STATE_DONE,
+            request_hash=request_hash,
+            status_code=status_code,
+            content_type=content_type,
+            body=idempotency.zlib.compress(body),
+        )
+        return True
+
+    async def release(self, key_hash):
+        if self.rows.get(key_hash) and self.rows[key_hash].state == STATE_PENDING:
+            del self.rows[key_hash]
+
+    async def renew(self, key_hash):
+        self.renewals += 1
+
+    async def noop(self):
+        return None
+
+
+def _handler(calls, delay=0.0):
+    async def app(scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        await asyncio.sleep(delay)
+        calls.append(body)
+        payload = json.dumps({"created": len(calls)}).encode()
+        await send({"type": "http.response.start", "status": 201, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": payload})
+
+    return app
+
+
+def _request(middleware, key, chunks, headers=()):
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": PATH,
+        "headers": [(b"idempotency-key", key), *headers],
+    }
+    pending = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return pending.pop(0) if pending else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        await middleware(scope, receive, send)
+        start = sent[0]
+        body = b"".join(message.get("body", b"") for message in sent[1:])
+        return start["status"], dict(start["headers"]), body
+
+    return run()
+
+
+def _middleware(app):
+    middleware = IdempotencyMiddleware(app, paths=[PATH])
+    return middleware, MemoryStore(middleware)
+
+
+def test_same_key_same_body_replays_and_different_body_is_rejected():
+    calls = []
+    middleware, _ = _middleware(_handler(calls))
+
+    async def run():
+        first = await _request(middleware, ANONYMOUS_KEY, [b'{"nama": "Ani"}'])
+        again = await _request(middleware, ANONYMOUS_KEY, [b'{"nama": ', b'"Ani"}'])
+        other = await _request(middleware, ANONYMOUS_KEY, [b'{"nama": "Budi"}'])
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert calls == [b'{"nama": "Ani"}']
+    assert first[0] == 201 and again[0] == 201 and again[2] == first[2]
+    assert again[1][b"idempotent-replayed"] == b"true"
+    assert other[0] == 422
+
+
+def test_multipart_retry_with_new_boundary_replays():
+    calls = []
+    middleware, _ = _middleware(_handler(calls))
+
+    def form(boundary: bytes):
+        body = (
+            b"--" + boundary + b'\r\nContent-Disposition: form-data; name="nama"\r\n\r\nAni\r\n--' + boundary + b"--\r\n"
+        )
+        header = (b"content-type", b"multipart/form-data; boundary=" + boundary)
+        return [body[:20], body[20:]], (header,)
+
+    async def run():
+        chunks, headers = form(b"----abc123")
+        first = await _request(middleware, ANONYMOUS_KEY, chunks, headers)
+        chunks, headers = form(b"----zz9988")
+        again = await _request(middleware, ANONYMOUS_KEY, chunks, headers)
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert len(calls) == 1
+    assert again[1].get(b"idempotent-replayed") == b"true" and again[2] == first[2]
+
+
+def test_anonymous_key_must_be_long_but_token_scoped_key_may_be_short():
+    calls = []
+    middleware, _ = _middleware(_handler(calls))
+
+    async def run():
+        anonymous = await _request(middleware, b"abc", [b"{}"])
+        with_token = await _request(middleware, b"abc", [b"{}"], ((b"authorization", b"Bearer t"),))
+        return anonymous, with_token
+
+    anonymous, with_token = asyncio.run(run())
+    assert anonymous[0] == 400
+    assert with_token[0] == 201
+    assert len(calls) == 1
+
+
+def test_lease_is_renewed_while_handler_runs(monkeypatch):
+    monkeypatch.setattr(idempotency, "LEASE_RENEW_SECONDS", 0.01)
+    calls = []
+    middleware, store = _middleware(_handler(calls, delay=0.1))
+
+    status, _, _ = asyncio.run(_request(middleware, ANONYMOUS_KEY, [b"{}"]))
+    assert status == 201
+    assert store.renewals >= 3
+    renewals = store.renewals
+
+    async def settle():
+        await asyncio.sleep(0.05)
+
+    asyncio.run(settle())
+    assert store.renewals == renewals
+
+
+def test_concurrent_duplicate_waits_for_first_response():
+    calls = []
+    middleware, _ = _middleware(_handler(calls, delay=0.05))
+
+    async def run():
+        return await asyncio.gather(
+            _request(middleware, ANONYMOUS_KEY, [b"{}"]), _request(middleware, ANONYMOUS_KEY, [b"{}"])
+        )
+
+    first, second = asyncio.run(run())
+    assert len(calls) == 1
+    assert first[2] == second[2]
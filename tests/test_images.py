@@ -0,0 +1,62 @@
+import pytest
+from fastapi import HTTPException
+
+from app.modules.spop import images, storage
+from app.modules.spop.downloads import resolve_upload
+
+
+@pytest.fixture
+def upload_base(tmp_path, monkeypatch):
+    base = tmp_path / "uploads"
+    base.mkdir()
+    monkeypatch.setattr(storage, "UPLOAD_BASE", base)
+    return base
+
+
+def _jpeg(path, size=(2000, 1000)):
+    Image = pytest.importorskip("PIL.Image")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", size, "white").save(path, "JPEG")
+
+
+def test_variant_path_rejects_escaping_paths():
+    assert images.variant_path("spop/ab/cd/foto.png", "thumb") == "spop/ab/cd/foto.thumb.jpg"
+    assert images.variant_path("../../etc/x.jpg", "thumb") is None
+    assert images.variant_path("/etc/x.jpg", "review") is None
+    assert images.variant_path("spop/ktp.pdf", "thumb") is None
+
+
+def test_renditions_are_built_inside_upload_base(upload_base):
+    _jpeg(upload_base / "spop" / "foto.jpg")
+
+    images._render_variants("spop/foto.jpg", dict(images.VARIANTS))
+
+    assert (upload_base / "spop" / "foto.review.jpg").is_file()
+    assert (upload_base / "spop" / "foto.thumb.jpg").is_file()
+    assert images.existing_variant("spop/foto.jpg", "thumb") == "spop/foto.thumb.jpg"
+
+
+def test_paths_outside_upload_base_are_ignored(upload_base):
+    outside = upload_base.parent / "outside.jpg"
+    _jpeg(outside)
+    (upload_base.parent / "outside.thumb.jpg").write_bytes(b"x")
+
+    images._render_variants("../outside.jpg", dict(images.VARIANTS))
+    images.remove_renditions("../outside.jpg")
+
+    assert not (upload_base.parent / "outside.review.jpg").exists()
+    assert (upload_base.parent / "outside.thumb.jpg").exists()
+    with pytest.raises(HTTPException) as exc:
+        resolve_upload("../outside.jpg")
+    assert exc.value.status_code == 404
+
+
+def test_symlink_out_of_upload_base_is_rejected(upload_base):
+    outside = upload_base.parent / "secret"
+    outside.mkdir()
+    _jpeg(outside / "foto.jpg")
+    (upload_base / "link").symlink_to(outside)
+
+    images._render_variants("link/foto.jpg", dict(images.VARIANTS))
+
+    assert not (outside / "foto.thumb.jpg").exists()
@@ -0,0 +1,144 @@
+import asyncio
+import importlib
+from types import SimpleNamespace
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.dml import Insert
+
+from app.modules.spop import allocator
+from app.modules.spop.allocator import MAX_NO_URUT, BlokKey
+
+# `app.modules.spop.router` tertutup oleh objek APIRouter yang diekspor paketnya.
+router = importlib.import_module("app.modules.spop.router")
+
+CODES = {"kd_propinsi": "32", "kd_dati2": "04", "kd_kecamatan": "010", "kd_kelurahan": "001"}
+FULL_BLOK = BlokKey(*CODES.values(), "001")
+FREE_BLOK = BlokKey(*CODES.values(), "002")
+
+
+def _raw(blok, no_urut="", kode_khusus=""):
+    return {
+        "provinsi_op": "1",
+        "kabupaten_op": "2",
+        "kecamatan_op": "3",
+        "kelurahan_op": "4",
+        "nama_awal": "Ani",
+        "nik_awal": "3204",
+        "alamat_rumah_awal": "Jl. Raya",
+        "no_telp_awal": "08",
+        "blok_op": blok,
+        "no_urut_op": no_urut,
+        "kode_khusus": kode_khusus,
+        "nama_lengkap": "Ani",
+        "nik": "3204",
+        "status_subjek": "1",
+        "pekerjaan_subjek": "1",
+        "no_telp_subjek": "08",
+        "jalan_subjek": "Jl. Raya",
+        "blok_kav_no_subjek": "1",
+        "kelurahan_subjek": "4",
+        "kecamatan_subjek": "3",
+        "kabupaten_subjek": "2",
+        "provinsi_subjek": "1",
+        "rt_subjek": "1",
+        "rw_subjek": "2",
+        "kode_pos_subjek": "40973",
+        "jenis_tanah": "1",
+        "luas_tanah": "100",
+    }
+
+
+class FakeSession:
+    """Insert permohonan ditolak (duplicate key) bila memuat NOP di `conflicts`."""
+
+    def __init__(self, conflicts):
+        self.conflicts = set(conflicts)
+        self.stored = []
+        self.pending = []
+
+    async def execute(self, stmt, params=None):
+        if isinstance(stmt, Insert):
+            nops = [values["nop"] for values in params]
+            if self.conflicts & set(nops):
+                raise IntegrityError(str(stmt), params, Exception(1062, "Duplicate entry"))
+            self.pending.extend(nops)
+            return None
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: []))
+
+    def begin_nested(self):
+        session = self
+
+        class Savepoint:
+            async def __aenter__(self):
+                session.pending = []
+
+            async def __aexit__(self, exc_type, exc, tb):
+                if exc_type is None:
+                    session.stored.extend(session.pending)
+                return False
+
+        return Savepoint()
+
+    async def commit(self):
+        pass
+
+
+def _counter(numbers):
+    used = 0
+    for number in numbers:
+        used |= 1 << number
+    return SimpleNamespace(used_bitmap=allocator._from_bitmap(used), last_no_urut=max(numbers, default=0))
+
+
+def test_import_reports_failures_per_row(monkeypatch):
+    # Blok 001 tinggal tiga no urut bebas (0005, 9998, 9999).
+    counters = {
+        FULL_BLOK: _counter([number for number in range(1, MAX_NO_URUT - 1) if number != 5]),
+        FREE_BLOK: _counter([]),
+    }
+    forms = iter(range(1, 100))
+
+    async def lock_counter(session, key):
+        return counters[key]
+
+    async def numbers_in_use(session, key, numbers):
+        return set()
+
+    async def next_number(name):
+        return f"F{next(forms):03d}"
+
+    async def retain(session, paths):
+        pass
+
+    monkeypatch.setattr(allocator, "_lock_counter", lock_counter)
+    monkeypatch.setattr(allocator, "_numbers_in_use", numbers_in_use)
+    monkeypatch.setattr(router, "_region_codes_from_cache", lambda payload: CODES)
+    monkeypatch.setattr(router, "next_dated_number", next_number)
+    monkeypatch.setattr(router, "retain_paths", retain)
+    monkeypatch.setattr(router.audit_buffer, "record", lambda *args, **kwargs: None)
+
+    batch = [(row, _raw("001")) for row in range(2, 7)]
+    batch += [(row, _raw("002")) for row in range(7, 19)]
+    batch += [(19, _raw("002", no_urut="0100", kode_khusus="7")), (20, _raw("002", no_urut="0200"))]
+    session = FakeSession(conflicts={"32.04.010.001.002.0100.7"})
+    created, errors = [], []
+
+    asyncio.run(router._import_batch(session, batch, "u1", set(), created, errors))
+
+    assert {error.row: error.errors for error in errors} == {
+        5: ["No urut pada blok ini sudah habis"],
+        6: ["No urut pada blok ini sudah habis"],
+        19: ["Data gagal disimpan (bentrok dengan data lain)"],
+    }
+    nops = {item.row: item.nop for item in created}
+    assert [nops[row] for row in (2, 3, 4)] == [
+        "32.04.010.001.001.9998.0",
+        "32.04.010.001.001.9999.0",
+        "32.04.010.001.001.0005.0",
+    ]
+    # Lebih dari sembilan baris tanpa kode khusus pada satu blok tetap tersimpan dengan kode 0.
+    assert [nops[row] for row in range(7, 19)] == [f"32.04.010.001.002.{number:04d}.0" for number in range(201, 213)]
+    assert nops[20] == "32.04.010.001.002.0200.0"
+    assert sorted(session.stored) == sorted(nops.values())
+    # No urut baris yang gagal disimpan dikembalikan ke blok.
+    assert not allocator._to_bitmap(counters[FREE_BLOK].used_bitmap) >> 100 & 1
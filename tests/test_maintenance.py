@@ -0,0 +1,188 @@
+import asyncio
+import importlib
+import re
+
+import pytest
+from sqlalchemy.dialects import mysql
+from sqlalchemy.exc import OperationalError
+
+from app.modules.spop import maintenance
+
+# `app.modules.spop.router` tertutup oleh objek APIRouter yang diekspor paketnya.
+spop_router = importlib.import_module("app.modules.spop.router")
+
+
+class FakeResult:
+    def __init__(self, rows=()):
+        self._rows = list(rows)
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self._rows
+
+
+class FakeConnection:
+    """Cukup untuk query information_schema, GET_LOCK, dan DDL di maintenance."""
+
+    def __init__(self, columns=(), indexes=(), lock=1, fail=None, plans=None):
+        self.columns = set(columns)
+        self.indexes = set(indexes)
+        self.lock = lock
+        self.fail = fail or {}
+        self.plans = plans or {}
+        self.executed = []
+
+    async def scalar(self, stmt, params=None):
+        sql = str(stmt)
+        params = params or {}
+        if "GET_LOCK" in sql:
+            self.executed.append("GET_LOCK")
+            return self.lock
+        if "information_schema.COLUMNS" in sql:
+            return (params["table"], params["column"]) in self.columns
+        if "information_schema.STATISTICS" in sql:
+            return (params["table"], params["index"]) in self.indexes
+        return 0  # jumlah NOP ganda
+
+    async def execute(self, stmt, params=None):
+        sql = str(stmt)
+        self.executed.append(sql)
+        if sql.startswith("EXPLAIN"):
+            return FakeResult(self.plans.get("legacy" if "TRIM" in sql else "key", []))
+        for needle, code in self.fail.items():
+            if needle in sql:
+                raise OperationalError(sql, {}, Exception(code, "sudah ada"))
+        return FakeResult()
+
+
+def test_migrate_applies_missing_keys_under_lock():
+    connection = FakeConnection()
+    applied = asyncio.run(maintenance.migrate(connection))
+
+    assert applied == [
+        "spop.SUBJEK_PAJAK_KEY",
+        "dat_subjek_pajak.SUBJEK_PAJAK_KEY",
+        "spop_registration.ux_spop_registration_nop",
+    ]
+    assert connection.executed[0] == "GET_LOCK"
+    assert "RELEASE_LOCK" in connection.executed[-1]
+
+
+def test_migrate_is_noop_when_everything_exists():
+    connection = FakeConnection(
+        columns=[(key.table, key.column) for key in maintenance.JOIN_KEYS],
+        indexes=[(key.table, key.index) for key in maintenance.JOIN_KEYS]
+        + [("spop_registration", maintenance.REGISTRATION_NOP_INDEX)],
+    )
+    assert asyncio.run(maintenance.pending_migrations(connection)) == []
+    assert asyncio.run(maintenance.migrate(connection)) == []
+    assert not any("ALTER" in sql or "CREATE" in sql for sql in connection.executed)
+
+
+def test_migrate_tolerates_changes_made_by_another_process():
+    connection = FakeConnection(fail={"ALTER TABLE `spop` ": 1060, "CREATE UNIQUE INDEX": 1061})
+    applied = asyncio.run(maintenance.migrate(connection))
+    assert applied == ["dat_subjek_pajak.SUBJEK_PAJAK_KEY"]
+
+
+def test_migrate_releases_lock_on_unexpected_error():
+    connection = FakeConnection(fail={"ALTER TABLE `spop` ": 1205})
+    with pytest.raises(OperationalError):
+        asyncio.run(maintenance.migrate(connection))
+    assert "RELEASE_LOCK" in connection.executed[-1]
+
+
+def test_migrate_refuses_without_lock():
+    connection = FakeConnection(lock=0)
+    with pytest.raises(RuntimeError):
+        asyncio.run(maintenance.migrate(connection))
+    assert connection.executed == ["GET_LOCK"]
+
+
+def test_explain_report_flags_full_scan_only_for_legacy_join():
+    connection = FakeConnection(
+        plans={
+            "legacy": [
+                {"table": "s", "type": "ALL", "key": None, "rows": 1000},
+                {"table": "d", "type": "ALL", "key": None, "rows": 50000},
+            ],
+            "key": [
+                {"table": "spop", "type": "ALL", "key": None, "rows": 1000},
+                {"table": "dat_subjek_pajak", "type": "ref", "key": "ix_dat_subjek_pajak_SUBJEK_PAJAK_KEY", "rows": 1},
+            ],
+        }
+    )
+    report = {entry["query"]: entry["full_scan"] for entry in asyncio.run(maintenance.explain_report(connection))}
+    assert report == {
+        "before:legacy_join": True,
+        "after:legacy_join": False,
+        "before:subjek_lookup": True,
+        "after:subjek_lookup": False,
+    }
+
+
+class RecordingResult:
+    def scalar_one(self):
+        return 0
+
+    def scalar_one_or_none(self):
+        return "SP001"
+
+    def one_or_none(self):
+        return None
+
+    def all(self):
+        return []
+
+
+class RecordingSession:
+    """Simpan SQL (dialek MySQL) setiap statement yang dieksekusi."""
+
+    def __init__(self):
+        self.sql = []
+
+    async def execute(self, stmt, params=None):
+        self.sql.append(str(stmt.compile(dialect=mysql.dialect())).replace("`", ""))
+        return RecordingResult()
+
+
+def _assert_key_join(sql):
+    assert re.search(r"JOIN dat_subjek_pajak ON dat_subjek_pajak\.SUBJEK_PAJAK_KEY = spop\.SUBJEK_PAJAK_KEY", sql)
+    assert "TRIM(" not in sql.upper() and "SUBSTR(" not in sql.upper()
+
+
+def test_spop_queries_use_subjek_pajak_key(monkeypatch):
+    async def loaded(session):
+        return None
+
+    monkeypatch.setattr(spop_router.region_cache, "ensure_loaded", loaded)
+    keys = dict(
+        kd_propinsi="32", kd_dati2="04", kd_kecamatan="010", kd_kelurahan="001", kd_blok="001", no_urut="0001",
+        kd_jns_op="0",
+    )
+
+    session = RecordingSession()
+    assert asyncio.run(spop_router._fetch_spop_detail(session, keys)) is None
+    [detail] = session.sql
+    _assert_key_join(detail)
+
+    session = RecordingSession()
+    filters = dict.fromkeys(
+        ["kd_propinsi", "kd_dati2", "kd_kecamatan", "kd_kelurahan", "kd_blok", "kd_jns_op", "user_id", "nm_wp", "jalan_op"]
+    )
+    asyncio.run(
+        spop_router.list_spop(
+            session=session, current_user=None, nop="32.04.010.001.001.0001.0", limit=10, page=1, **filters
+        )
+    )
+    count, page = session.sql
+    _assert_key_join(count)
+    _assert_key_join(page)
+
+    session = RecordingSession()
+    asyncio.run(spop_router._ensure_subjek_exists(session, " SP001 "))
+    [lookup] = session.sql
+    assert "WHERE dat_subjek_pajak.SUBJEK_PAJAK_KEY = %s" in lookup
+    assert "TRIM(" not in lookup.upper() and "SUBSTR(" not in lookup.upper()
@@ -0,0 +1,84 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import Boolean, Date, DateTime, Numeric, inspect
+
+from app.core.responses import json_response
+from app.modules.lspop import schemas as lspop_schemas
+from app.modules.lspop.router import LAMPIRAN_LIST_ADAPTER, _to_record
+from app.modules.lspop.models import LampiranSpop
+from app.modules.spop import schemas as spop_schemas
+from app.modules.spop.models import SpopRegistration
+from app.modules.spop.router import REQUEST_LIST_ADAPTER, _registration_to_record
+
+
+def _sample(model, seed: int):
+    """Instance ORM transien dengan nilai contoh sesuai tipe tiap kolom."""
+
+    values = {}
+    for index, attr in enumerate(inspect(model).column_attrs):
+        column = attr.columns[0]
+        number = seed * 100 + index
+        if isinstance(column.type, Boolean):
+            value = bool(number % 2)
+        elif isinstance(column.type, DateTime):
+            value = datetime(2026, 1, 2, 3, 4, 5, number % 1000)
+        elif isinstance(column.type, Date):
+            value = date(2026, 1, 1 + number % 28)
+        elif isinstance(column.type, Numeric) and column.type.asdecimal:
+            value = Decimal(f"{number}.50")
+        elif column.type.python_type is int:
+            value = number
+        else:
+            value = f"{attr.key[:6]}-{number}"[: getattr(column.type, "length", None) or 64]
+        values[attr.key] = value
+    return model(**values)
+
+
+def _codes():
+    return {
+        level: {"kode_pad": code, "nama": f"{level.upper()} É"}
+        for level, code in (("provinsi", "32"), ("kabupaten", "04"), ("kecamatan", "010"), ("kelurahan", "001"))
+    }
+
+
+def _registration_page():
+    records = [
+        _registration_to_record(_sample(SpopRegistration, seed), _codes(), status_codes={"jenis_tanah": {"nama": "Tanah"}})
+        for seed in range(3)
+    ]
+    meta = spop_schemas.RequestPagination(
+        total=3, page=1, limit=10, pages=1, has_next=False, has_prev=False, next_cursor=None
+    )
+    return spop_schemas.RequestListResponse.model_construct(success=True, message="ok", data=records, meta=meta)
+
+
+def _lampiran_page():
+    lookups = {"kondisi_bangunan": {1: "Baik"}}
+    records = [_to_record(_sample(LampiranSpop, seed), lookups) for seed in range(3)]
+    meta = lspop_schemas.Pagination(total=3, page=1, limit=10, pages=1, has_next=False, has_prev=False)
+    return lspop_schemas.LampiranListResponse.model_construct(success=True, message="ok", data=records, meta=meta)
+
+
+def _response_model_body(response_model, value) -> bytes:
+    app = FastAPI()
+
+    @app.get("/", response_model=response_model)
+    async def endpoint():
+        return value
+
+    return TestClient(app).get("/").content
+
+
+def test_registration_fast_path_matches_response_model():
+    page = _registration_page()
+    fast = json_response(REQUEST_LIST_ADAPTER, page).body
+    assert fast == _response_model_body(spop_schemas.RequestListResponse, page)
+
+
+def test_lampiran_fast_path_matches_response_model():
+    page = _lampiran_page()
+    fast = json_response(LAMPIRAN_LIST_ADAPTER, page).body
+    assert fast == _response_model_body(lspop_schemas.LampiranListResponse, page)
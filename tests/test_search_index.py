@@ -0,0 +1,167 @@
+import asyncio
+import importlib
+import time
+
+from sqlalchemy.dialects import mysql
+
+from app.modules.spop import search_index
+from app.modules.spop.router import _legacy_filters, _nop_prefix_filters
+from app.modules.spop.search_index import SpopSearchIndex, _Snapshot
+
+KEY_A = ("32", "04", "010", "001", "001", "0001", "0")
+KEY_B = ("32", "04", "010", "001", "001", "0002", "0")
+KEY_C = ("32", "04", "010", "001", "001", "0003", "0")
+
+# `app.modules.spop.router` tertutup oleh objek APIRouter yang diekspor paketnya.
+router_module = importlib.import_module("app.modules.spop.router")
+
+
+class FakeSessionFactory:
+    async def __aenter__(self):
+        return object()
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _snapshot(*rows):
+    snapshot = _Snapshot()
+    for key, nm_wp, jalan_op, *subjek in rows:
+        snapshot.add(key, nm_wp, jalan_op, subjek[0] if subjek else None)
+    snapshot.sort_prefixes()
+    return snapshot
+
+
+def test_refresh_runs_in_background_and_suggest_waits_for_nothing(monkeypatch):
+    release = asyncio.Event()
+    builds = []
+
+    async def build(self, session):
+        builds.append(session)
+        await release.wait()
+        return _snapshot((KEY_A, "Budi Santoso", "Jl. Merdeka"))
+
+    monkeypatch.setattr(search_index, "AsyncSessionFactory", FakeSessionFactory)
+    monkeypatch.setattr(SpopSearchIndex, "_build", build)
+    index = SpopSearchIndex(ttl_seconds=3600, max_candidates=100)
+
+    async def run():
+        index.schedule_refresh()
+        await asyncio.sleep(0)
+        # Belum siap: pemanggil jatuh ke SQL, dan tidak ada build kedua.
+        assert index.suggest("budi", 5) is None
+        index.schedule_refresh()
+        index.upsert(KEY_B, "Budi Utomo", None, None)
+        release.set()
+        await index._task
+        assert len(builds) == 1
+        assert [doc.key for doc in index.suggest("budi", 5)] == [KEY_A, KEY_B]
+        assert [doc.key for doc in index.suggest("santoso", 5)] == [KEY_A]
+        index.schedule_refresh()
+        assert index._task.done()
+
+    asyncio.run(run())
+
+
+def test_failed_refresh_is_logged_and_retried(monkeypatch):
+    calls = []
+
+    async def build(self, session):
+        calls.append(session)
+        if len(calls) == 1:
+            raise RuntimeError("database down")
+        return _snapshot()
+
+    monkeypatch.setattr(search_index, "AsyncSessionFactory", FakeSessionFactory)
+    monkeypatch.setattr(SpopSearchIndex, "_build", build)
+    index = SpopSearchIndex(ttl_seconds=3600, max_candidates=100)
+
+    async def run():
+        index.schedule_refresh()
+        await index._task
+        assert not index.ready
+        index.schedule_refresh()
+        await index._task
+        assert index.ready
+
+    asyncio.run(run())
+
+
+def test_suggest_nop_prefix_and_removal():
+    index = SpopSearchIndex(ttl_seconds=0, max_candidates=100)
+    index._snapshot = _snapshot((KEY_A, "Budi", None), (KEY_B, "Ani", None))
+    assert [doc.key for doc in index.suggest("32.04.010.001.001-000", 10)] == [KEY_A, KEY_B]
+    index.remove(KEY_A)
+    assert [doc.key for doc in index.suggest("3204", 10)] == [KEY_B]
+
+
+def test_nop_prefix_filters_use_key_columns():
+    filters = _nop_prefix_filters("320401")
+    compiled = [
+        str(condition.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True}))
+        for condition in filters
+    ]
+    assert compiled == [
+        "spop.`KD_PROPINSI` = '32'",
+        "spop.`KD_DATI2` = '04'",
+        "spop.`KD_KECAMATAN` LIKE '01%%'",
+    ]
+
+
+def _ready_index(ttl_seconds=3600, max_candidates=100):
+    index = SpopSearchIndex(ttl_seconds=ttl_seconds, max_candidates=max_candidates)
+    index._snapshot = _snapshot(
+        (KEY_A, "Budi Santoso", "Jl. Merdeka No. 5", "3204000001"),
+        (KEY_B, "Ani Merdekawati", "Jl. Sudirman", "3204000002"),
+        (KEY_C, "José Ramos", "Gang Mawar", None),
+    )
+    index._loaded_at = time.monotonic()
+    return index
+
+
+def test_candidates_narrow_by_trigram_substring():
+    index = _ready_index()
+    # Nilai non-ASCII tidak diindeks sehingga selalu ikut jadi kandidat field itu.
+    assert index.candidates(("nm_wp",), "merdeka") == {KEY_B, KEY_C}
+    assert index.candidates(("jalan_op",), "merdeka") == {KEY_A}
+    assert index.candidates(("nm_wp",), "santos") == {KEY_A, KEY_C}
+    assert index.candidates(("jalan_op",), "zzz") == set()
+    assert index.candidates(("nop", "subjek_pajak_id", "jalan_op"), "00002") == {KEY_B}
+    index.upsert(KEY_A, "Budi Santoso", "Jl. Mawar", None)
+    assert index.candidates(("jalan_op",), "merdeka") == set()
+    index.remove(KEY_C)
+    assert index.candidates(("jalan_op",), "mawar") == {KEY_A}
+
+
+def test_candidates_fall_back_to_like_when_index_cannot_answer():
+    index = _ready_index(max_candidates=1)
+    assert index.candidates(("nm_wp",), "bu") is None
+    assert index.candidates(("nm_wp",), "b_di") is None
+    assert index.candidates(("nm_wp",), "josé") is None
+    assert index.candidates(("nm_wp",), "merdeka") is None  # 2 kandidat > batas 1
+
+    stale = _ready_index()
+    stale._loaded_at = time.monotonic() - 7200
+    assert stale.candidates(("nm_wp",), "budi") is None
+
+
+def test_legacy_filters_keep_like_next_to_candidate_keys(monkeypatch):
+    index = _ready_index()
+    monkeypatch.setattr(router_module, "spop_search_index", index)
+
+    async def build():
+        return _legacy_filters(
+            nop=None, kd_propinsi=None, kd_dati2=None, kd_kecamatan=None, kd_kelurahan=None, kd_blok=None,
+            kd_jns_op=None, user_id=None, nm_wp="santoso", jalan_op="merdeka",
+        )
+
+    monkeypatch.setattr(SpopSearchIndex, "schedule_refresh", lambda self: None)
+    filters = asyncio.run(build())
+    compiled = [
+        str(condition.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True}))
+        for condition in filters
+    ]
+    assert compiled[0] == "lower(dat_subjek_pajak.`NM_WP`) LIKE '%%santoso%%'"
+    assert compiled[1] == "lower(spop.`JALAN_OP`) LIKE '%%merdeka%%'"
+    # santoso -> {A, C}, merdeka (jalan) -> {A}: hanya A yang diperiksa MySQL.
+    assert "IN (('32', '04', '010', '001', '001', '0001', '0'))" in compiled[2]
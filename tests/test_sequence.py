@@ -0,0 +1,85 @@
+import asyncio
+import random
+from datetime import datetime
+
+from app.core import sequence
+from app.core.sequence import SequenceAllocator
+
+
+class FakeSequenceTable:
+    """Pengganti `UPDATE ... last_value = LAST_INSERT_ID(last_value + n)` yang atomik."""
+
+    def __init__(self) -> None:
+        self.last_value = {}
+        self.reservations = 0
+
+    async def reserve(self, allocator, name, count, seed):
+        # Beri kesempatan coroutine lain berjalan sebelum dan sesudah "query".
+        await asyncio.sleep(random.random() / 1000)
+        end = self.last_value.get(name, 0) + count
+        self.last_value[name] = end
+        self.reservations += 1
+        await asyncio.sleep(random.random() / 1000)
+        return end - count + 1, end
+
+
+def _patch_reserve(monkeypatch, table):
+    async def reserve(self, name, count, seed):
+        return await table.reserve(self, name, count, seed)
+
+    monkeypatch.setattr(SequenceAllocator, "_reserve", reserve)
+
+
+def test_concurrent_dated_numbers_are_unique_and_monotonic(monkeypatch):
+    table = FakeSequenceTable()
+    _patch_reserve(monkeypatch, table)
+    # Dua "worker" berbagi tabel yang sama.
+    workers = [SequenceAllocator(block_size=7), SequenceAllocator(block_size=7)]
+
+    async def run():
+        issued = {0: [], 1: []}
+
+        async def take(index):
+            monkeypatch.setattr(sequence, "form_sequence", workers[index])
+            number = await sequence.next_dated_number("spop_registration")
+            issued[index].append(number)
+
+        await asyncio.gather(*(take(i % 2) for i in range(500)))
+        return issued
+
+    issued = asyncio.run(run())
+    numbers = issued[0] + issued[1]
+    assert len(numbers) == 500
+    assert len(set(numbers)) == 500
+    for per_worker in issued.values():
+        values = [int(number.rsplit(".", 1)[1]) for number in per_worker]
+        assert values == sorted(values)
+    assert table.reservations < 500
+
+
+def test_dated_sequence_keeps_one_slot_per_name(monkeypatch):
+    table = FakeSequenceTable()
+    _patch_reserve(monkeypatch, table)
+    allocator = SequenceAllocator(block_size=5)
+    monkeypatch.setattr(sequence, "form_sequence", allocator)
+
+    days = iter(["2026-01-01", "2026-01-01", "2026-01-02", "2026-01-03"])
+
+    class FakeDatetime:
+        @staticmethod
+        def now():
+            return datetime.fromisoformat(next(days))
+
+    monkeypatch.setattr(sequence, "datetime", FakeDatetime)
+
+    async def run():
+        return [await sequence.next_dated_number("lampiran_spop") for _ in range(4)]
+
+    assert asyncio.run(run()) == [
+        "2026.01.01.000001",
+        "2026.01.01.000002",
+        "2026.01.02.000001",
+        "2026.01.03.000001",
+    ]
+    assert list(allocator._blocks) == ["lampiran_spop"]
+    assert list(allocator._locks) == ["lampiran_spop"]
@@ -0,0 +1,70 @@
+import asyncio
+import importlib
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app.modules.sppt import schemas
+from sqlite_session import sqlite_session
+
+# `app.modules.sppt.router` tertutup oleh objek APIRouter yang diekspor paketnya.
+router = importlib.import_module("app.modules.sppt.router")
+
+NOP_A = "320401000100100010"
+NOP_B = "320401000100100020"
+NOP_C = "320401000100100030"
+
+
+def _session():
+    session = sqlite_session(
+        "CREATE TABLE sppt (KD_PROPINSI TEXT, KD_DATI2 TEXT, KD_KECAMATAN TEXT, KD_KELURAHAN TEXT, KD_BLOK TEXT,"
+        " NO_URUT TEXT, KD_JNS_OP TEXT, THN_PAJAK_SPPT TEXT, LUAS_BUMI_SPPT NUMERIC, LUAS_BNG_SPPT NUMERIC,"
+        " PBB_TERHUTANG_SPPT NUMERIC, PBB_YG_HARUS_DIBAYAR_SPPT NUMERIC, STATUS_PEMBAYARAN_SPPT TEXT,"
+        " PRIMARY KEY (KD_PROPINSI, KD_DATI2, KD_KECAMATAN, KD_KELURAHAN, KD_BLOK, NO_URUT, KD_JNS_OP, THN_PAJAK_SPPT))"
+    )
+    rows = [
+        (NOP_A, "2025", 100, 1000, 900),
+        (NOP_A, "2026", 100, 1200, 1100),
+        (NOP_B, "2025", 200, 2000, 1800),
+    ]
+    for nop, year, luas, terhutang, harus_bayar in rows:
+        fields = router.parse_nop(nop)
+        session.session.execute(
+            text(
+                "INSERT INTO sppt VALUES (:kd_propinsi, :kd_dati2, :kd_kecamatan, :kd_kelurahan, :kd_blok, :no_urut,"
+                " :kd_jns_op, :year, :luas, 0, :terhutang, :harus_bayar, '0')"
+            ),
+            {**fields, "year": year, "luas": luas, "terhutang": terhutang, "harus_bayar": harus_bayar},
+        )
+    session.session.commit()
+    return session
+
+
+def _multi(nops, year=None):
+    payload = schemas.SpptMultiRequest(nops=nops, year=year)
+    response = asyncio.run(router.get_sppt_multi(payload, _session(), current_user=None))
+    return [(item.nop, item.sppt and (item.sppt.year, item.sppt.pbb_terhutang, item.sppt.pbb_harus_bayar)) for item in response.data]
+
+
+def test_latest_year_per_nop_in_request_order():
+    formatted_b = "32.04.010.001.001.0002.0"
+    assert _multi([NOP_B, NOP_C, NOP_A, formatted_b]) == [
+        (NOP_B, (2025, 2000.0, 1800.0)),
+        (NOP_C, None),
+        (NOP_A, (2026, 1200.0, 1100.0)),
+    ]
+
+
+def test_year_filter():
+    assert _multi([NOP_A, NOP_B], year=2025) == [
+        (NOP_A, (2025, 1000.0, 900.0)),
+        (NOP_B, (2025, 2000.0, 1800.0)),
+    ]
+    assert _multi([NOP_B], year=2026) == [(NOP_B, None)]
+
+
+def test_invalid_nop_is_rejected():
+    with pytest.raises(HTTPException) as exc:
+        _multi([NOP_A, "3204"])
+    assert exc.value.status_code == 400
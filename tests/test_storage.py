@@ -0,0 +1,58 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.modules.spop import storage
+
+
+def _stage(session, tmp_path, name):
+    tmp = tmp_path / ".tmp" / f".upload-{name}"
+    tmp.parent.mkdir(exist_ok=True)
+    tmp.write_bytes(name.encode())
+    target = tmp_path / "ab" / "cd" / f"{name}.jpg"
+    session.info.setdefault(storage._STAGED_KEY, []).append((tmp, target))
+    return tmp, target
+
+
+def _session():
+    return Session(create_engine("sqlite://"))
+
+
+def test_staged_upload_is_published_on_commit(tmp_path):
+    with _session() as session:
+        session.connection()
+        tmp, target = _stage(session, tmp_path, "a")
+        assert not target.exists()
+        session.commit()
+    assert target.read_bytes() == b"a"
+    assert not tmp.exists()
+
+
+def test_staged_upload_is_discarded_on_rollback(tmp_path):
+    with _session() as session:
+        session.connection()
+        tmp, target = _stage(session, tmp_path, "b")
+        session.rollback()
+    assert not tmp.exists()
+    assert not target.exists()
+
+
+def test_savepoint_rollback_keeps_outer_upload(tmp_path):
+    with _session() as session:
+        session.connection()
+        tmp, target = _stage(session, tmp_path, "c")
+        nested = session.begin_nested()
+        nested.rollback()
+        assert tmp.exists()
+        session.commit()
+    assert target.exists()
+
+
+def test_existing_blob_file_is_not_overwritten(tmp_path):
+    with _session() as session:
+        session.connection()
+        tmp, target = _stage(session, tmp_path, "d")
+        target.parent.mkdir(parents=True)
+        target.write_bytes(b"lama")
+        session.commit()
+    assert target.read_bytes() == b"lama"
+    assert not tmp.exists()
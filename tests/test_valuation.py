@@ -0,0 +1,97 @@
+import asyncio
+import random
+from decimal import Decimal
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.modules.sppt import valuation
+from app.modules.sppt.valuation import ValuationTables, pbb_terhutang, rate_to_fixed
+
+KELAS_BUMI = {1: 48_000, 2: 103_000, 3: 2_341_000}
+KELAS_BANGUNAN = {1: 68_000, 2: 1_032_000}
+TARIF = {1: Decimal("0.001"), 2: Decimal("0.002"), 3: Decimal("0.0015"), 4: 0.003, 5: Decimal("0.000125")}
+NJOPTKP = 10_000_000
+
+
+def _tables() -> ValuationTables:
+    return ValuationTables.from_mappings(KELAS_BUMI, KELAS_BANGUNAN, TARIF)
+
+
+def _scalar(luas_bumi, luas_bangunan, kelas_bumi, kelas_bangunan, tarif_id):
+    total = luas_bumi * KELAS_BUMI.get(kelas_bumi, 0) + luas_bangunan * KELAS_BANGUNAN.get(kelas_bangunan, 0)
+    return total, pbb_terhutang(total, NJOPTKP, TARIF[tarif_id])
+
+
+def test_vectorised_matches_scalar_on_random_objects():
+    rng = random.Random(20)
+    rows = [
+        (
+            rng.randint(0, 50_000),
+            rng.randint(0, 5_000),
+            rng.choice([-1, 1, 2, 3, 9]),
+            rng.choice([-1, 1, 2, 7]),
+            rng.choice(list(TARIF)),
+        )
+        for _ in range(5_000)
+    ]
+    result = _tables().value(*zip(*rows), njoptkp=NJOPTKP)
+    expected = [_scalar(*row) for row in rows]
+    assert result.total_njop.tolist() == [total for total, _ in expected]
+    assert result.pbb_terhutang.tolist() == [pbb for _, pbb in expected]
+
+
+def test_half_rupiah_rounds_up_in_both_paths():
+    # dasar x tarif = x,5 tepat; tarif float 0.003 harus dibaca sebagai "0.003".
+    base = NJOPTKP // 1000
+    luas = [base + 1, base + 333, base + 4, base + 500]
+    tarif_ids = [3, 3, 5, 4]
+    tables = ValuationTables.from_mappings({0: 1000}, {}, TARIF)
+    result = tables.value(luas, [0] * 4, [0] * 4, [-1] * 4, tarif_ids, njoptkp=NJOPTKP)
+    scalar = [pbb_terhutang(value * 1000, NJOPTKP, TARIF[tarif]) for value, tarif in zip(luas, tarif_ids)]
+    assert scalar == [2, 500, 1, 1500]
+    assert result.pbb_terhutang.tolist() == scalar
+
+
+def test_large_njop_does_not_overflow():
+    luas = np.array([10**9], dtype=np.int64)
+    result = _tables().value(luas, [0], [3], [-1], [5], njoptkp=NJOPTKP)
+    assert int(result.pbb_terhutang[0]) == pbb_terhutang(10**9 * KELAS_BUMI[3], NJOPTKP, TARIF[5])
+
+
+def test_unknown_tariff_is_rejected():
+    with pytest.raises(ValueError, match=r"\[8\]"):
+        _tables().value([1, 1], [0, 0], [1, 1], [1, 1], [1, 8], njoptkp=NJOPTKP)
+
+
+def test_rate_precision_is_bounded():
+    assert rate_to_fixed(0.003) == 3_000
+    with pytest.raises(ValueError):
+        rate_to_fixed(Decimal("0.0000001"))
+
+
+def test_pick_pbb_tarif_reads_float_rate_exactly(monkeypatch):
+    class Result:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def first(self):
+            return self.rows[0] if self.rows else None
+
+        def __iter__(self):
+            return iter(self.rows)
+
+    class Session:
+        async def execute(self, statement, params=None):
+            sql = str(statement)
+            if "WHERE id = :id" in sql:
+                return Result([(7, 0.1)])
+            if "kabupaten_kota" in sql:
+                return Result([("1 Kabupaten Badung",)])
+            return Result([SimpleNamespace(id=9, daerah="Kabupaten Badung", pbb_persen=0.3)])
+
+    monkeypatch.setattr(valuation.settings, "pbb_tarif_id", 7)
+    assert asyncio.run(valuation.pick_pbb_tarif(Session(), 5)) == (7, Decimal("0.1"))
+    monkeypatch.setattr(valuation.settings, "pbb_tarif_id", None)
+    assert asyncio.run(valuation.pick_pbb_tarif(Session(), 5)) == (9, Decimal("0.3"))